@@ -0,0 +1,142 @@
+# backup.py
+"""
+Резервные копии базы на ходу, без остановки бота.
+
+Копия снимается SQLite online backup API небольшими порциями страниц через отдельное соединение
+в отдельном потоке (asyncio.to_thread): поток БД бота и event loop не блокируются, между порциями
+делается пауза. Готовая копия проверяется PRAGMA integrity_check и только после этого получает
+итоговое имя; хранятся последние BACKUP_KEEP копий.
+
+Запуск: по расписанию (backup_loop из main.py), командой /backup для админов
+или вручную: python backup.py
+"""
+import asyncio
+import glob
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+import database
+
+BACKUP_DIR = os.environ.get("MUSIC_BOT_BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.environ.get("MUSIC_BOT_BACKUP_KEEP", "7"))
+# Интервал автоматических копий в часах; 0 — не делать по расписанию
+BACKUP_INTERVAL_HOURS = float(os.environ.get("MUSIC_BOT_BACKUP_INTERVAL_HOURS", "24"))
+BACKUP_PAGES_PER_STEP = 256  # страниц за один шаг (по 4 КБ — около 1 МБ)
+BACKUP_STEP_PAUSE = 0.005  # пауза между шагами, сек
+# Если базу меняют во время копирования, SQLite начинает копию заново; после стольких
+# перезапусков копируем остаток за один шаг (в WAL это не блокирует запись)
+BACKUP_MAX_RESTARTS = 5
+
+
+class BackupError(Exception):
+    pass
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _snapshot_prefix():
+    return os.path.splitext(os.path.basename(database.DATABASE_PATH))[0] + "-"
+
+
+def list_backups(dest_dir=None):
+    """Готовые копии (старые первыми)."""
+    dest_dir = dest_dir or BACKUP_DIR
+    return sorted(glob.glob(os.path.join(dest_dir, _snapshot_prefix() + "*.db")))
+
+
+def _copy(src, dst, pages, pause):
+    restarts = [0]
+    last_remaining = [None]
+
+    def progress(status, remaining, total):
+        if last_remaining[0] is not None and remaining > last_remaining[0]:
+            restarts[0] += 1
+            if restarts[0] > BACKUP_MAX_RESTARTS:
+                raise _Restarted()
+        last_remaining[0] = remaining
+        if pause:
+            time.sleep(pause)
+
+    try:
+        src.backup(dst, pages=pages, progress=progress)
+    except _Restarted:
+        src.backup(dst, pages=-1)
+    return restarts[0]
+
+
+def create_backup(dest_dir=None, keep=None, pages=BACKUP_PAGES_PER_STEP, pause=BACKUP_STEP_PAUSE):
+    """
+    Снимает копию DATABASE_PATH в dest_dir, проверяет её и удаляет лишние старые копии.
+    Возвращает dict: path, size, seconds, restarts, removed (удалённые старые копии).
+    При ошибке проверки — BackupError (повреждённая копия удаляется).
+    """
+    dest_dir = dest_dir or BACKUP_DIR
+    keep = BACKUP_KEEP if keep is None else keep
+    os.makedirs(dest_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-%f")
+    path = os.path.join(dest_dir, f"{_snapshot_prefix()}{stamp}.db")
+    part = path + ".part"
+    started = time.perf_counter()
+
+    src = sqlite3.connect(database.DATABASE_PATH, timeout=database.BUSY_TIMEOUT_MS / 1000)
+    dst = sqlite3.connect(part)
+    try:
+        restarts = _copy(src, dst, pages, pause)
+        result = dst.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        dst.close()
+        src.close()
+    if result != "ok":
+        os.unlink(part)
+        raise BackupError(f"integrity_check копии: {result}")
+    os.replace(part, path)
+
+    removed = []
+    snapshots = list_backups(dest_dir)
+    for old in snapshots[:max(0, len(snapshots) - keep)]:
+        os.unlink(old)
+        removed.append(old)
+    return {
+        "path": path,
+        "size": os.path.getsize(path),
+        "seconds": round(time.perf_counter() - started, 2),
+        "restarts": restarts,
+        "removed": removed,
+    }
+
+
+_running = None
+
+
+async def run_backup(**kwargs):
+    """Копия в отдельном потоке; параллельные запуски ждут друг друга."""
+    global _running
+    if _running is None:
+        _running = asyncio.Lock()
+    async with _running:
+        return await asyncio.to_thread(create_backup, **kwargs)
+
+
+async def backup_loop(interval_hours=None):
+    """Периодические копии (задача main.py); ошибки печатаются и не останавливают цикл."""
+    interval_hours = BACKUP_INTERVAL_HOURS if interval_hours is None else interval_hours
+    if interval_hours <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval_hours * 3600)
+        try:
+            info = await run_backup()
+            print(f"backup: {info['path']} ({info['size']} байт, {info['seconds']} с)")
+        except Exception as e:
+            print(f"backup error: {e}")
+
+
+if __name__ == "__main__":
+    info = create_backup()
+    print(f"Готово: {info['path']} ({info['size']} байт, {info['seconds']} с); удалено старых: {len(info['removed'])}")
+    sys.exit(0)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Сравнение реализаций репозитория (storage.py) на одной нагрузке.
+Запуск: python bench_storage.py [--ops 20000] [--users 200] [--backend sqlite|memory|all]
+
+Нагрузка — смесь, похожая на работу бота: оценки, рецензии, избранное, скачанные,
+чтение страниц списков и прогресса. SQLite-база создаётся во временном файле.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import database
+from storage import MemoryStorage, SQLiteStorage
+
+RATINGS = {"rhymes": 7, "rhythm": 6, "style": 8, "charisma": 5, "vibe": 9}
+
+
+def workload(storage, ops, users, seed=1):
+    """Выполняет ops операций; возвращает число операций в секунду."""
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    for i in range(ops):
+        user_id = rnd.randrange(users)
+        track_id = f"{rnd.randrange(users * 20)}:{rnd.randrange(1000)}"
+        op = rnd.random()
+        if op < 0.25:
+            storage.commit_rating(user_id, track_id, RATINGS, f"Track {track_id}", "Artist", f"User {user_id}")
+        elif op < 0.30:
+            storage.attach_review_text(user_id, track_id, "Текст рецензии")
+        elif op < 0.45:
+            storage.add_favorite(user_id, track_id, f"Track {track_id}", "Artist")
+        elif op < 0.50:
+            storage.add_download(user_id, track_id, f"Track {track_id}", "Artist", i, user_id)
+        elif op < 0.70:
+            page = storage.get_last_reviews(user_id, limit=10)
+            if page:
+                last = page[-1]
+                storage.get_last_reviews(user_id, limit=10, before=(last["timestamp"], last["track_id"]))
+        elif op < 0.80:
+            storage.get_favorites(user_id, limit=20)
+        elif op < 0.90:
+            storage.get_user_progress(user_id)
+        else:
+            storage.is_in_favorites(user_id, track_id)
+    return ops / (time.perf_counter() - started)
+
+
+def bench_sqlite(ops, users):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    prev = database.DATABASE_PATH
+    database.DATABASE_PATH = path
+    try:
+        return workload(SQLiteStorage(), ops, users)
+    finally:
+        database.close_connections()
+        database.DATABASE_PATH = prev
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.unlink(path + suffix)
+            except OSError:
+                pass
+
+
+def bench_memory(ops, users):
+    return workload(MemoryStorage(), ops, users)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк реализаций репозитория")
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--backend", choices=["sqlite", "memory", "all"], default="all")
+    args = parser.parse_args(argv)
+
+    backends = {"sqlite": bench_sqlite, "memory": bench_memory}
+    for name, run in backends.items():
+        if args.backend in (name, "all"):
+            print(f"{name:>7}: {run(args.ops, args.users):,.0f} оп/с ({args.ops} операций, {args.users} пользователей)")
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
@@ -0,0 +1,136 @@
+# callback_codec.py
+"""
+Компактная запись track_id в callback_data кнопок (лимит Telegram — 64 байта).
+
+Идентификаторы Яндекс.Музыки вида «трек:альбом» из чисел упаковываются прямо в кнопку:
+каждое число в base-62, между ними «.» («123456:7890» → «W7E.2Bi»). Разбор не требует
+никаких таблиц и памяти — кнопка работает и после перезапуска бота.
+
+Прочие id (нечисловые, с ведущими нулями) получают токен «~» + hash_id(track_id) и запоминаются:
+в памяти — последние FALLBACK_CACHE_SIZE, на диске — таблица callback_ids (запись пачкой через
+flush, из flush_loop в потоке БД). Таблицу ограничивает политика хранения maintenance.py:
+не дольше FALLBACK_KEEP_DAYS с последнего показа и не больше FALLBACK_MAX_ROWS строк.
+
+Токены не содержат «_», поэтому обработчики по-прежнему делят callback_data по «_».
+Старые кнопки с 10-символьным MD5-хэшем не распознаются (resolve_track вернёт None).
+"""
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from utils import hash_id
+
+ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_DIGITS = {ch: i for i, ch in enumerate(ALPHABET)}
+FALLBACK_PREFIX = "~"
+
+FALLBACK_CACHE_SIZE = 2048
+FALLBACK_KEEP_DAYS = 90
+FALLBACK_MAX_ROWS = 100_000
+FLUSH_INTERVAL = 5.0
+
+_NUMERIC_ID = re.compile(r"(0|[1-9]\d*)(?::(0|[1-9]\d*))?")
+_TOKEN = re.compile(r"([0-9A-Za-z]+)(?:\.([0-9A-Za-z]+))?")
+_LEGACY_HASH = re.compile(r"[0-9a-f]{10}")
+
+_lock = threading.Lock()
+_fallback = OrderedDict()  # токен -> track_id, недавно показанные последними
+_pending = {}  # токен -> (track_id, время показа), ещё не записанные в базу
+
+
+def b62encode(n: int) -> str:
+    if n == 0:
+        return ALPHABET[0]
+    out = []
+    while n:
+        n, r = divmod(n, 62)
+        out.append(ALPHABET[r])
+    return "".join(reversed(out))
+
+
+def b62decode(s: str) -> int:
+    n = 0
+    for ch in s:
+        n = n * 62 + _DIGITS[ch]
+    return n
+
+
+def encode_track(track_id) -> str:
+    """Токен track_id для callback_data."""
+    track_id = str(track_id)
+    m = _NUMERIC_ID.fullmatch(track_id)
+    if m:
+        token = b62encode(int(m.group(1)))
+        if m.group(2) is not None:
+            token += "." + b62encode(int(m.group(2)))
+        return token
+    token = FALLBACK_PREFIX + hash_id(track_id)
+    with _lock:
+        _fallback[token] = track_id
+        _fallback.move_to_end(token)
+        while len(_fallback) > FALLBACK_CACHE_SIZE:
+            _fallback.popitem(last=False)
+        _pending[token] = (track_id, time.time())
+    return token
+
+
+def decode_track(token: str):
+    """track_id по токену без обращения к базе; None — токен неизвестен или нужна таблица callback_ids."""
+    if token.startswith(FALLBACK_PREFIX):
+        with _lock:
+            return _fallback.get(token)
+    if _LEGACY_HASH.fullmatch(token):
+        return None
+    m = _TOKEN.fullmatch(token)
+    if not m:
+        return None
+    track_id = str(b62decode(m.group(1)))
+    if m.group(2) is not None:
+        track_id += ":" + str(b62decode(m.group(2)))
+    return track_id
+
+
+async def resolve_track(token: str):
+    """track_id по токену из callback_data (для нечисловых id — из таблицы callback_ids). None — не найден."""
+    track_id = decode_track(token)
+    if track_id is not None or not token.startswith(FALLBACK_PREFIX):
+        return track_id
+    import db_async
+    track_id = await db_async.get_callback_track(token)
+    if track_id is not None:
+        with _lock:
+            _fallback[token] = track_id
+            while len(_fallback) > FALLBACK_CACHE_SIZE:
+                _fallback.popitem(last=False)
+    return track_id
+
+
+def flush() -> int:
+    """Записывает новые токены в callback_ids (в потоке БД). Возвращает число строк."""
+    import database
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return 0
+    try:
+        database.save_callback_ids([(token, tid, at) for token, (tid, at) in pending.items()])
+    except Exception:
+        with _lock:
+            for token, value in pending.items():
+                _pending.setdefault(token, value)
+        raise
+    return len(pending)
+
+
+async def flush_loop(interval=FLUSH_INTERVAL):
+    """Периодически записывает новые токены в базу в потоке БД (задача main.py)."""
+    import db_async
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await db_async.run_db(flush)
+        except Exception as e:
+            print(f"callback_ids flush error: {e}")
@@ -8,9 +8,11 @@ import os
 import sys
 
 # Используем тот же путь, что и в database
-DATABASE_PATH = os.environ.get("MUSIC_BOT_DB", "reviews.db")
+from database import DATABASE_PATH
 
-TABLES = ["reviews", "users", "user_favorites", "user_progress", "user_downloads"]
+TABLES = ["reviews", "track_stats", "users", "user_favorites", "user_progress", "user_downloads", "tracks",
+          "track_hourly", "sessions",
+          "callback_ids"]
 
 
 def main():
@@ -28,6 +30,8 @@ def main():
         except sqlite3.OperationalError as e:
             print(f"  Пропуск {table}: {e}")
     conn.commit()
+    # VACUUM заодно переводит старую базу в режим incremental_vacuum (см. maintenance.py)
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
     cursor.execute("VACUUM")
     conn.close()
     print("Готово. База пуста, схема сохранена.")
@@ -13,4 +13,6 @@ YANDEX_MUSIC_TOKEN = os.environ.get("YANDEX_MUSIC_TOKEN", "")
 # Опционально: ID чата/канала для хранения аудио. Создай канал, добавь бота как админа,
 # перешли любое сообщение из канала боту @userinfobot или @getidsbot — получишь ID (например -1001234567890).
 # Тогда «Мои скачанные» копирует треки оттуда, а сообщение пользователю удаляется при «Назад в меню».
-STORAGE_CHAT_ID = os.environ.get("STORAGE_CHAT_ID", "").strip() or None
\ No newline at end of file
+STORAGE_CHAT_ID = os.environ.get("STORAGE_CHAT_ID", "").strip() or None
+# Telegram ID администраторов через запятую: служебные команды (/backup и т.п.)
+ADMIN_IDS = {int(x) for x in os.environ.get("ADMIN_IDS", "").replace(" ", "").split(",") if x.lstrip("-").isdigit()}
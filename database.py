@@ -1,21 +1,144 @@
 # database.py
+import atexit
 import os
+import pathlib
+import re
 import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import db_metrics
 
 DATABASE_PATH = os.environ.get("MUSIC_BOT_DB", "reviews.db")
 
+# Параметры соединений: ожидание блокировки, кэш подготовленных выражений, mmap
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+MMAP_SIZE = 256 * 1024 * 1024
 
-def _connect():
-    return sqlite3.connect(DATABASE_PATH)
+# Отложенная запись EXP/избранного/скачиваний пачками (MUSIC_BOT_WRITE_BEHIND=1)
+WRITE_BEHIND_ENABLED = os.environ.get("MUSIC_BOT_WRITE_BEHIND", "").strip() in ("1", "true", "yes")
+WRITE_BEHIND_MAX_PENDING = 500  # сброс при таком числе отложенных строк
+WRITE_BEHIND_INTERVAL = 2.0  # и не реже, чем раз в столько секунд
 
+_local = threading.local()
+_registry_lock = threading.Lock()
+_registry = []  # все открытые соединения (для close_connections)
+_generation = 0  # увеличивается при close_connections, чтобы потоки открыли новые соединения
 
-def init_db():
+
+class _MeteredCursor(sqlite3.Cursor):
+    """Курсор, пропускающий выражения через db_metrics.run_statement."""
+
+    def execute(self, sql, parameters=(), /):
+        return db_metrics.run_statement(self.connection, sql, parameters, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        return db_metrics.run_statement(self.connection, sql, None, super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, script, /):
+        return db_metrics.run_statement(self.connection, script, None, super().executescript, script)
+
+
+class _MeteredConnection(sqlite3.Connection):
     """
-    Создаёт таблицы при первом запуске
+    Соединение, сообщающее выражения в db_metrics: внутри вызова через db_async — для
+    EXPLAIN QUERY PLAN медленных вызовов, вне его (сброс отложенной записи, миграции, импорт) —
+    с замером времени каждого выражения. Все execute* идут через _MeteredCursor.
     """
-    conn = _connect()
-    cursor = conn.cursor()
 
+    def cursor(self, factory=_MeteredCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=(), /):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script, /):
+        return self.cursor().executescript(script)
+
+
+def _open_connection(path, readonly=False):
+    options = dict(
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,
+        factory=_MeteredConnection if db_metrics.ENABLED else sqlite3.Connection,
+    )
+    if readonly:
+        # Только чтение: режим журнала и схему задаёт соединение записи, здесь их не трогаем
+        conn = sqlite3.connect(pathlib.Path(path).resolve().as_uri() + "?mode=ro", uri=True, **options)
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        conn = sqlite3.connect(path, **options)
+        # Для новой базы — до создания первой страницы; существующую переводит VACUUM (db_tools enable-auto-vacuum)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    # INSERT OR REPLACE удаляет старую строку через DELETE-триггеры (нужно для track_stats)
+    conn.execute("PRAGMA recursive_triggers = ON")
+    return conn
+
+
+def set_read_only_thread():
+    """
+    Помечает текущий поток как поток чтения (инициализатор пула чтения db_async): его соединения
+    открываются в режиме mode=ro и не сбрасывают очередь write-behind.
+    """
+    _local.readonly = True
+
+
+def _connect():
+    """
+    Долгоживущее соединение текущего потока с DATABASE_PATH.
+    Соединение открывается один раз на поток и путь (WAL, busy_timeout, synchronous=NORMAL,
+    mmap, кэш выражений) и переиспользуется всеми функциями модуля. Закрывать его не нужно.
+    В потоках чтения (set_read_only_thread) соединение только для чтения.
+    """
+    if getattr(_local, "generation", None) != _generation:
+        _local.connections = {}
+        _local.generation = _generation
+    conn = _local.connections.get(DATABASE_PATH)
+    if conn is None:
+        conn = _open_connection(DATABASE_PATH, readonly=getattr(_local, "readonly", False))
+        _local.connections[DATABASE_PATH] = conn
+        with _registry_lock:
+            _registry.append(conn)
+    return conn
+
+
+def close_connections():
+    """Закрывает все открытые соединения (остановка бота, смена DATABASE_PATH в тестах)."""
+    global _generation, _rank_index, _track_index, _trending_index
+    # Кэши в памяти привязаны к базе — перечитаются при следующем обращении. Сброс под теми же
+    # блокировками, что и загрузка, чтобы не затереть индекс, который в этот момент загружается.
+    with _rank_index_lock:
+        _rank_index = None
+    with _track_index_lock:
+        _track_index = None
+        _track_index_dirty.clear()
+    with _trending_index_lock:
+        _trending_index = None
+    with _registry_lock:
+        for conn in _registry:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _registry.clear()
+        _generation += 1
+
+
+# --- Схема и миграции ---
+
+def _migrate_base_schema(cursor):
+    """v1: базовые таблицы; для старых баз без schema_version — догоняющие ALTER TABLE."""
     # Основная таблица оценок
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS reviews (
@@ -118,8 +241,644 @@ def init_db():
         )
     ''')
 
-    conn.commit()
-    conn.close()
+
+def _migrate_hot_query_indexes(cursor):
+    """v2: индексы под горячие запросы (сортировки по времени, статистика трека, лидерборд)."""
+    # get_last_reviews: WHERE user_id = ? ORDER BY timestamp DESC
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reviews_user_time ON reviews(user_id, timestamp)')
+    # get_last_reviews_global: ORDER BY timestamp DESC
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reviews_time ON reviews(timestamp)')
+    # get_track_rating_stats / get_track_reviews: WHERE track_id = ? (покрывает AVG(total) и ORDER BY total)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reviews_track_total ON reviews(track_id, total)')
+    # Последние текстовые рецензии: частичный индекс только по строкам с текстом
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reviews_with_text ON reviews(timestamp) "
+        "WHERE review_text IS NOT NULL AND review_text != ''"
+    )
+    # get_favorites / get_downloads: WHERE user_id = ? ORDER BY ... DESC
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_favorites_user_time ON user_favorites(user_id, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_downloads_user_time ON user_downloads(user_id, downloaded_at)')
+    # get_leaderboard: ORDER BY exp DESC (покрывающий: exp + user_id)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_progress_exp ON user_progress(exp, user_id)')
+
+
+_STATS_CRITERIA = ("rhymes", "rhythm", "style", "charisma", "vibe")
+
+
+def _stats_add_sql(row):
+    """UPSERT в track_stats для строки reviews (row = 'new')."""
+    crit_cols = ", ".join(f"sum_{c}" for c in _STATS_CRITERIA)
+    crit_vals = ", ".join(f"COALESCE({row}.{c}, 0)" for c in _STATS_CRITERIA)
+    crit_upd = ", ".join(f"sum_{c} = sum_{c} + excluded.sum_{c}" for c in _STATS_CRITERIA)
+    return f'''
+        INSERT INTO track_stats (track_id, track_title, track_artist, genre, cnt, sum_total, {crit_cols},
+                                 avg_total, last_rated_at)
+        VALUES ({row}.track_id, {row}.track_title, {row}.track_artist, {row}.genre, 1,
+                COALESCE({row}.total, 0), {crit_vals}, COALESCE({row}.total, 0), {row}.timestamp)
+        ON CONFLICT(track_id) DO UPDATE SET
+            track_title = COALESCE(excluded.track_title, track_title),
+            track_artist = COALESCE(excluded.track_artist, track_artist),
+            genre = COALESCE(excluded.genre, genre),
+            cnt = cnt + 1,
+            sum_total = sum_total + excluded.sum_total,
+            {crit_upd},
+            avg_total = (sum_total + excluded.sum_total) / (cnt + 1),
+            last_rated_at = COALESCE(excluded.last_rated_at, last_rated_at);
+    '''
+
+
+def _stats_remove_sql(row):
+    """Вычитание строки reviews (row = 'old') из track_stats; пустые агрегаты удаляются."""
+    crit_upd = ", ".join(f"sum_{c} = sum_{c} - COALESCE({row}.{c}, 0)" for c in _STATS_CRITERIA)
+    return f'''
+        UPDATE track_stats SET
+            cnt = cnt - 1,
+            sum_total = sum_total - COALESCE({row}.total, 0),
+            {crit_upd},
+            avg_total = CASE WHEN cnt > 1 THEN (sum_total - COALESCE({row}.total, 0)) / (cnt - 1) END,
+            last_rated_at = (SELECT MAX(timestamp) FROM reviews WHERE track_id = {row}.track_id)
+        WHERE track_id = {row}.track_id;
+        DELETE FROM track_stats WHERE track_id = {row}.track_id AND cnt <= 0;
+    '''
+
+
+def _migrate_track_stats(cursor):
+    """
+    v3: агрегаты оценок по трекам (сумма, количество, суммы по критериям, последняя оценка).
+    Поддерживаются триггерами на reviews; повторная оценка через INSERT OR REPLACE
+    проходит как DELETE + INSERT (recursive_triggers в _open_connection).
+    """
+    crit_cols = ",\n".join(f"            sum_{c} INTEGER NOT NULL DEFAULT 0" for c in _STATS_CRITERIA)
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS track_stats (
+            track_id TEXT PRIMARY KEY,
+            track_title TEXT,
+            track_artist TEXT,
+            genre TEXT,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            sum_total REAL NOT NULL DEFAULT 0,
+{crit_cols},
+            avg_total REAL,
+            last_rated_at DATETIME
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_track_stats_avg ON track_stats(avg_total)')
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS trg_reviews_stats_insert AFTER INSERT ON reviews BEGIN '
+                   f'{_stats_add_sql("new")} END')
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS trg_reviews_stats_delete AFTER DELETE ON reviews BEGIN '
+                   f'{_stats_remove_sql("old")} END')
+    cursor.execute(
+        f'CREATE TRIGGER IF NOT EXISTS trg_reviews_stats_update '
+        f'AFTER UPDATE OF track_id, total, {", ".join(_STATS_CRITERIA)} ON reviews BEGIN '
+        f'{_stats_remove_sql("old")} {_stats_add_sql("new")} END'
+    )
+    _rebuild_track_stats(cursor)
+
+
+def _rebuild_track_stats(cursor):
+    crit_cols = ", ".join(f"sum_{c}" for c in _STATS_CRITERIA)
+    crit_sums = ", ".join(f"SUM(COALESCE({c}, 0))" for c in _STATS_CRITERIA)
+    cursor.execute('DELETE FROM track_stats')
+    cursor.execute(f'''
+        INSERT INTO track_stats (track_id, track_title, track_artist, genre, cnt, sum_total, {crit_cols},
+                                 avg_total, last_rated_at)
+        SELECT track_id, MAX(track_title), MAX(track_artist), MAX(genre), COUNT(*), SUM(COALESCE(total, 0)),
+               {crit_sums}, AVG(COALESCE(total, 0)), MAX(timestamp)
+        FROM reviews
+        GROUP BY track_id
+    ''')
+
+
+def rebuild_track_stats() -> int:
+    """Пересчитывает track_stats из reviews целиком (для существующих баз). Возвращает число треков."""
+    conn = _connect()
+    with conn:
+        conn.execute('BEGIN')
+        _rebuild_track_stats(conn.cursor())
+    return conn.execute('SELECT COUNT(*) FROM track_stats').fetchone()[0]
+
+
+def _migrate_track_catalog(cursor):
+    """
+    v4: общий каталог треков (tracks). Название/исполнитель больше не копируются в каждую
+    строку reviews, user_favorites, user_downloads и users.pinned_track_*: таблицы ссылаются
+    на tracks по track_id, старые копии переносятся в каталог. Копия обнуляется, только если
+    строка соединяется с каталогом и там это поле заполнено (_drop_catalogued_copies); иначе она
+    остаётся запасным значением для чтений (COALESCE(t.title, track_title)).
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tracks (
+            track_id TEXT PRIMARY KEY,
+            title TEXT,
+            artist TEXT,
+            album_id TEXT,
+            genre TEXT,
+            cover_uri TEXT,
+            fetched_at DATETIME
+        )
+    ''')
+    album_expr = "CASE WHEN instr(track_id, ':') > 0 THEN substr(track_id, instr(track_id, ':') + 1) END"
+    for table, title_col, artist_col, genre_col in [
+        ("reviews", "track_title", "track_artist", "genre"),
+        ("user_favorites", "track_title", "track_artist", "NULL"),
+        ("user_downloads", "track_title", "track_artist", "NULL"),
+    ]:
+        cursor.execute(f'''
+            INSERT INTO tracks (track_id, title, artist, album_id, genre)
+            SELECT track_id, MAX({title_col}), MAX({artist_col}), {album_expr}, MAX({genre_col})
+            FROM {table} WHERE track_id IS NOT NULL GROUP BY track_id
+            ON CONFLICT(track_id) DO UPDATE SET
+                title = COALESCE(title, excluded.title),
+                artist = COALESCE(artist, excluded.artist),
+                genre = COALESCE(genre, excluded.genre)
+        ''')
+        _drop_catalogued_copies(cursor, table, "track_id", title_col, artist_col)
+    cursor.execute(f'''
+        INSERT INTO tracks (track_id, title, artist, album_id)
+        SELECT pinned_track_id, MAX(pinned_track_title), MAX(pinned_track_artist),
+               {album_expr.replace("track_id", "pinned_track_id")}
+        FROM users WHERE pinned_track_id IS NOT NULL GROUP BY pinned_track_id
+        ON CONFLICT(track_id) DO UPDATE SET
+            title = COALESCE(title, excluded.title),
+            artist = COALESCE(artist, excluded.artist)
+    ''')
+    _drop_catalogued_copies(cursor, "users", "pinned_track_id", "pinned_track_title", "pinned_track_artist")
+    _drop_catalogued_copies(cursor, "track_stats", "track_id", "track_title", "track_artist")
+
+
+def _drop_catalogued_copies(cursor, table, id_col, title_col, artist_col):
+    """Обнуляет копии названия/исполнителя в строках table, для которых в tracks есть это поле."""
+    for col, catalog_col in ((title_col, "title"), (artist_col, "artist")):
+        cursor.execute(f'''
+            UPDATE {table} SET {col} = NULL
+            WHERE {col} IS NOT NULL
+              AND {id_col} IN (SELECT track_id FROM tracks WHERE {catalog_col} IS NOT NULL)
+        ''')
+
+
+def _migrate_keyset_indexes(cursor):
+    """
+    v5: индексы списков пользователя дополнены track_id — ключ курсора (время, track_id)
+    целиком лежит в индексе, и страница читается диапазоном без сортировки.
+    """
+    for name, table, time_col in [
+        ("idx_reviews_user_time", "reviews", "timestamp"),
+        ("idx_favorites_user_time", "user_favorites", "created_at"),
+        ("idx_downloads_user_time", "user_downloads", "downloaded_at"),
+    ]:
+        cursor.execute(f'DROP INDEX IF EXISTS {name}')
+        cursor.execute(f'CREATE INDEX {name} ON {table}(user_id, {time_col}, track_id)')
+
+
+_FTS_TITLE = "(SELECT title FROM tracks WHERE track_id = new.track_id)"
+_FTS_ARTIST = "(SELECT artist FROM tracks WHERE track_id = new.track_id)"
+
+
+def _migrate_review_search(cursor):
+    """
+    v6: полнотекстовый индекс FTS5 по тексту рецензии, названию и исполнителю трека.
+    Строка reviews_fts связана с reviews по rowid; название/исполнитель берутся из каталога tracks.
+    Синхронизация — триггерами на reviews и tracks.
+    """
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts USING fts5(
+            review_text, title, artist,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_fts_insert AFTER INSERT ON reviews
+        BEGIN
+            INSERT INTO reviews_fts (rowid, review_text, title, artist)
+            VALUES (new.rowid, new.review_text, {_FTS_TITLE}, {_FTS_ARTIST});
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_fts_delete AFTER DELETE ON reviews
+        BEGIN
+            DELETE FROM reviews_fts WHERE rowid = old.rowid;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_fts_update AFTER UPDATE OF review_text, track_id ON reviews
+        BEGIN
+            UPDATE reviews_fts SET review_text = new.review_text, title = {_FTS_TITLE}, artist = {_FTS_ARTIST}
+            WHERE rowid = new.rowid;
+        END
+    ''')
+    # Upsert каталога при каждой оценке не должен переписывать индекс всех рецензий трека:
+    # обновление только при реальном изменении названия/исполнителя
+    for name, event in [
+        ("trg_tracks_fts_insert", "INSERT ON tracks"),
+        ("trg_tracks_fts_update", "UPDATE OF title, artist ON tracks "
+                                  "WHEN new.title IS NOT old.title OR new.artist IS NOT old.artist"),
+    ]:
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event}
+            BEGIN
+                UPDATE reviews_fts SET title = new.title, artist = new.artist
+                WHERE rowid IN (SELECT rowid FROM reviews WHERE track_id = new.track_id);
+            END
+        ''')
+    _rebuild_review_search(cursor)
+
+
+def _rebuild_review_search(cursor):
+    """Полностью пересобирает reviews_fts из reviews + tracks (rowid строк reviews меняются после VACUUM)."""
+    cursor.execute('DELETE FROM reviews_fts')
+    cursor.execute('''
+        INSERT INTO reviews_fts (rowid, review_text, title, artist)
+        SELECT r.rowid, r.review_text, COALESCE(t.title, r.track_title), COALESCE(t.artist, r.track_artist)
+        FROM reviews r LEFT JOIN tracks t ON t.track_id = r.track_id
+    ''')
+
+
+def _migrate_download_message_state(cursor):
+    """
+    v7: отметка «сообщение со скачанным треком удалено» (message_missing_at) — такие записи
+    больше не копируются и удаляются политикой хранения (maintenance.py).
+    """
+    existing = {col[1] for col in cursor.execute("PRAGMA table_info(user_downloads)").fetchall()}
+    if "message_missing_at" not in existing:
+        cursor.execute("ALTER TABLE user_downloads ADD COLUMN message_missing_at DATETIME")
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_downloads_missing ON user_downloads(message_missing_at)
+        WHERE message_missing_at IS NOT NULL
+    ''')
+
+
+def _migrate_genre_top(cursor):
+    """
+    v8: жанр в агрегатах для топа по жанру. Индекс (genre, avg_total) — страница жанра читается
+    диапазоном индекса без сортировки. Жанр берётся из оценки, иначе из каталога tracks;
+    «—» (жанр неизвестен) хранится как NULL.
+    """
+    cursor.execute("UPDATE reviews SET genre = NULL WHERE genre IN ('—', '')")
+    cursor.execute('''
+        UPDATE reviews SET genre = (SELECT t.genre FROM tracks t WHERE t.track_id = reviews.track_id)
+        WHERE genre IS NULL
+    ''')
+    cursor.execute('''
+        UPDATE track_stats SET genre = (SELECT MAX(r.genre) FROM reviews r WHERE r.track_id = track_stats.track_id)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_track_stats_genre_avg ON track_stats(genre, avg_total DESC)')
+    # Жанр, который каталог узнал позже оценки, тоже попадает в агрегат
+    for name, event in [
+        ("trg_tracks_genre_insert", "INSERT ON tracks WHEN new.genre IS NOT NULL"),
+        ("trg_tracks_genre_update", "UPDATE OF genre ON tracks WHEN new.genre IS NOT NULL"),
+    ]:
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event}
+            BEGIN
+                UPDATE track_stats SET genre = new.genre WHERE track_id = new.track_id AND genre IS NULL;
+            END
+        ''')
+
+
+_REVIEW_HOUR = "CAST(strftime('%s', {row}.timestamp) AS INTEGER) / 3600"
+
+
+def _migrate_trending(cursor):
+    """
+    v9: почасовые корзины оценок по трекам для «В тренде» (см. trending.py): число оценок и сумма
+    баллов за час. Пополняются триггером на каждую оценку; старые корзины удаляет maintenance.py.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS track_hourly (
+            hour INTEGER NOT NULL,
+            track_id TEXT NOT NULL,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            sum_total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, track_id)
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_trending AFTER INSERT ON reviews
+        BEGIN
+            INSERT INTO track_hourly (hour, track_id, cnt, sum_total)
+            VALUES ({_REVIEW_HOUR.format(row="new")}, new.track_id, 1, COALESCE(new.total, 0))
+            ON CONFLICT(hour, track_id) DO UPDATE SET
+                cnt = cnt + 1,
+                sum_total = sum_total + excluded.sum_total;
+        END
+    ''')
+    _rebuild_track_hourly(cursor)
+
+
+def _rebuild_track_hourly(cursor):
+    from trending import KEEP_HOURS
+    cursor.execute('DELETE FROM track_hourly')
+    cursor.execute(f'''
+        INSERT INTO track_hourly (hour, track_id, cnt, sum_total)
+        SELECT {_REVIEW_HOUR.format(row="reviews")} AS h, track_id, COUNT(*), SUM(COALESCE(total, 0))
+        FROM reviews
+        WHERE timestamp >= datetime('now', ?)
+        GROUP BY h, track_id
+    ''', (f'-{KEEP_HOURS} hours',))
+
+
+def _trending_remove_sql(row):
+    """Вычитает оценку row из её почасовой корзины (если корзина ещё хранится), пустую удаляет."""
+    hour = _REVIEW_HOUR.format(row=row)
+    return (
+        f'UPDATE track_hourly SET cnt = cnt - 1, sum_total = sum_total - COALESCE({row}.total, 0) '
+        f'WHERE hour = {hour} AND track_id = {row}.track_id; '
+        f'DELETE FROM track_hourly WHERE hour = {hour} AND track_id = {row}.track_id AND cnt <= 0;'
+    )
+
+
+def _migrate_trending_replace(cursor):
+    """
+    v12: повторная оценка (INSERT OR REPLACE = DELETE + INSERT) и правка оценки вычитают старую
+    строку из корзины её часа, как track_stats; корзины пересобираются без накопленных повторов.
+    """
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS trg_reviews_trending_delete AFTER DELETE ON reviews BEGIN '
+                   f'{_trending_remove_sql("old")} END')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_trending_update
+        AFTER UPDATE OF track_id, total, timestamp ON reviews
+        BEGIN
+            {_trending_remove_sql("old")}
+            INSERT INTO track_hourly (hour, track_id, cnt, sum_total)
+            VALUES ({_REVIEW_HOUR.format(row="new")}, new.track_id, 1, COALESCE(new.total, 0))
+            ON CONFLICT(hour, track_id) DO UPDATE SET
+                cnt = cnt + 1,
+                sum_total = sum_total + excluded.sum_total;
+        END
+    ''')
+    _rebuild_track_hourly(cursor)
+
+# Колонки времени строк, по которым идут курсоры страниц (utils.page_cursor): только
+# 'YYYY-MM-DD HH:MM:SS' UTC, как CURRENT_TIMESTAMP
+TIMESTAMP_COLUMNS = {"reviews": "timestamp", "user_favorites": "created_at", "user_downloads": "downloaded_at"}
+LEGACY_TIMESTAMP = "1970-01-01 00:00:00"  # для пустого или неразборчивого времени — в конец списков
+
+
+def normalize_timestamps(cursor, tables=None) -> int:
+    """
+    Приводит время строк TIMESTAMP_COLUMNS к виду CURRENT_TIMESTAMP: ISO с «T», долями секунды
+    или смещением — через datetime() (в UTC), число — как unix-время; пустое и неразборчивое —
+    LEGACY_TIMESTAMP. Возвращает число исправленных строк.
+    """
+    changed = 0
+    for table, col in TIMESTAMP_COLUMNS.items():
+        if tables is not None and table not in tables:
+            continue
+        parsed = (f"CASE WHEN typeof({col}) IN ('integer', 'real') THEN datetime({col}, 'unixepoch') "
+                  f"ELSE datetime({col}) END")
+        cursor.execute(f'''
+            UPDATE {table} SET {col} = COALESCE({parsed}, '{LEGACY_TIMESTAMP}')
+            WHERE {col} IS NULL OR {col} IS NOT COALESCE({parsed}, '')
+        ''')
+        changed += cursor.rowcount
+    return changed
+
+
+def _migrate_normalize_timestamps(cursor):
+    """
+    v13: время строк reviews, user_favorites и user_downloads в едином виде (см. normalize_timestamps),
+    иначе строка с пустым или нестандартным временем не попадает в курсор страницы.
+    """
+    normalize_timestamps(cursor)
+
+
+def _migrate_sessions(cursor):
+    """
+    v10: диалоговые сессии пользователей (см. sessions.py) — этап и данные в JSON, срок жизни.
+    Переживают перезапуск бота; истёкшие удаляет maintenance.py.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)')
+
+
+def _migrate_callback_ids(cursor):
+    """
+    v11: токены callback_data для id треков, которые не упаковываются в кнопку (см. callback_codec.py).
+    Строка заменяется при каждом показе кнопки, поэтому больший rowid — более недавний показ.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS callback_ids (
+            token TEXT PRIMARY KEY,
+            track_id TEXT NOT NULL,
+            used_at REAL NOT NULL
+        )
+    ''')
+
+
+# Упорядоченный список миграций: (версия, функция). Новые шаги добавляются только в конец.
+MIGRATIONS = [
+    (1, _migrate_base_schema),
+    (2, _migrate_hot_query_indexes),
+    (3, _migrate_track_stats),
+    (4, _migrate_track_catalog),
+    (5, _migrate_keyset_indexes),
+    (6, _migrate_review_search),
+    (7, _migrate_download_message_state),
+    (8, _migrate_genre_top),
+    (9, _migrate_trending),
+    (10, _migrate_sessions),
+    (11, _migrate_callback_ids),
+    (12, _migrate_trending_replace),
+    (13, _migrate_normalize_timestamps),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def rebuild_review_search() -> int:
+    """Пересобирает полнотекстовый индекс рецензий (после VACUUM или ручной правки данных). Возвращает число строк."""
+    conn = _connect()
+    with conn:
+        conn.execute('BEGIN')
+        _rebuild_review_search(conn.cursor())
+    return conn.execute('SELECT COUNT(*) FROM reviews_fts').fetchone()[0]
+
+
+def get_schema_version() -> int:
+    """Текущая версия схемы базы (0 — база ещё не инициализирована)."""
+    conn = _connect()
+    conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def init_db():
+    """
+    Создаёт и обновляет схему: применяет недостающие миграции по порядку,
+    каждую в своей транзакции. Если версия уже актуальна, ничего не делает.
+    """
+    current = get_schema_version()
+    if current >= SCHEMA_VERSION:
+        return
+    conn = _connect()
+    for version, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        with conn:
+            conn.execute('BEGIN')
+            migrate(conn.cursor())
+            conn.execute('DELETE FROM schema_version')
+            conn.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+
+
+# --- Каталог треков ---
+
+def _catalog_row(track: dict, fetched_at=None):
+    """Словарь трека (формат yandex_music_service) → строка tracks."""
+    track_id = track.get("id") or track.get("track_id")
+    parts = str(track_id).split(":")
+    genre = track.get("genre")
+    return (
+        track_id,
+        track.get("title") or None,
+        track.get("artist") or None,
+        parts[1] if len(parts) > 1 else None,
+        genre if genre and genre != "—" else None,
+        track.get("cover_url") or None,
+        fetched_at,
+    )
+
+
+def _upsert_tracks(conn, rows):
+    """rows — [(track_id, title, artist, album_id, genre, cover_uri, fetched_at)]; пустые поля не затирают известные."""
+    conn.executemany('''
+        INSERT INTO tracks (track_id, title, artist, album_id, genre, cover_uri, fetched_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(track_id) DO UPDATE SET
+            title = COALESCE(excluded.title, title),
+            artist = COALESCE(excluded.artist, artist),
+            album_id = COALESCE(excluded.album_id, album_id),
+            genre = COALESCE(excluded.genre, genre),
+            cover_uri = COALESCE(excluded.cover_uri, cover_uri),
+            fetched_at = COALESCE(excluded.fetched_at, fetched_at)
+    ''', rows)
+    _track_index_add(conn, rows)
+
+
+def upsert_tracks(tracks):
+    """
+    Сохраняет в каталог треки, полученные из API (словари с ключами id, title, artist,
+    cover_url, genre). Возвращает число переданных треков.
+    """
+    rows = [_catalog_row(t, _utc_now_sql()) for t in tracks if t and (t.get("id") or t.get("track_id"))]
+    if not rows:
+        return 0
+    conn = _connect()
+    with conn:
+        _upsert_tracks(conn, rows)
+    return len(rows)
+
+
+def get_catalog_track(track_id: str):
+    """
+    Трек из локального каталога в формате yandex_music_service (id, title, artist, cover_url,
+    genre, track_url) + fetched_at; None, если трека нет или о нём неизвестно название.
+    """
+    row = _connect().execute(
+        'SELECT title, artist, album_id, genre, cover_uri, fetched_at FROM tracks WHERE track_id = ?',
+        (track_id,),
+    ).fetchone()
+    if not row or not row[0]:
+        return None
+    return _catalog_track_dict(track_id, *row)
+
+
+def _catalog_track_dict(track_id, title, artist, album_id, genre, cover_uri, fetched_at):
+    tid = str(track_id).split(":")[0]
+    return {
+        "id": track_id,
+        "title": title,
+        "artist": artist or "Неизвестен",
+        "cover_url": cover_uri or "",
+        "genre": genre or "—",
+        "track_url": f"https://music.yandex.ru/album/{album_id}/track/{tid}" if album_id else None,
+        "fetched_at": fetched_at,
+    }
+
+
+# Поисковый индекс каталога в памяти (см. track_index.TrackSearchIndex).
+# Полное чтение каталога долгое (сотни тысяч треков — секунды), поэтому при запуске бота индекс
+# строится в пуле чтения (db_async.warm_track_index: build_track_index), а публикуется в потоке
+# БД (publish_track_index). Пока индекса нет, запись каталога запоминает изменённые track_id
+# (_track_index_dirty), и публикация перечитывает их — так индекс не пропустит запись,
+# сделанную во время построения.
+_track_index = None
+_track_index_path = None
+_track_index_lock = threading.Lock()
+_track_index_dirty = set()
+
+
+def _catalog_index_rows(conn, track_ids=None):
+    sql = ('SELECT track_id, title, artist, album_id, genre, cover_uri, fetched_at '
+           'FROM tracks WHERE title IS NOT NULL')
+    if track_ids is None:
+        return conn.execute(sql)
+    return (row for track_id in track_ids for row in conn.execute(sql + ' AND track_id = ?', (track_id,)))
+
+
+def build_track_index():
+    """Строит индекс каталога текущей базы (можно в потоке чтения) и возвращает его, не публикуя."""
+    from track_index import TrackSearchIndex
+    index = TrackSearchIndex()
+    for row in _catalog_index_rows(_connect()):
+        index.add(row[0], row[1], row[2], _catalog_track_dict(*row))
+    return index
+
+
+def publish_track_index(index):
+    """
+    Делает построенный индекс текущим (в потоке БД): дополняет его треками, записанными
+    во время построения. Если индекс уже есть, ничего не меняет.
+    """
+    global _track_index, _track_index_path
+    with _track_index_lock:
+        if track_index_ready():
+            return _track_index
+        conn = _connect()
+        for row in _catalog_index_rows(conn, sorted(_track_index_dirty)):
+            index.add(row[0], row[1], row[2], _catalog_track_dict(*row))
+        _track_index_dirty.clear()
+        _track_index, _track_index_path = index, DATABASE_PATH
+        return _track_index
+
+
+def _get_track_index():
+    """Индекс каталога текущей базы; без предварительного построения — строится здесь же."""
+    if track_index_ready():
+        return _track_index
+    return publish_track_index(build_track_index())
+
+
+def track_index_ready() -> bool:
+    """Индекс каталога текущей базы уже в памяти (до этого db_async.search_catalog ничего не находит)."""
+    return _track_index is not None and _track_index_path == DATABASE_PATH
+
+
+def _track_index_add(conn, rows):
+    # Пока индекс не опубликован, только запоминаем track_id — publish_track_index их перечитает.
+    # Строки upsert могут быть неполными — в индекс кладём итоговую строку каталога.
+    with _track_index_lock:
+        if not track_index_ready():
+            _track_index_dirty.update(row[0] for row in rows)
+            return
+        index = _track_index
+    for row in _catalog_index_rows(conn, [row[0] for row in rows]):
+        index.add(row[0], row[1], row[2], _catalog_track_dict(*row))
+
+
+def search_catalog(query: str, limit: int = 5):
+    """
+    Поиск по всем трекам, которые видел бот (чарт, плейлисты, поиск, оценки, избранное):
+    префиксы и нечёткое совпадение по триграммам, без запросов к API.
+    Возвращает [{"score": 0..1, "track": словарь как get_catalog_track}], лучшие первыми.
+    """
+    return [{"score": score, "track": track} for score, track in _get_track_index().search(query, limit)]
 
 
 DAILY_TRACK_TTL_SECONDS = 86400  # 24 часа
@@ -130,11 +889,7 @@ def get_cached_daily_track():
     Возвращает (track_id, updated_at) если трек дня закэширован и не старше 24 ч,
     иначе None.
     """
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('SELECT track_id, updated_at FROM daily_track WHERE id = 1')
-    row = cursor.fetchone()
-    conn.close()
+    row = _connect().execute('SELECT track_id, updated_at FROM daily_track WHERE id = 1').fetchone()
     if not row:
         return None
     track_id, updated_at = row[0], row[1]
@@ -157,16 +912,14 @@ def get_cached_daily_track():
 def set_daily_track(track_id: str):
     """Сохраняет трек дня и время обновления (UTC)."""
     from datetime import datetime, timezone
-    conn = _connect()
-    cursor = conn.cursor()
     now_utc = datetime.now(timezone.utc).isoformat()
-    cursor.execute(
-        'INSERT INTO daily_track (id, track_id, updated_at) VALUES (1, ?, ?) '
-        'ON CONFLICT(id) DO UPDATE SET track_id = ?, updated_at = ?',
-        (track_id, now_utc, track_id, now_utc),
-    )
-    conn.commit()
-    conn.close()
+    conn = _connect()
+    with conn:
+        conn.execute(
+            'INSERT INTO daily_track (id, track_id, updated_at) VALUES (1, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET track_id = ?, updated_at = ?',
+            (track_id, now_utc, track_id, now_utc),
+        )
 
 
 def save_user_nickname(user_id: int, nickname: str):
@@ -178,24 +931,18 @@ def save_user_nickname(user_id: int, nickname: str):
     nickname = nickname.strip()[:50]  # Ограничение длины
 
     conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO users (user_id, nickname)
-        VALUES (?, ?)
-    ''', (user_id, nickname))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO users (user_id, nickname)
+            VALUES (?, ?)
+        ''', (user_id, nickname))
 
 
 def get_user_nickname(user_id: int) -> str:
     """
     Возвращает сохранённый никнейм пользователя
     """
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('SELECT nickname FROM users WHERE user_id = ?', (user_id,))
-    row = cursor.fetchone()
-    conn.close()
+    row = _connect().execute('SELECT nickname FROM users WHERE user_id = ?', (user_id,)).fetchone()
     return row[0] if row else None
 
 
@@ -203,15 +950,12 @@ def get_profile(user_id: int) -> dict:
     """
     Профиль пользователя: nickname, avatar_file_id, description, pinned_track_*.
     """
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT nickname, avatar_file_id, description, pinned_track_id, pinned_track_title, pinned_track_artist '
-        'FROM users WHERE user_id = ?',
+    row = _connect().execute(
+        'SELECT u.nickname, u.avatar_file_id, u.description, u.pinned_track_id, '
+        'COALESCE(t.title, u.pinned_track_title), COALESCE(t.artist, u.pinned_track_artist) '
+        'FROM users u LEFT JOIN tracks t ON t.track_id = u.pinned_track_id WHERE u.user_id = ?',
         (user_id,),
-    )
-    row = cursor.fetchone()
-    conn.close()
+    ).fetchone()
     if not row:
         return None
     return {
@@ -226,92 +970,137 @@ def get_profile(user_id: int) -> dict:
 
 def update_profile_avatar(user_id: int, file_id: str):
     conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO users (user_id, nickname) VALUES (?, ?) ON CONFLICT(user_id) DO NOTHING',
-        (user_id, f'User_{user_id}'),
-    )
-    cursor.execute('UPDATE users SET avatar_file_id = ? WHERE user_id = ?', (file_id, user_id))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            'INSERT INTO users (user_id, nickname) VALUES (?, ?) ON CONFLICT(user_id) DO NOTHING',
+            (user_id, f'User_{user_id}'),
+        )
+        conn.execute('UPDATE users SET avatar_file_id = ? WHERE user_id = ?', (file_id, user_id))
 
 
 def update_profile_description(user_id: int, description: str):
     description = (description or '').strip()[:500]
     conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO users (user_id, nickname) VALUES (?, ?) ON CONFLICT(user_id) DO NOTHING',
-        (user_id, get_user_nickname(user_id) or f'User_{user_id}'),
-    )
-    cursor.execute('UPDATE users SET description = ? WHERE user_id = ?', (description, user_id))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            'INSERT INTO users (user_id, nickname) VALUES (?, ?) ON CONFLICT(user_id) DO NOTHING',
+            (user_id, f'User_{user_id}'),
+        )
+        conn.execute('UPDATE users SET description = ? WHERE user_id = ?', (description, user_id))
 
 
 def set_pinned_track(user_id: int, track_id: str, title: str, artist: str):
     conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute(
-        'UPDATE users SET pinned_track_id = ?, pinned_track_title = ?, pinned_track_artist = ? WHERE user_id = ?',
-        (track_id, (title or '')[:200], (artist or '')[:200], user_id),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        _upsert_tracks(conn, [_catalog_row({"id": track_id, "title": (title or '')[:200],
+                                            "artist": (artist or '')[:200]})])
+        conn.execute('UPDATE users SET pinned_track_id = ? WHERE user_id = ?', (track_id, user_id))
 
 
 def clear_pinned_track(user_id: int):
     conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute(
-        'UPDATE users SET pinned_track_id = NULL, pinned_track_title = NULL, pinned_track_artist = NULL WHERE user_id = ?',
-        (user_id,),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            'UPDATE users SET pinned_track_id = NULL, pinned_track_title = NULL, pinned_track_artist = NULL WHERE user_id = ?',
+            (user_id,),
+        )
 
 
-def save_review(user_id, track_id, ratings, track_title, track_artist, nickname, genre=None, review_text=None):
+def commit_rating(user_id, track_id, ratings, track_title, track_artist, nickname, genre=None, review_text=None):
     """
-    Сохраняет оценку трека и начисляет EXP.
+    Сохраняет оценку трека и начисляет EXP одной транзакцией на одном соединении.
+    Никнейм берётся из users (постоянный ник), иначе — переданный.
     """
+    from utils import EXP_FOR_RATING
     total = sum(ratings.values())
-
-    # Используем постоянный ник из БД, если есть; иначе — переданный
-    final_nickname = get_user_nickname(user_id) or nickname or f"Пользователь {user_id}"
+    fallback_nickname = nickname or f"Пользователь {user_id}"
+    catalog_row = _catalog_row({"id": track_id, "title": track_title, "artist": track_artist, "genre": genre})
 
     conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO reviews 
-        (user_id, track_id, rhymes, rhythm, style, charisma, vibe, total,
-         track_title, track_artist, nickname, genre, review_text)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        user_id, track_id,
-        ratings['rhymes'], ratings['rhythm'], ratings['style'],
-        ratings['charisma'], ratings['vibe'], total,
-        track_title, track_artist, final_nickname, genre, review_text
-    ))
-    conn.commit()
-    conn.close()
+    with conn:
+        _upsert_tracks(conn, [catalog_row])
+        # Прежняя оценка того же трека уходит из трендов (в track_hourly — триггером на DELETE)
+        previous = conn.execute(
+            f'SELECT total, {_REVIEW_HOUR.format(row="reviews")} FROM reviews WHERE user_id = ? AND track_id = ?',
+            (user_id, track_id),
+        ).fetchone()
+        # Жанр: из оценки, иначе из каталога (по нему строится топ по жанру в track_stats)
+        conn.execute('''
+            INSERT OR REPLACE INTO reviews
+            (user_id, track_id, rhymes, rhythm, style, charisma, vibe, total,
+             nickname, genre, review_text)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?,
+                    COALESCE((SELECT nickname FROM users WHERE user_id = ?), ?),
+                    COALESCE(?, (SELECT genre FROM tracks WHERE track_id = ?)), ?)
+        ''', (
+            user_id, track_id,
+            ratings['rhymes'], ratings['rhythm'], ratings['style'],
+            ratings['charisma'], ratings['vibe'], total,
+            user_id, fallback_nickname, catalog_row[4], track_id, review_text
+        ))
+        _write_exp(conn, [(user_id, EXP_FOR_RATING)])
+    _rank_index_add(user_id, EXP_FOR_RATING)
+    if previous:
+        _trending_remove(track_id, previous[0] or 0, previous[1])
+    _trending_add(track_id, total)
 
-    from utils import EXP_FOR_RATING
-    add_exp(user_id, EXP_FOR_RATING)
+
+def save_review(user_id, track_id, ratings, track_title, track_artist, nickname, genre=None, review_text=None):
+    """
+    Сохраняет оценку трека и начисляет EXP (см. commit_rating).
+    """
+    commit_rating(user_id, track_id, ratings, track_title, track_artist, nickname, genre, review_text)
 
 
-def get_last_reviews(user_id, limit=10):
+def attach_review_text(user_id: int, track_id: str, review_text: str) -> bool:
     """
-    Последние оценки пользователя
+    Добавляет текстовую рецензию к оценке и начисляет EXP за рецензию одной транзакцией.
+    Возвращает False (и ничего не меняет), если оценки трека у пользователя нет.
     """
+    from utils import EXP_FOR_REVIEW
     conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT track_id, track_title, track_artist, total, rhymes, rhythm, style, charisma, vibe, review_text
-        FROM reviews WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?
-    ''', (user_id, limit))
-    rows = cursor.fetchall()
-    conn.close()
+    with conn:
+        cursor = conn.execute(
+            'UPDATE reviews SET review_text = ? WHERE user_id = ? AND track_id = ?',
+            (review_text, user_id, track_id),
+        )
+        if cursor.rowcount == 0:
+            return False
+        _write_exp(conn, [(user_id, EXP_FOR_REVIEW)])
+    _rank_index_add(user_id, EXP_FOR_REVIEW)
+    return True
+
+
+def _keyset(time_col: str, key_col: str, before=None, after=None):
+    """
+    Условие и порядок для постраничного чтения по курсору (время, track_id).
+    before — строки старше курсора, after — новее (читаются по возрастанию, затем разворачиваются).
+    Возвращает (sql-условие, параметры, направление сортировки).
+    """
+    if after:
+        return f' AND ({time_col}, {key_col}) > (?, ?)', list(after), 'ASC'
+    if before:
+        return f' AND ({time_col}, {key_col}) < (?, ?)', list(before), 'DESC'
+    return '', [], 'DESC'
+
+
+def _keyset_rows(rows, after=None):
+    return rows[::-1] if after else rows
+
+
+def get_last_reviews(user_id, limit=10, before=None, after=None):
+    """
+    Последние оценки пользователя (новые первыми).
+    before/after — курсор (timestamp, track_id) соседней страницы: одна страница читается диапазоном индекса.
+    """
+    cond, params, order = _keyset('r.timestamp', 'r.track_id', before, after)
+    rows = _connect().execute(f'''
+        SELECT r.track_id, COALESCE(t.title, r.track_title), COALESCE(t.artist, r.track_artist),
+               r.total, r.rhymes, r.rhythm, r.style, r.charisma, r.vibe, r.review_text, r.timestamp
+        FROM reviews r LEFT JOIN tracks t ON t.track_id = r.track_id
+        WHERE r.user_id = ?{cond} ORDER BY r.timestamp {order}, r.track_id {order} LIMIT ?
+    ''', (user_id, *params, limit)).fetchall()
+    rows = _keyset_rows(rows, after)
 
     return [
         {
@@ -323,52 +1112,180 @@ def get_last_reviews(user_id, limit=10):
                 'rhymes': r[4], 'rhythm': r[5], 'style': r[6],
                 'charisma': r[7], 'vibe': r[8]
             },
-            'review_text': r[9]
+            'review_text': r[9],
+            'timestamp': r[10],
         }
         for r in rows
     ]
 
 
-def get_top_tracks_by_rating(limit=10):
+def get_review(user_id: int, track_id: str):
     """
-    Топ треков по среднему баллу
+    Одна оценка пользователя по треку (поиск по первичному ключу) или None.
     """
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT track_title, track_artist, AVG(total), COUNT(*)
+    r = _connect().execute('''
+        SELECT r.track_id, COALESCE(t.title, r.track_title), COALESCE(t.artist, r.track_artist),
+               r.total, r.rhymes, r.rhythm, r.style, r.charisma, r.vibe,
+               r.review_text, r.nickname, r.timestamp
+        FROM reviews r LEFT JOIN tracks t ON t.track_id = r.track_id
+        WHERE r.user_id = ? AND r.track_id = ?
+    ''', (user_id, track_id)).fetchone()
+    if not r:
+        return None
+    return {
+        'user_id': user_id,
+        'track_id': r[0],
+        'title': r[1],
+        'artist': r[2],
+        'total': r[3],
+        'ratings': {
+            'rhymes': r[4], 'rhythm': r[5], 'style': r[6],
+            'charisma': r[7], 'vibe': r[8]
+        },
+        'review_text': r[9],
+        'nickname': r[10] or f"Пользователь {user_id}",
+        'timestamp': r[11],
+    }
+
+
+def get_track_reviews(track_id: str):
+    """Все оценки трека (лучшие первыми): nickname, total, timestamp."""
+    rows = _connect().execute('''
+        SELECT nickname, total, timestamp
+        FROM reviews WHERE track_id = ? ORDER BY total DESC
+    ''', (track_id,)).fetchall()
+    return [{'nickname': r[0] or 'Аноним', 'total': r[1], 'timestamp': r[2]} for r in rows]
+
+
+def get_track_reviews_with_text(track_id: str):
+    """Текстовые рецензии по треку (лучшие первыми): nickname, text, total, timestamp."""
+    rows = _connect().execute('''
+        SELECT nickname, review_text, total, timestamp
         FROM reviews
-        GROUP BY track_id
-        HAVING COUNT(*) >= 1
-        ORDER BY AVG(total) DESC
+        WHERE track_id = ? AND review_text IS NOT NULL AND review_text != ''
+        ORDER BY total DESC
+    ''', (track_id,)).fetchall()
+    return [{'nickname': r[0] or 'Аноним', 'text': r[1], 'total': r[2], 'timestamp': r[3]} for r in rows]
+
+
+# Сколько самых свежих совпадений ранжируется bm25: при очень частых словах ранжировать
+# все совпадения по миллиону рецензий слишком дорого
+SEARCH_RANK_CANDIDATES = 1000
+
+
+def _fts_query(text: str) -> str:
+    """
+    Пользовательский ввод → запрос FTS5: каждое слово в кавычках, все слова обязательны,
+    последнее — по префиксу (недописанное слово). Спецсимволы синтаксиса FTS5 так не интерпретируются.
+    """
+    words = re.findall(r"\w+", (text or "").lower())[:8]
+    return " ".join(f'"{w}"' for w in words[:-1]) + (f' "{words[-1]}"*' if words else "")
+
+
+def search_reviews(text: str, limit: int = 10):
+    """
+    Полнотекстовый поиск по рецензиям, названиям и исполнителям оценённых треков (FTS5).
+    Лучшие совпадения первыми (bm25, совпадение в названии весит больше) среди
+    SEARCH_RANK_CANDIDATES самых свежих совпадений.
+    Возвращает [{user_id, track_id, nickname, title, artist, total, timestamp, review_text, snippet}].
+    """
+    match = _fts_query(text)
+    if not match:
+        return []
+    conn = _connect()
+    top = [rowid for (rowid,) in conn.execute('''
+        SELECT rowid FROM (
+            SELECT rowid, bm25(reviews_fts, 1.0, 2.0, 1.5) AS score
+            FROM reviews_fts WHERE reviews_fts MATCH ?
+            ORDER BY rowid DESC LIMIT ?
+        ) ORDER BY score LIMIT ?
+    ''', (match, SEARCH_RANK_CANDIDATES, limit))]
+    if not top:
+        return []
+    # Строки и snippet() лучших — одним MATCH (snippet работает только в его контексте).
+    # Диапазон rowid ограничивает просмотр FTS5 свежими кандидатами; «+» не даёт SQLite
+    # превратить IN в отдельный поиск (и повторный MATCH) на каждый rowid.
+    placeholders = ",".join("?" * len(top))
+    rows = conn.execute(f'''
+        SELECT reviews_fts.rowid, r.user_id, r.track_id, r.nickname, COALESCE(t.title, r.track_title),
+               COALESCE(t.artist, r.track_artist), r.total, r.timestamp, r.review_text,
+               snippet(reviews_fts, 0, '«', '»', '…', 12)
+        FROM reviews_fts
+        JOIN reviews r ON r.rowid = reviews_fts.rowid
+        LEFT JOIN tracks t ON t.track_id = r.track_id
+        WHERE reviews_fts MATCH ? AND reviews_fts.rowid BETWEEN ? AND ?
+          AND +reviews_fts.rowid IN ({placeholders})
+    ''', (match, min(top), max(top), *top)).fetchall()
+    by_rowid = {r[0]: r[1:] for r in rows}
+    out = []
+    for rowid in top:  # порядок bm25
+        r = by_rowid.get(rowid)
+        if not r:
+            continue
+        out.append({
+            'user_id': r[0],
+            'track_id': r[1],
+            'nickname': r[2] or 'Аноним',
+            'title': r[3],
+            'artist': r[4],
+            'total': r[5],
+            'timestamp': r[6],
+            'review_text': r[7],
+            'snippet': r[8] if r[7] else '',
+        })
+    return out
+
+
+def get_top_tracks_by_rating(limit=10, genre=None):
+    """
+    Топ треков по среднему баллу; genre — только треки этого жанра
+    (диапазон индекса (genre, avg_total): время не зависит от числа треков).
+    """
+    where, params = ('WHERE s.genre = ?', (genre,)) if genre else ('', ())
+    rows = _connect().execute(f'''
+        SELECT COALESCE(t.title, s.track_title), COALESCE(t.artist, s.track_artist), s.avg_total, s.cnt, s.track_id
+        FROM track_stats s LEFT JOIN tracks t ON t.track_id = s.track_id
+        {where}
+        ORDER BY s.avg_total DESC
         LIMIT ?
-    ''', (limit,))
-    rows = cursor.fetchall()
-    conn.close()
+    ''', (*params, limit)).fetchall()
 
     return [
         {
             'title': r[0],
             'artist': r[1],
             'avg_score': round(r[2], 1),
-            'count': r[3]
+            'count': r[3],
+            'track_id': r[4],
         }
         for r in rows
     ]
 
 
+def get_genres():
+    """
+    Жанры, у которых есть оценённые треки (по алфавиту кода). Читаются прыжками по индексу
+    (genre, avg_total): один поиск на жанр, а не просмотр всех треков.
+    """
+    rows = _connect().execute('''
+        WITH RECURSIVE g(genre) AS (
+            SELECT MIN(genre) FROM track_stats WHERE genre IS NOT NULL
+            UNION ALL
+            SELECT (SELECT MIN(genre) FROM track_stats WHERE genre > g.genre) FROM g WHERE g.genre IS NOT NULL
+        )
+        SELECT genre FROM g WHERE genre IS NOT NULL
+    ''').fetchall()
+    return [r[0] for r in rows]
+
+
 def get_track_rating_stats(track_id: str):
     """
     Средний балл и количество оценок по треку. Возвращает None, если оценок нет.
     """
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT AVG(total), COUNT(*) FROM reviews WHERE track_id = ?',
+    row = _connect().execute(
+        'SELECT avg_total, cnt FROM track_stats WHERE track_id = ?',
         (track_id,),
-    )
-    row = cursor.fetchone()
-    conn.close()
+    ).fetchone()
     if not row or row[1] == 0:
         return None
     return {'avg': round(row[0], 1), 'count': row[1]}
@@ -378,16 +1295,13 @@ def get_last_reviews_global(limit=10):
     """
     Последние оценки всех пользователей
     """
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT user_id, track_id, track_title, track_artist, total, nickname, timestamp
-        FROM reviews
-        ORDER BY timestamp DESC
+    rows = _connect().execute('''
+        SELECT r.user_id, r.track_id, COALESCE(t.title, r.track_title), COALESCE(t.artist, r.track_artist),
+               r.total, r.nickname, r.timestamp
+        FROM reviews r LEFT JOIN tracks t ON t.track_id = r.track_id
+        ORDER BY r.timestamp DESC
         LIMIT ?
-    ''', (limit,))
-    rows = cursor.fetchall()
-    conn.close()
+    ''', (limit,)).fetchall()
 
     def format_time(ts):
         try:
@@ -411,46 +1325,265 @@ def get_last_reviews_global(limit=10):
     ]
 
 
+# --- Отложенная запись (write-behind) ---
+
+def _utc_now_sql() -> str:
+    """Текущее время UTC в формате CURRENT_TIMESTAMP SQLite."""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _write_exp(conn, deltas):
+    """deltas — [(user_id, amount), ...]."""
+    conn.executemany('''
+        INSERT INTO user_progress (user_id, exp, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(user_id) DO UPDATE SET
+            exp = exp + excluded.exp,
+            updated_at = CURRENT_TIMESTAMP
+    ''', deltas)
+
+
+def _write_favorites(conn, adds, removes):
+    """
+    adds — [(user_id, track_id, title, artist, created_at)], removes — [(user_id, track_id)].
+    Название и исполнитель уходят в каталог tracks.
+    """
+    if removes:
+        conn.executemany('DELETE FROM user_favorites WHERE user_id = ? AND track_id = ?', removes)
+    if adds:
+        _upsert_tracks(conn, [_catalog_row({"id": t, "title": title, "artist": artist})
+                              for _, t, title, artist, _ in adds])
+        conn.executemany('''
+            INSERT OR REPLACE INTO user_favorites (user_id, track_id, created_at)
+            VALUES (?, ?, ?)
+        ''', [(u, t, created_at) for u, t, _, _, created_at in adds])
+
+
+def _write_downloads(conn, rows):
+    """rows — [(user_id, track_id, title, artist, downloaded_at, message_id, chat_id)]."""
+    _upsert_tracks(conn, [_catalog_row({"id": r[1], "title": r[2], "artist": r[3]}) for r in rows])
+    conn.executemany('''
+        INSERT OR REPLACE INTO user_downloads
+        (user_id, track_id, downloaded_at, message_id, chat_id)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(u, t, at, mid, cid) for u, t, _, _, at, mid, cid in rows])
+
+
+class _WriteBehindQueue:
+    """
+    Копит мелкие записи (EXP, избранное, скачивания) и пишет их одной транзакцией:
+    дельты EXP суммируются по пользователю, повторные действия с одним треком схлопываются.
+    Сброс — по размеру (WRITE_BEHIND_MAX_PENDING), по времени (WRITE_BEHIND_INTERVAL,
+    фоновый поток) и при остановке (flush_writes / atexit).
+    """
+
+    def __init__(self):
+        self.enabled = WRITE_BEHIND_ENABLED
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._exp = {}  # user_id -> сумма дельт
+        self._favorites = {}  # (user_id, track_id) -> (title, artist, created_at) | None (удаление)
+        self._downloads = {}  # (user_id, track_id) -> (title, artist, downloaded_at, message_id, chat_id)
+        self._oldest = None
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.enqueued = 0
+        self.rows_written = 0
+        self.transactions = 0
+
+    def _pending_count(self):
+        return len(self._exp) + len(self._favorites) + len(self._downloads)
+
+    def _enqueued(self):
+        """Вызывается под self._lock после добавления операции."""
+        self.enqueued += 1
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+            self._thread.start()
+        return self._pending_count() >= WRITE_BEHIND_MAX_PENDING
+
+    def add_exp(self, user_id, amount):
+        with self._lock:
+            self._exp[user_id] = self._exp.get(user_id, 0) + amount
+            full = self._enqueued()
+        if full:
+            self.flush()
+
+    def set_favorite(self, user_id, track_id, value):
+        with self._lock:
+            self._favorites[(user_id, track_id)] = value
+            full = self._enqueued()
+        if full:
+            self.flush()
+
+    def add_download(self, user_id, track_id, value):
+        with self._lock:
+            self._downloads[(user_id, track_id)] = value
+            full = self._enqueued()
+        if full:
+            self.flush()
+
+    def pending_exp(self, user_id) -> int:
+        with self._lock:
+            return self._exp.get(user_id, 0)
+
+    def pending_favorite(self, user_id, track_id):
+        """(True, value) если по треку есть отложенная операция, иначе (False, None)."""
+        with self._lock:
+            key = (user_id, track_id)
+            if key in self._favorites:
+                return True, self._favorites[key]
+            return False, None
+
+    def has_pending(self) -> bool:
+        with self._lock:
+            return self._oldest is not None
+
+    def dirty(self) -> bool:
+        """Есть отложенные записи или сброс ещё не зафиксирован."""
+        return self.has_pending() or self._flush_lock.locked()
+
+    def flush(self) -> int:
+        """Записывает всё накопленное одной транзакцией. Возвращает число записанных строк."""
+        with self._flush_lock:
+            with self._lock:
+                exp, favorites, downloads = self._exp, self._favorites, self._downloads
+                self._exp, self._favorites, self._downloads = {}, {}, {}
+                self._oldest = None
+            rows = len(exp) + len(favorites) + len(downloads)
+            if not rows:
+                return 0
+            try:
+                conn = _connect()
+                with conn:
+                    _write_exp(conn, list(exp.items()))
+                    _write_favorites(
+                        conn,
+                        [(u, t, *v) for (u, t), v in favorites.items() if v is not None],
+                        [(u, t) for (u, t), v in favorites.items() if v is None],
+                    )
+                    _write_downloads(conn, [(u, t, *v) for (u, t), v in downloads.items()])
+            except Exception:
+                # Возвращаем несохранённое в очередь (более новые операции имеют приоритет)
+                with self._lock:
+                    for user_id, delta in exp.items():
+                        self._exp[user_id] = self._exp.get(user_id, 0) + delta
+                    for key, value in favorites.items():
+                        self._favorites.setdefault(key, value)
+                    for key, value in downloads.items():
+                        self._downloads.setdefault(key, value)
+                    if self._oldest is None:
+                        self._oldest = time.monotonic()
+                raise
+            self.rows_written += rows
+            self.transactions += 1
+            return rows
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(WRITE_BEHIND_INTERVAL)
+            self._wakeup.clear()
+            with self._lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= WRITE_BEHIND_INTERVAL
+            if due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"database write-behind flush error: {e}")
+
+
+_write_behind = _WriteBehindQueue()
+
+
+def set_write_behind(enabled: bool):
+    """Включает/выключает отложенную запись; при выключении накопленное сразу записывается."""
+    if not enabled:
+        _write_behind.flush()
+    _write_behind.enabled = enabled
+
+
+def flush_writes() -> int:
+    """Принудительно записывает отложенные операции (остановка бота, перед списками)."""
+    return _write_behind.flush()
+
+
+def write_behind_stats() -> dict:
+    """Счётчики очереди: принятые операции, записанные строки, транзакции, коэффициент пакетирования."""
+    q = _write_behind
+    return {
+        'enabled': q.enabled,
+        'enqueued': q.enqueued,
+        'rows_written': q.rows_written,
+        'transactions': q.transactions,
+        'batching_ratio': round(q.enqueued / q.transactions, 2) if q.transactions else 0.0,
+    }
+
+
+def has_pending_writes() -> bool:
+    """Есть записи write-behind, ещё не видимые в базе (db_async тогда читает в потоке записи)."""
+    return _write_behind.dirty()
+
+
+def _flush_pending_for_read():
+    """
+    Списки читаются из таблиц, поэтому перед ними сбрасываем очередь (read-your-writes).
+    В потоках чтения не сбрасываем: db_async отправляет туда чтения только при пустой очереди.
+    """
+    if getattr(_local, "readonly", False):
+        return
+    if _write_behind.has_pending():
+        _write_behind.flush()
+
+
+@atexit.register
+def _flush_on_exit():
+    if _write_behind.has_pending():
+        _write_behind.flush()
+
+
 # --- Избранное ---
 
 def add_favorite(user_id: int, track_id: str, track_title: str, track_artist: str):
+    value = (track_title, track_artist, _utc_now_sql())
+    if _write_behind.enabled:
+        _write_behind.set_favorite(user_id, track_id, value)
+        return
     conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO user_favorites (user_id, track_id, track_title, track_artist)
-        VALUES (?, ?, ?, ?)
-    ''', (user_id, track_id, track_title, track_artist))
-    conn.commit()
-    conn.close()
+    with conn:
+        _write_favorites(conn, [(user_id, track_id, *value)], [])
 
 
 def remove_favorite(user_id: int, track_id: str):
+    if _write_behind.enabled:
+        _write_behind.set_favorite(user_id, track_id, None)
+        return
     conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM user_favorites WHERE user_id = ? AND track_id = ?', (user_id, track_id))
-    conn.commit()
-    conn.close()
+    with conn:
+        _write_favorites(conn, [], [(user_id, track_id)])
 
 
 def is_in_favorites(user_id: int, track_id: str) -> bool:
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('SELECT 1 FROM user_favorites WHERE user_id = ? AND track_id = ?', (user_id, track_id))
-    row = cursor.fetchone()
-    conn.close()
+    pending, value = _write_behind.pending_favorite(user_id, track_id)
+    if pending:
+        return value is not None
+    row = _connect().execute(
+        'SELECT 1 FROM user_favorites WHERE user_id = ? AND track_id = ?', (user_id, track_id)
+    ).fetchone()
     return row is not None
 
 
-def get_favorites(user_id: int, limit=50):
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT track_id, track_title, track_artist FROM user_favorites
-        WHERE user_id = ? ORDER BY created_at DESC LIMIT ?
-    ''', (user_id, limit))
-    rows = cursor.fetchall()
-    conn.close()
-    return [{'track_id': r[0], 'title': r[1], 'artist': r[2]} for r in rows]
+def get_favorites(user_id: int, limit=50, before=None, after=None):
+    """Избранное (новые первыми); before/after — курсор (created_at, track_id), см. get_last_reviews."""
+    _flush_pending_for_read()
+    cond, params, order = _keyset('f.created_at', 'f.track_id', before, after)
+    rows = _connect().execute(f'''
+        SELECT f.track_id, COALESCE(t.title, f.track_title), COALESCE(t.artist, f.track_artist), f.created_at
+        FROM user_favorites f LEFT JOIN tracks t ON t.track_id = f.track_id
+        WHERE f.user_id = ?{cond} ORDER BY f.created_at {order}, f.track_id {order} LIMIT ?
+    ''', (user_id, *params, limit)).fetchall()
+    return [{'track_id': r[0], 'title': r[1], 'artist': r[2], 'timestamp': r[3]} for r in _keyset_rows(rows, after)]
 
 
 def add_download(
@@ -462,64 +1595,112 @@ def add_download(
     chat_id: int = None,
 ):
     """Сохраняет факт скачивания трека и сообщение с аудио (для пересылки в «Мои скачанные»)."""
+    value = (track_title, track_artist, _utc_now_sql(), message_id, chat_id)
+    if _write_behind.enabled:
+        _write_behind.add_download(user_id, track_id, value)
+        return
     conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO user_downloads
-        (user_id, track_id, track_title, track_artist, downloaded_at, message_id, chat_id)
-        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?)
-    ''', (user_id, track_id, track_title, track_artist, message_id, chat_id))
-    conn.commit()
-    conn.close()
+    with conn:
+        _write_downloads(conn, [(user_id, track_id, *value)])
 
 
-def get_downloads(user_id: int, limit=50):
-    """Список скачанных треков (последние первыми); message_id/chat_id для быстрого копирования."""
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT track_id, track_title, track_artist, message_id, chat_id
-        FROM user_downloads
-        WHERE user_id = ?
-        ORDER BY downloaded_at DESC LIMIT ?
-    ''', (user_id, limit))
-    rows = cursor.fetchall()
-    conn.close()
+def get_downloads(user_id: int, limit=50, before=None, after=None):
+    """
+    Список скачанных треков (последние первыми); message_id/chat_id для быстрого копирования.
+    before/after — курсор (downloaded_at, track_id), см. get_last_reviews.
+    """
+    _flush_pending_for_read()
+    cond, params, order = _keyset('d.downloaded_at', 'd.track_id', before, after)
+    rows = _connect().execute(f'''
+        SELECT d.track_id, COALESCE(t.title, d.track_title), COALESCE(t.artist, d.track_artist),
+               d.message_id, d.chat_id, d.downloaded_at
+        FROM user_downloads d LEFT JOIN tracks t ON t.track_id = d.track_id
+        WHERE d.user_id = ?{cond}
+        ORDER BY d.downloaded_at {order}, d.track_id {order} LIMIT ?
+    ''', (user_id, *params, limit)).fetchall()
     return [
-        {'track_id': r[0], 'title': r[1], 'artist': r[2], 'message_id': r[3], 'chat_id': r[4]}
-        for r in rows
+        {'track_id': r[0], 'title': r[1], 'artist': r[2], 'message_id': r[3], 'chat_id': r[4], 'timestamp': r[5]}
+        for r in _keyset_rows(rows, after)
     ]
 
 
+def mark_download_message_missing(user_id: int, track_id: str) -> bool:
+    """
+    Сообщение со скачанным треком больше недоступно: message_id/chat_id сбрасываются,
+    время отметки сохраняется для политики хранения. Повторное скачивание снимает отметку.
+    """
+    _flush_pending_for_read()
+    conn = _connect()
+    with conn:
+        cur = conn.execute('''
+            UPDATE user_downloads SET message_id = NULL, chat_id = NULL, message_missing_at = ?
+            WHERE user_id = ? AND track_id = ? AND message_missing_at IS NULL
+        ''', (_utc_now_sql(), user_id, track_id))
+    return cur.rowcount > 0
+
+
+# --- Сессии ---
+
+def save_sessions(rows, removed=()):
+    """Записывает сессии пачкой: rows — (user_id, data_json, expires_at), removed — user_id для удаления."""
+    if not rows and not removed:
+        return
+    conn = _connect()
+    with conn:
+        if rows:
+            conn.executemany('''
+                INSERT INTO sessions (user_id, data, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+            ''', rows)
+        if removed:
+            conn.executemany('DELETE FROM sessions WHERE user_id = ?', [(uid,) for uid in removed])
+
+
+def load_sessions(now: float):
+    """Неистёкшие сессии: [(user_id, data_json, expires_at)]."""
+    return _connect().execute(
+        'SELECT user_id, data, expires_at FROM sessions WHERE expires_at > ?', (now,)
+    ).fetchall()
+
+
+# --- Токены callback_data ---
+
+def save_callback_ids(rows):
+    """rows — [(token, track_id, used_at)]; повторный показ переносит строку в конец (новый rowid)."""
+    if not rows:
+        return
+    conn = _connect()
+    with conn:
+        conn.executemany('INSERT OR REPLACE INTO callback_ids (token, track_id, used_at) VALUES (?, ?, ?)', rows)
+
+
+def get_callback_track(token: str):
+    row = _connect().execute('SELECT track_id FROM callback_ids WHERE token = ?', (token,)).fetchone()
+    return row[0] if row else None
+
+
 # --- LVL / Exp ---
 
 def add_exp(user_id: int, amount: int):
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO user_progress (user_id, exp, updated_at)
-        VALUES (?, ?, CURRENT_TIMESTAMP)
-        ON CONFLICT(user_id) DO UPDATE SET
-            exp = exp + ?,
-            updated_at = CURRENT_TIMESTAMP
-    ''', (user_id, amount, amount))
-    conn.commit()
-    conn.close()
+    if _write_behind.enabled:
+        _write_behind.add_exp(user_id, amount)
+    else:
+        conn = _connect()
+        with conn:
+            _write_exp(conn, [(user_id, amount)])
+    _rank_index_add(user_id, amount)
 
 
 def get_recent_reviews_with_text(limit=5):
     """Последние текстовые рецензии по всем пользователям (для раздела «Общая статистика»)."""
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT nickname, track_title, track_artist, review_text, total, timestamp
-        FROM reviews
-        WHERE review_text IS NOT NULL AND review_text != ''
-        ORDER BY timestamp DESC
+    rows = _connect().execute('''
+        SELECT r.nickname, COALESCE(t.title, r.track_title), COALESCE(t.artist, r.track_artist),
+               r.review_text, r.total, r.timestamp, r.user_id, r.track_id
+        FROM reviews r LEFT JOIN tracks t ON t.track_id = r.track_id
+        WHERE r.review_text IS NOT NULL AND r.review_text != ''
+        ORDER BY r.timestamp DESC
         LIMIT ?
-    ''', (limit,))
-    rows = cursor.fetchall()
-    conn.close()
+    ''', (limit,)).fetchall()
     return [
         {
             'nickname': r[0] or 'Аноним',
@@ -528,6 +1709,8 @@ def get_recent_reviews_with_text(limit=5):
             'text': r[3],
             'total': r[4],
             'timestamp': r[5],
+            'user_id': r[6],
+            'track_id': r[7],
         }
         for r in rows
     ]
@@ -535,32 +1718,207 @@ def get_recent_reviews_with_text(limit=5):
 
 def get_user_progress(user_id: int):
     """Возвращает dict с ключами exp, level. Уровень: 1 + exp // 100."""
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('SELECT exp FROM user_progress WHERE user_id = ?', (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    exp = row[0] if row else 0
+    row = _connect().execute('SELECT exp FROM user_progress WHERE user_id = ?', (user_id,)).fetchone()
+    exp = (row[0] if row else 0) + _write_behind.pending_exp(user_id)
     level = 1 + exp // 100
     return {'exp': exp, 'level': level}
 
 
-def get_leaderboard(limit: int = 20):
+# --- Сводка пользователя (один запрос для меню, статистики и профиля) ---
+
+def count_reviews(user_id: int) -> int:
+    return _connect().execute('SELECT COUNT(*) FROM reviews WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+
+def count_favorites(user_id: int) -> int:
+    _flush_pending_for_read()
+    return _connect().execute('SELECT COUNT(*) FROM user_favorites WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+
+def count_downloads(user_id: int) -> int:
+    _flush_pending_for_read()
+    return _connect().execute('SELECT COUNT(*) FROM user_downloads WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+
+def get_user_summary(user_id: int) -> dict:
     """
-    Лидерборд по EXP: user_id, nickname, exp, level.
+    Всё для экранов меню, статистики и профиля за один запрос:
+    nickname (None, если пользователь не зарегистрирован), exp, level, reviews_count,
+    favorites_count, downloads_count и поля профиля (avatar_file_id, description, pinned_track_*).
     """
-    conn = _connect()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT p.user_id, COALESCE(u.nickname, 'Пользователь ' || p.user_id), p.exp
-        FROM user_progress p
-        LEFT JOIN users u ON u.user_id = p.user_id
-        ORDER BY p.exp DESC
-        LIMIT ?
-    ''', (limit,))
-    rows = cursor.fetchall()
-    conn.close()
+    _flush_pending_for_read()
+    row = _connect().execute('''
+        SELECT u.nickname, u.avatar_file_id, u.description, u.pinned_track_id,
+               COALESCE(t.title, u.pinned_track_title), COALESCE(t.artist, u.pinned_track_artist),
+               (SELECT exp FROM user_progress WHERE user_id = q.uid),
+               (SELECT COUNT(*) FROM reviews WHERE user_id = q.uid),
+               (SELECT COUNT(*) FROM user_favorites WHERE user_id = q.uid),
+               (SELECT COUNT(*) FROM user_downloads WHERE user_id = q.uid)
+        FROM (SELECT ? AS uid) q
+        LEFT JOIN users u ON u.user_id = q.uid
+        LEFT JOIN tracks t ON t.track_id = u.pinned_track_id
+    ''', (user_id,)).fetchone()
+    exp = row[6] or 0
+    return {
+        'user_id': user_id,
+        'nickname': row[0],
+        'avatar_file_id': row[1],
+        'description': row[2] or '',
+        'pinned_track_id': row[3],
+        'pinned_track_title': row[4],
+        'pinned_track_artist': row[5],
+        'exp': exp,
+        'level': 1 + exp // 100,
+        'reviews_count': row[7],
+        'favorites_count': row[8],
+        'downloads_count': row[9],
+    }
+
+
+# --- Лидерборд (индекс мест в памяти, см. leaderboard.RankIndex) ---
+
+_rank_index = None
+_rank_index_path = None
+_rank_index_lock = threading.Lock()
+
+
+def _get_rank_index():
+    """Индекс мест для текущей базы; при первом обращении загружается из user_progress."""
+    global _rank_index, _rank_index_path
+    with _rank_index_lock:
+        if _rank_index is None or _rank_index_path != DATABASE_PATH:
+            from leaderboard import RankIndex
+            _flush_pending_for_read()
+            index = RankIndex()
+            index.load(_connect().execute('SELECT user_id, exp FROM user_progress'))
+            _rank_index, _rank_index_path = index, DATABASE_PATH
+        return _rank_index
+
+
+def rank_index_ready() -> bool:
+    """Индекс мест текущей базы уже в памяти (db_async тогда читает лидерборд в пуле чтения)."""
+    return _rank_index is not None and _rank_index_path == DATABASE_PATH
+
+
+def _rank_index_add(user_id, amount):
+    # Если индекс ещё не загружен, он прочитает актуальные данные из базы при первом обращении
+    if _rank_index is not None and _rank_index_path == DATABASE_PATH:
+        _rank_index.add(user_id, amount)
+
+
+def _leaderboard_entries(ranked):
+    """[(rank, user_id, exp)] → список dict с никнеймами (один запрос к users)."""
+    if not ranked:
+        return []
+    ids = [uid for _, uid, _ in ranked]
+    placeholders = ",".join("?" * len(ids))
+    names = dict(_connect().execute(
+        f'SELECT user_id, nickname FROM users WHERE user_id IN ({placeholders})', ids
+    ).fetchall())
     return [
-        {'user_id': r[0], 'nickname': r[1] or f'User_{r[0]}', 'exp': r[2], 'level': 1 + r[2] // 100}
-        for r in rows
-    ]
\ No newline at end of file
+        {
+            'rank': rank,
+            'user_id': uid,
+            'nickname': names.get(uid) or f'Пользователь {uid}',
+            'exp': exp,
+            'level': 1 + exp // 100,
+        }
+        for rank, uid, exp in ranked
+    ]
+
+
+def get_leaderboard(limit: int = 20, offset: int = 0):
+    """
+    Лидерборд по EXP: rank, user_id, nickname, exp, level (offset — для постраничного вывода).
+    """
+    return _leaderboard_entries(_get_rank_index().page(offset, limit))
+
+
+def get_leaderboard_size() -> int:
+    """Число пользователей в лидерборде."""
+    return len(_get_rank_index())
+
+
+def get_user_rank(user_id: int, neighbours: int = 1):
+    """
+    Место пользователя: {'rank', 'total', 'exp', 'above', 'below'} или None, если EXP ещё нет.
+    above/below — соседи по таблице (в формате get_leaderboard).
+    """
+    position = _get_rank_index().position(user_id, neighbours)
+    if position is None:
+        return None
+    rank, total, exp, above, below = position
+    return {
+        'rank': rank,
+        'total': total,
+        'exp': exp,
+        'above': _leaderboard_entries(above),
+        'below': _leaderboard_entries(below),
+    }
+
+
+# --- В тренде (почасовые корзины в памяти, см. trending.TrendingIndex) ---
+
+_trending_index = None
+_trending_index_path = None
+_trending_index_lock = threading.Lock()
+
+
+def _get_trending_index():
+    """Индекс трендов текущей базы; при первом обращении загружается из track_hourly."""
+    global _trending_index, _trending_index_path
+    with _trending_index_lock:
+        if _trending_index is None or _trending_index_path != DATABASE_PATH:
+            from trending import TrendingIndex, current_hour
+            index = TrendingIndex()
+            now_hour = current_hour()
+            index.load(_connect().execute(
+                'SELECT hour, track_id, cnt, sum_total FROM track_hourly WHERE hour > ?',
+                (now_hour - max(index.windows),),
+            ), now_hour)
+            _trending_index, _trending_index_path = index, DATABASE_PATH
+        return _trending_index
+
+
+def trending_index_ready() -> bool:
+    """Индекс трендов текущей базы уже в памяти (db_async тогда читает тренды в пуле чтения)."""
+    return _trending_index is not None and _trending_index_path == DATABASE_PATH
+
+
+def _trending_add(track_id, total):
+    # Если индекс ещё не загружен, он прочитает корзины (с этой оценкой) при первом обращении
+    if _trending_index is not None and _trending_index_path == DATABASE_PATH:
+        _trending_index.add(track_id, total)
+
+
+def _trending_remove(track_id, total, hour):
+    if _trending_index is not None and _trending_index_path == DATABASE_PATH:
+        _trending_index.remove(track_id, total, hour)
+
+
+def get_trending(hours: int = 24, limit: int = 10):
+    """
+    Треки в тренде за последние hours часов (окно из trending.WINDOWS): track_id, title, artist,
+    count (оценок в окне), avg_score (средний балл в окне). Лучшие первыми.
+    """
+    top = _get_trending_index().top(hours, limit)
+    if not top:
+        return []
+    ids = [track_id for track_id, _, _ in top]
+    placeholders = ",".join("?" * len(ids))
+    names = {
+        r[0]: (r[1], r[2])
+        for r in _connect().execute(
+            f'SELECT track_id, title, artist FROM tracks WHERE track_id IN ({placeholders})', ids
+        ).fetchall()
+    }
+    return [
+        {
+            'track_id': track_id,
+            'title': names.get(track_id, (None, None))[0] or 'Без названия',
+            'artist': names.get(track_id, (None, None))[1] or 'Неизвестен',
+            'count': cnt,
+            'avg_score': avg,
+        }
+        for track_id, cnt, avg in top
+    ]
@@ -0,0 +1,167 @@
+# db_async.py
+"""
+Асинхронный слой доступа к БД для обработчиков.
+
+Изменения выполняются в одном выделенном потоке записи (executor с одним воркером),
+поэтому sqlite3-вызовы и fsync не блокируют event loop бота. Чтения (экраны статистики,
+топов, списков) идут в пул потоков с соединениями только для чтения (mode=ro): в WAL они
+работают параллельно с записью и не задерживают сохранение оценки. Пока в очереди write-behind
+есть несохранённые записи, чтения выполняются в потоке записи (read-your-writes).
+Индексы в памяти (лидерборд, тренды, поиск по каталогу) обновляются при записи; загружаются
+они в потоке записи (индекс каталога — в пуле чтения, см. warm_track_index), а читаются
+в пуле чтения.
+Использование: `from db_async import get_user_nickname` → `await get_user_nickname(user_id)`.
+"""
+import asyncio
+import functools
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import db_metrics
+
+# Потоков чтения; 0 — все запросы в потоке записи
+READ_POOL_SIZE = int(os.environ.get("MUSIC_BOT_DB_READERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+_readers = (
+    ThreadPoolExecutor(max_workers=READ_POOL_SIZE, thread_name_prefix="db-read",
+                       initializer=database.set_read_only_thread)
+    if READ_POOL_SIZE > 0 else None
+)
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполняет синхронную функцию БД в потоке БД и возвращает результат."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _read_executor(ready=None):
+    """Пул чтения, если он есть, нет несохранённых отложенных записей и (ready) индекс в памяти загружен."""
+    if _readers is None or database.has_pending_writes() or (ready is not None and not ready()):
+        return _executor
+    return _readers
+
+
+async def run_read(func, *args, **kwargs):
+    """
+    Выполняет синхронную функцию, которая только читает базу, в пуле чтения
+    (или в потоке БД, если пула нет либо есть несохранённые отложенные записи).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor(), functools.partial(func, *args, **kwargs))
+
+
+def _wrap(func, read=False, ready=None):
+    """
+    Корутина для функции БД; вызов учитывается в db_metrics под её именем с именем вызывающего.
+    read=True — функция только читает базу и выполняется в пуле чтения.
+    ready — для чтений из индекса в памяти: пока индекс не загружен, вызов идёт в поток БД,
+    и индекс загружается там же, где его обновляют записи (без гонки загрузки с записью).
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        caller = sys._getframe(1).f_code.co_name
+        executor = _read_executor(ready) if read else _executor
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, functools.partial(db_metrics.measure, name, caller, func, *args, **kwargs)
+        )
+    return wrapper
+
+
+def shutdown():
+    """
+    Дожидается завершения поставленных в очередь операций, записывает отложенные (write-behind),
+    закрывает соединения и останавливает потоки БД.
+    """
+    if _readers is not None:
+        _readers.shutdown(wait=True)
+    _executor.shutdown(wait=True)
+    database.flush_writes()
+    database.close_connections()
+
+
+init_db = _wrap(database.init_db)
+upsert_tracks = _wrap(database.upsert_tracks)
+get_catalog_track = _wrap(database.get_catalog_track, read=True)
+get_callback_track = _wrap(database.get_callback_track, read=True)
+_search_catalog = _wrap(database.search_catalog, read=True, ready=database.track_index_ready)
+get_cached_daily_track = _wrap(database.get_cached_daily_track, read=True)
+set_daily_track = _wrap(database.set_daily_track)
+save_user_nickname = _wrap(database.save_user_nickname)
+get_user_nickname = _wrap(database.get_user_nickname, read=True)
+get_profile = _wrap(database.get_profile, read=True)
+update_profile_avatar = _wrap(database.update_profile_avatar)
+update_profile_description = _wrap(database.update_profile_description)
+set_pinned_track = _wrap(database.set_pinned_track)
+clear_pinned_track = _wrap(database.clear_pinned_track)
+commit_rating = _wrap(database.commit_rating)
+save_review = _wrap(database.save_review)
+attach_review_text = _wrap(database.attach_review_text)
+get_last_reviews = _wrap(database.get_last_reviews, read=True)
+get_review = _wrap(database.get_review, read=True)
+get_track_reviews = _wrap(database.get_track_reviews, read=True)
+get_track_reviews_with_text = _wrap(database.get_track_reviews_with_text, read=True)
+search_reviews = _wrap(database.search_reviews, read=True)
+get_top_tracks_by_rating = _wrap(database.get_top_tracks_by_rating, read=True)
+get_genres = _wrap(database.get_genres, read=True)
+get_track_rating_stats = _wrap(database.get_track_rating_stats, read=True)
+get_last_reviews_global = _wrap(database.get_last_reviews_global, read=True)
+add_favorite = _wrap(database.add_favorite)
+remove_favorite = _wrap(database.remove_favorite)
+is_in_favorites = _wrap(database.is_in_favorites, read=True)
+get_favorites = _wrap(database.get_favorites, read=True)
+add_download = _wrap(database.add_download)
+get_downloads = _wrap(database.get_downloads, read=True)
+mark_download_message_missing = _wrap(database.mark_download_message_missing)
+add_exp = _wrap(database.add_exp)
+get_recent_reviews_with_text = _wrap(database.get_recent_reviews_with_text, read=True)
+get_user_progress = _wrap(database.get_user_progress, read=True)
+count_reviews = _wrap(database.count_reviews, read=True)
+count_favorites = _wrap(database.count_favorites, read=True)
+count_downloads = _wrap(database.count_downloads, read=True)
+get_user_summary = _wrap(database.get_user_summary, read=True)
+get_leaderboard = _wrap(database.get_leaderboard, read=True, ready=database.rank_index_ready)
+get_leaderboard_size = _wrap(database.get_leaderboard_size, read=True, ready=database.rank_index_ready)
+get_user_rank = _wrap(database.get_user_rank, read=True, ready=database.rank_index_ready)
+get_trending = _wrap(database.get_trending, read=True, ready=database.trending_index_ready)
+flush_writes = _wrap(database.flush_writes)
+write_behind_stats = _wrap(database.write_behind_stats)
+
+
+_track_index_warmup = None
+
+
+async def _load_track_index():
+    try:
+        index = await run_read(database.build_track_index)
+        await run_db(database.publish_track_index, index)
+    except Exception as e:
+        print(f"track index warmup error: {e}")
+
+
+def warm_track_index():
+    """
+    Запускает (один раз) построение индекса каталога: чтение в пуле чтения, публикация
+    в потоке БД — очередь записи не ждёт полного чтения каталога. Возвращает задачу.
+    """
+    global _track_index_warmup
+    if _track_index_warmup is None or _track_index_warmup.done():
+        _track_index_warmup = asyncio.get_running_loop().create_task(_load_track_index())
+    return _track_index_warmup
+
+
+async def search_catalog(query, limit=5):
+    """
+    database.search_catalog; пока индекс каталога строится (после запуска), возвращает []
+    и запускает построение, если оно ещё не идёт, — обработчик тогда ищет через API.
+    """
+    if not database.track_index_ready():
+        warm_track_index()
+        return []
+    return await _search_catalog(query, limit=limit)
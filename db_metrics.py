@@ -0,0 +1,229 @@
+# db_metrics.py
+"""
+Метрики запросов к базе: время, число строк и вызывающий обработчик для каждого вызова
+функции database.py через db_async.
+
+- По каждой функции — гистограмма задержек (границы LATENCY_BUCKETS_MS), число вызовов,
+  суммарное время и строки; snapshot() для /dbstats, prometheus_text() — в формате Prometheus.
+- Вызов дольше SLOW_QUERY_MS попадает в журнал медленных (печать + последние SLOW_LOG_SIZE
+  записей в памяти) вместе с SQL-выражениями этого вызова и их EXPLAIN QUERY PLAN:
+  полный просмотр таблицы (SCAN без индекса) и сортировка во временном B-дереве отмечаются.
+
+Выражения вне вызовов через db_async (сброс отложенной записи, миграции, импорт каталога)
+учитываются по одному под именем «sql:<функция>» — функцией, выполнившей execute/executemany/
+executescript; для SELECT это время до первой строки, чтение остальных не входит.
+
+Накладные расходы: два perf_counter и обновление счётчиков на вызов, плюс запись
+выражения в список при execute. План строится только для медленных вызовов и кэшируется.
+Выключается переменной окружения MUSIC_BOT_DB_METRICS=0.
+"""
+import bisect
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+ENABLED = os.environ.get("MUSIC_BOT_DB_METRICS", "1").strip() not in ("0", "false", "no")
+SLOW_QUERY_MS = float(os.environ.get("MUSIC_BOT_SLOW_QUERY_MS", "100"))
+SLOW_LOG_SIZE = 50
+PLAN_CACHE_SIZE = 256
+LATENCY_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+_FULL_SCAN = re.compile(r"^SCAN \w+$|USE TEMP B-TREE")
+_SQL_METHODS = ("execute", "executemany", "executescript", "run_statement")
+
+_lock = threading.Lock()
+_stats = {}  # имя функции -> _Histogram
+_slow_log = deque(maxlen=SLOW_LOG_SIZE)
+_plans = {}  # SQL -> [строки плана]
+_local = threading.local()
+
+
+class _Histogram:
+    __slots__ = ("buckets", "count", "total_ms", "max_ms", "rows")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)  # последняя — больше всех границ
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+
+    def add(self, ms, rows):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.rows += rows
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def quantile(self, q):
+        """Верхняя граница корзины, в которую попадает квантиль q (оценка сверху)."""
+        if not self.count:
+            return 0.0
+        need = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= need:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+
+def _row_count(result):
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1
+
+
+def run_statement(conn, sql, params, run, /, *args):
+    """
+    Вызывается курсором database.py: run(*args) выполняет выражение sql.
+    Внутри measure() выражение запоминается для журнала медленных, иначе замеряется само.
+    params=None — параметров несколько наборов (executemany) или это скрипт.
+    """
+    statements = getattr(_local, "statements", None)
+    if statements is not None:
+        statements.append((conn, sql, params))
+        return run(*args)
+    started = time.perf_counter()
+    cursor = None
+    try:
+        cursor = run(*args)
+        return cursor
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        name = "sql:" + _statement_owner()
+        with _lock:
+            hist = _stats.get(name)
+            if hist is None:
+                hist = _stats[name] = _Histogram()
+            hist.add(ms, max(getattr(cursor, "rowcount", 0), 0))
+        if ms >= SLOW_QUERY_MS:
+            _log_slow(name, None, ms, [(conn, sql, params)])
+
+
+def _statement_owner():
+    """Имя функции, выполнившей выражение (первый кадр выше методов курсора и соединения)."""
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_name in _SQL_METHODS:
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else "?"
+
+
+def measure(name, caller, func, /, *args, **kwargs):
+    """Выполняет func(*args, **kwargs) (в потоке БД) и учитывает время вызова под именем name."""
+    if not ENABLED:
+        return func(*args, **kwargs)
+    _local.statements = []
+    started = time.perf_counter()
+    result = None
+    try:
+        result = func(*args, **kwargs)
+        return result
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        statements, _local.statements = _local.statements, None
+        with _lock:
+            hist = _stats.get(name)
+            if hist is None:
+                hist = _stats[name] = _Histogram()
+            hist.add(ms, _row_count(result))
+        if ms >= SLOW_QUERY_MS:
+            _log_slow(name, caller, ms, statements)
+
+
+def _explain(conn, sql, params):
+    plan = _plans.get(sql)
+    if plan is None:
+        if params is None:
+            params = [None] * sql.count("?")  # план от значений не зависит
+        try:
+            # Мимо курсора с замером, чтобы EXPLAIN не попадал в метрики
+            rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            plan = [row[3] for row in rows]
+        except Exception as e:
+            plan = [f"(план недоступен: {e})"]
+        if len(_plans) >= PLAN_CACHE_SIZE:
+            _plans.clear()
+        _plans[sql] = plan
+    return plan
+
+
+def _log_slow(name, caller, ms, statements):
+    queries = []
+    for conn, sql, params in statements:
+        if not sql.lstrip().upper().startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")):
+            continue
+        plan = _explain(conn, sql, params)
+        queries.append({
+            "sql": " ".join(sql.split()),
+            "plan": plan,
+            "full_scan": any(_FULL_SCAN.search(step) for step in plan),
+        })
+    entry = {"function": name, "caller": caller, "ms": round(ms, 1), "at": time.time(), "queries": queries}
+    with _lock:
+        _slow_log.append(entry)
+    scans = sum(q["full_scan"] for q in queries)
+    print(f"slow query: {name} ({caller or '?'}) {ms:.1f} мс, выражений {len(queries)}"
+          f"{f', полный просмотр/сортировка: {scans}' if scans else ''}")
+    for q in queries:
+        if q["full_scan"]:
+            print(f"  {q['sql'][:200]}\n    " + "\n    ".join(q["plan"]))
+
+
+def snapshot():
+    """{функция: {count, total_ms, avg_ms, p50_ms, p95_ms, p99_ms, max_ms, rows}} — по убыванию суммарного времени."""
+    with _lock:
+        items = sorted(_stats.items(), key=lambda kv: -kv[1].total_ms)
+        return {
+            name: {
+                "count": h.count,
+                "total_ms": round(h.total_ms, 1),
+                "avg_ms": round(h.total_ms / h.count, 2) if h.count else 0.0,
+                "p50_ms": h.quantile(0.5),
+                "p95_ms": h.quantile(0.95),
+                "p99_ms": h.quantile(0.99),
+                "max_ms": round(h.max_ms, 1),
+                "rows": h.rows,
+            }
+            for name, h in items
+        }
+
+
+def slow_queries(limit=10):
+    """Последние медленные вызовы (новые первыми)."""
+    with _lock:
+        return list(_slow_log)[::-1][:limit]
+
+
+def prometheus_text():
+    """Гистограммы задержек в текстовом формате Prometheus (секунды)."""
+    lines = [
+        "# HELP music_bot_db_call_seconds Время вызова функции database.py",
+        "# TYPE music_bot_db_call_seconds histogram",
+    ]
+    with _lock:
+        for name, h in sorted(_stats.items()):
+            seen = 0
+            for bound, n in zip(LATENCY_BUCKETS_MS + ["+Inf"], h.buckets):
+                seen += n
+                le = bound if bound == "+Inf" else f"{bound / 1000:g}"
+                lines.append(f'music_bot_db_call_seconds_bucket{{function="{name}",le="{le}"}} {seen}')
+            lines.append(f'music_bot_db_call_seconds_sum{{function="{name}"}} {h.total_ms / 1000:.6f}')
+            lines.append(f'music_bot_db_call_seconds_count{{function="{name}"}} {h.count}')
+            lines.append(f'music_bot_db_call_rows_total{{function="{name}"}} {h.rows}')
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Сбрасывает накопленные метрики и журнал (тесты, /dbstats reset)."""
+    with _lock:
+        _stats.clear()
+        _slow_log.clear()
+        _plans.clear()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Служебные операции с базой бота.
+Запуск: python db_tools.py <команда>
+
+Команды:
+  rebuild-stats  — пересчитать агрегаты оценок по трекам (track_stats) из reviews
+  rebuild-search — пересобрать полнотекстовый индекс рецензий (reviews_fts), например после VACUUM
+  maintenance    — применить политики хранения и вернуть свободные страницы (maintenance.py)
+  enable-auto-vacuum — перевести базу в auto_vacuum = INCREMENTAL (разовый полный VACUUM)
+  export DIR     — выгрузить таблицы в DIR/<таблица>.jsonl|csv (потоково, память не растёт с размером базы)
+  import DIR     — загрузить таблицы из DIR пакетами executemany в крупных транзакциях
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import database
+import maintenance
+
+# Таблицы с исходными данными в порядке загрузки (каталог раньше ссылок на него).
+# track_stats и reviews_fts не выгружаются: их заполняют триггеры при загрузке reviews.
+DATA_TABLES = ["tracks", "users", "reviews", "user_favorites", "user_downloads", "user_progress", "daily_track"]
+FETCH_SIZE = 5000
+DEFAULT_BATCH = 10000
+ROWS_PER_TRANSACTION = 100000
+
+
+def cmd_rebuild_stats(args):
+    database.init_db()
+    count = database.rebuild_track_stats()
+    print(f"Готово. Пересчитано треков: {count}")
+
+
+def cmd_rebuild_search(args):
+    database.init_db()
+    count = database.rebuild_review_search()
+    print(f"Готово. Проиндексировано рецензий: {count}")
+
+
+def cmd_maintenance(args):
+    database.init_db()
+    info = maintenance.run_maintenance(time_budget=args.budget)
+    deleted = ", ".join(f"{name}: {count}" for name, count in info["deleted"].items()) or "нет"
+    print(f"Удалено строк: {deleted}; освобождено страниц: {info['freed_pages']} за {info['seconds']} с")
+    if not info["done"]:
+        print("Не всё успели за отведённое время — запустите ещё раз или увеличьте --budget")
+
+
+def cmd_enable_auto_vacuum(args):
+    database.init_db()
+    conn = database._connect()
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        print("Уже включено: auto_vacuum = INCREMENTAL")
+        return
+    started = time.perf_counter()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    # VACUUM может перенумеровать rowid рецензий, с которыми связан reviews_fts
+    count = database.rebuild_review_search()
+    print(f"Готово за {time.perf_counter() - started:.1f} с: auto_vacuum = INCREMENTAL, "
+          f"проиндексировано рецензий: {count}")
+
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def _progress(table, count, started, done=False):
+    rate = count / max(time.perf_counter() - started, 1e-9)
+    end = "\n" if done else "\r"
+    print(f"  {table}: {count} строк ({rate:,.0f} строк/с)", end=end, flush=True)
+
+
+def export_table(conn, table, path, fmt):
+    """Построчно выгружает таблицу: курсор читается порциями по FETCH_SIZE. Возвращает число строк."""
+    cursor = conn.execute(f'SELECT * FROM {table}')
+    columns = [d[0] for d in cursor.description]
+    count, started = 0, time.perf_counter()
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = None
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            if writer:
+                writer.writerows(rows)
+            else:
+                f.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+            count += len(rows)
+            _progress(table, count, started)
+    _progress(table, count, started, done=True)
+    return count
+
+
+def _read_rows(path, fmt):
+    """Итератор словарей строк файла. В CSV пустое поле — NULL."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                yield {k: (v if v != "" else None) for k, v in row.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def import_table(conn, table, path, fmt, batch_size=DEFAULT_BATCH):
+    """
+    Загружает файл в таблицу (INSERT OR REPLACE) пакетами по batch_size строк,
+    фиксируя транзакцию каждые ROWS_PER_TRANSACTION строк. Колонки, которых нет в таблице, пропускаются.
+    Время строк (database.TIMESTAMP_COLUMNS) приводится к виду CURRENT_TIMESTAMP — по нему идут курсоры страниц.
+    Возвращает число строк.
+    """
+    known = _table_columns(conn, table)
+    rows = _read_rows(path, fmt)
+    first = next(rows, None)
+    if first is None:
+        return 0
+    columns = [c for c in first if c in known]
+    skipped = [c for c in first if c not in known]
+    if skipped:
+        print(f"  {table}: пропущены неизвестные колонки {', '.join(skipped)}")
+    sql = (f'INSERT OR REPLACE INTO {table} ({", ".join(columns)}) '
+           f'VALUES ({", ".join("?" for _ in columns)})')
+
+    def batches():
+        batch = [tuple(first.get(c) for c in columns)]
+        for row in rows:
+            batch.append(tuple(row.get(c) for c in columns))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    count, in_transaction, started = 0, 0, time.perf_counter()
+    conn.execute('BEGIN')
+    try:
+        for batch in batches():
+            conn.executemany(sql, batch)
+            count += len(batch)
+            in_transaction += len(batch)
+            if in_transaction >= ROWS_PER_TRANSACTION:
+                conn.execute('COMMIT')
+                conn.execute('BEGIN')
+                in_transaction = 0
+            _progress(table, count, started)
+        if table in database.TIMESTAMP_COLUMNS:
+            fixed = database.normalize_timestamps(conn.cursor(), [table])
+            if fixed:
+                print(f"  {table}: приведено время у {fixed} строк")
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    _progress(table, count, started, done=True)
+    return count
+
+
+def _selected_tables(args):
+    tables = args.tables.split(",") if args.tables else DATA_TABLES
+    unknown = [t for t in tables if t not in DATA_TABLES]
+    if unknown:
+        raise SystemExit(f"Неизвестные таблицы: {', '.join(unknown)}. Доступны: {', '.join(DATA_TABLES)}")
+    return [t for t in DATA_TABLES if t in tables]
+
+
+def cmd_export(args):
+    database.init_db()
+    os.makedirs(args.dir, exist_ok=True)
+    conn = database._connect()
+    total = 0
+    for table in _selected_tables(args):
+        total += export_table(conn, table, os.path.join(args.dir, f"{table}.{args.format}"), args.format)
+    print(f"Готово. Выгружено строк: {total} → {args.dir}")
+
+
+def cmd_import(args):
+    database.init_db()
+    conn = database._connect()
+    total = 0
+    for table in _selected_tables(args):
+        path = os.path.join(args.dir, f"{table}.{args.format}")
+        if not os.path.isfile(path):
+            print(f"  {table}: нет файла {path}, пропуск")
+            continue
+        total += import_table(conn, table, path, args.format, args.batch)
+    print(f"Готово. Загружено строк: {total}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Служебные операции с базой бота")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-stats", help="пересчитать track_stats из reviews")
+    p.set_defaults(func=cmd_rebuild_stats)
+
+    p = sub.add_parser("rebuild-search", help="пересобрать полнотекстовый индекс рецензий")
+    p.set_defaults(func=cmd_rebuild_search)
+
+    p = sub.add_parser("maintenance", help="политики хранения и incremental_vacuum")
+    p.add_argument("--budget", type=float, default=60.0, help="не дольше стольких секунд")
+    p.set_defaults(func=cmd_maintenance)
+
+    p = sub.add_parser("enable-auto-vacuum", help="включить auto_vacuum = INCREMENTAL (полный VACUUM)")
+    p.set_defaults(func=cmd_enable_auto_vacuum)
+
+    for name, func, help_text in [
+        ("export", cmd_export, "выгрузить таблицы в каталог"),
+        ("import", cmd_import, "загрузить таблицы из каталога"),
+    ]:
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("dir", help="каталог с файлами <таблица>.jsonl|csv")
+        p.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+        p.add_argument("--tables", help="через запятую; по умолчанию все: " + ",".join(DATA_TABLES))
+        if name == "import":
+            p.add_argument("--batch", type=int, default=DEFAULT_BATCH, help="строк в одном executemany")
+        p.set_defaults(func=func)
+
+    args = parser.parse_args(argv)
+    print(f"База: {database.DATABASE_PATH}")
+    args.func(args)
+    database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
@@ -0,0 +1,70 @@
+# handlers/admin_handler.py
+"""Служебные команды для администраторов (config.ADMIN_IDS)."""
+import io
+import os
+from telegram import InputFile, Update
+from telegram.ext import ContextTypes
+import config
+import backup
+import db_metrics
+
+
+def is_admin(user_id: int) -> bool:
+    return user_id in config.ADMIN_IDS
+
+
+async def cmd_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /backup — снять резервную копию базы сейчас (только для админов)."""
+    if not is_admin(update.message.from_user.id):
+        return
+    await update.message.reply_text("💾 Снимаю резервную копию...")
+    try:
+        info = await backup.run_backup()
+    except Exception as e:
+        await update.message.reply_text(f"❌ Копия не создана: {e}")
+        return
+    size_mb = info["size"] / (1024 * 1024)
+    await update.message.reply_text(
+        f"✅ Копия готова: {os.path.basename(info['path'])}\n"
+        f"Размер: {size_mb:.1f} МБ, время: {info['seconds']} с, проверка целостности: ok\n"
+        f"Удалено старых копий: {len(info['removed'])}"
+    )
+
+
+def _dbstats_text(stats, slow, top=10):
+    """Текст /dbstats: самые затратные функции БД и последние медленные вызовы."""
+    if not stats:
+        return "📊 Метрик БД пока нет."
+    lines = ["📊 Функции БД по суммарному времени:", "функция: вызовов, p50/p95/max мс, строк"]
+    for name, s in list(stats.items())[:top]:
+        lines.append(f"{name}: {s['count']}, {s['p50_ms']:g}/{s['p95_ms']:g}/{s['max_ms']:g}, {s['rows']}")
+    if slow:
+        lines.append("")
+        lines.append("🐢 Медленные вызовы:")
+        for entry in slow:
+            lines.append(f"{entry['function']} ({entry['caller'] or '?'}) — {entry['ms']} мс")
+            for q in entry["queries"]:
+                if q["full_scan"]:
+                    lines.append(f"  ⚠️ {q['sql'][:120]}")
+                    lines.extend(f"     {step}" for step in q["plan"])
+    return "\n".join(lines)
+
+
+async def cmd_dbstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Команда /dbstats — метрики запросов к базе (только для админов).
+    /dbstats prom — гистограммы файлом в формате Prometheus, /dbstats reset — сбросить счётчики.
+    """
+    if not is_admin(update.message.from_user.id):
+        return
+    arg = (context.args or [""])[0].lower()
+    if arg == "reset":
+        db_metrics.reset()
+        await update.message.reply_text("✅ Метрики БД сброшены.")
+        return
+    if arg == "prom":
+        data = io.BytesIO(db_metrics.prometheus_text().encode("utf-8"))
+        await update.message.reply_document(document=InputFile(data, filename="db_metrics.prom"))
+        return
+    text = _dbstats_text(db_metrics.snapshot(), db_metrics.slow_queries(limit=3))
+    await update.message.reply_text(text[:4000])
@@ -25,7 +25,7 @@ async def show_chart(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     page = _page_from_callback(query.data or "")
 
-    tracks = get_chart_tracks(chart_id="world", limit=CHART_FETCH_LIMIT)
+    tracks = await get_chart_tracks(chart_id="world", limit=CHART_FETCH_LIMIT)
     if not tracks:
         await query.edit_message_text(
             "❌ Не удалось загрузить чарт. Попробуй позже.",
@@ -1,12 +1,13 @@
 # handlers/commands_handler.py
-# Команды: /info, /chart, /daily, /stats, /search <запрос>
+# Команды: /info, /chart, /daily, /stats, /search <запрос> (/find — handlers/find_handler.py)
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from yandex_music_service import get_chart_tracks, get_daily_track
 from yandex import search_track
-from database import get_last_reviews, get_user_progress, get_favorites
+from db_async import get_last_reviews, get_user_summary
 from keyboards import chart_list_buttons_paginated, back_to_menu_button, main_menu
-from utils import hash_id, hash_to_track_id, level_progress_bar
+from utils import level_progress_bar
+from callback_codec import encode_track
 from handlers.track_card_handler import send_track_card
 
 
@@ -22,7 +23,8 @@ async def cmd_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/chart — чарт Яндекс.Музыки\n"
         "/daily — трек дня\n"
         "/stats — моя статистика\n"
-        "/search _запрос_ — быстрый поиск трека\n\n"
+        "/search _запрос_ — быстрый поиск трека\n"
+        "/find _слова_ — поиск по рецензиям\n\n"
         "Всё остальное — через кнопки в меню."
     )
     await update.message.reply_text(text, parse_mode="Markdown")
@@ -31,7 +33,7 @@ async def cmd_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_chart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /chart — открыть чарт (первая страница с пагинацией)."""
     from handlers.chart_handler import CHART_FETCH_LIMIT, PAGE_SIZE
-    tracks = get_chart_tracks(chart_id="world", limit=CHART_FETCH_LIMIT)
+    tracks = await get_chart_tracks(chart_id="world", limit=CHART_FETCH_LIMIT)
     if not tracks:
         await update.message.reply_text(
             "❌ Не удалось загрузить чарт. Попробуй позже.",
@@ -49,7 +51,7 @@ async def cmd_chart(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cmd_daily(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /daily — трек дня."""
-    track = get_daily_track()
+    track = await get_daily_track()
     if not track:
         await update.message.reply_text(
             "❌ Не удалось загрузить трек дня.",
@@ -63,9 +65,9 @@ async def cmd_daily(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /stats — моя статистика (оценки, уровень, избранное)."""
     user_id = update.message.from_user.id
-    progress = get_user_progress(user_id)
-    fav_count = len(get_favorites(user_id))
-    reviews = get_last_reviews(user_id, limit=10)
+    progress = await get_user_summary(user_id)
+    fav_count = progress["favorites_count"]
+    reviews = await get_last_reviews(user_id, limit=10) if progress["reviews_count"] else []
 
     if not reviews:
         await update.message.reply_text(
@@ -84,10 +86,9 @@ async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     buttons = [[InlineKeyboardButton(f"🤍 Моё избранное ({fav_count})", callback_data="view_favorites")]]
     for r in reviews:
-        safe_hash = hash_id(r["track_id"])
-        hash_to_track_id[safe_hash] = r["track_id"]
+        token = encode_track(r["track_id"])
         btn_text = f"{r['title']} — {r['artist']} | {r['total']}/50"
-        buttons.append([InlineKeyboardButton(btn_text, callback_data=f"detail_{safe_hash}")])
+        buttons.append([InlineKeyboardButton(btn_text, callback_data=f"detail_{token}")])
     buttons.append([InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")])
     await update.message.reply_text(
         message,
@@ -107,7 +108,7 @@ async def cmd_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     query = " ".join(query_text).strip()
     await update.message.reply_text("🔍 Ищу трек...")
-    tracks = search_track(query, limit=1)
+    tracks = await search_track(query, limit=1)
     if not tracks:
         await update.message.reply_text(
             "❌ Не нашёл такой трек. Попробуй: /search Исполнитель — Название"
@@ -10,7 +10,7 @@ async def show_daily_track(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    track = get_daily_track()
+    track = await get_daily_track()
     if not track:
         await query.edit_message_text(
             "❌ Не удалось загрузить трек дня.",
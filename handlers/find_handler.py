@@ -0,0 +1,72 @@
+# handlers/find_handler.py
+"""Поиск по рецензиям: /find <запрос> и кнопка меню → ввод запроса → лучшие совпадения со сниппетами."""
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from db_async import search_reviews
+from keyboards import back_to_menu_button
+from utils import user_states
+from callback_codec import encode_track
+
+FIND_LIMIT = 10
+
+
+def _results_message(query_text, hits):
+    """Текст и кнопки результатов: рецензия с текстом → review_detail_, оценка без текста → global_detail_."""
+    lines = [f"🔎 Рецензии по запросу «{query_text}»:\n"]
+    buttons = []
+    for i, h in enumerate(hits, 1):
+        lines.append(f"{i}. {h['title']} — {h['artist']} | {h['total']}/50")
+        if h["snippet"]:
+            lines.append(f"   👤 {h['nickname']}: {h['snippet']}")
+        else:
+            lines.append(f"   👤 {h['nickname']} (без текста)")
+        token = encode_track(h["track_id"])
+        prefix = "review_detail" if h["review_text"] else "global_detail"
+        label = f"{i}. {h['title']} — {h['nickname']}"[:60]
+        buttons.append([InlineKeyboardButton(label, callback_data=f"{prefix}_{h['user_id']}_{token}")])
+    buttons.append([InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")])
+    return "\n".join(lines), InlineKeyboardMarkup(buttons)
+
+
+async def _reply_with_results(message, query_text):
+    hits = await search_reviews(query_text, limit=FIND_LIMIT)
+    if not hits:
+        await message.reply_text(
+            f"🔎 По запросу «{query_text}» ничего не нашлось. Попробуй другие слова.",
+            reply_markup=back_to_menu_button(),
+        )
+        return
+    text, reply_markup = _results_message(query_text, hits)
+    await message.reply_text(text, reply_markup=reply_markup)
+
+
+async def cmd_find(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /find <запрос> — поиск по тексту рецензий, названиям и исполнителям оценённых треков."""
+    query_text = " ".join(context.args or []).strip()
+    if not query_text:
+        await update.message.reply_text(
+            "🔎 Использование: /find _слова из рецензии, название или исполнитель_\n\nПример: /find холодный вайб",
+            parse_mode="Markdown",
+        )
+        return
+    await _reply_with_results(update.message, query_text)
+
+
+async def start_find(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка «Поиск по рецензиям» — просим ввести запрос."""
+    query = update.callback_query
+    await query.answer()
+    user_states[query.from_user.id] = {"stage": "awaiting_find_query"}
+    await query.message.reply_text(
+        "🔎 *Поиск по рецензиям*\n\nНапиши слова из рецензии, название трека или исполнителя:",
+        parse_mode="Markdown",
+        reply_markup=back_to_menu_button(),
+    )
+
+
+async def handle_find_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Текст запроса (вызывается из main при stage == awaiting_find_query)."""
+    user_id = update.message.from_user.id
+    query_text = (update.message.text or "").strip()[:100]
+    user_states.pop(user_id, None)
+    await _reply_with_results(update.message, query_text)
@@ -1,10 +1,18 @@
 # handlers/global_reviews_handler.py
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-import sqlite3
-from database import get_last_reviews_global, get_top_tracks_by_rating, get_recent_reviews_with_text
-from keyboards import back_to_menu_button, back_to_list_button
-from utils import hash_id, hash_to_track_id
+from db_async import (
+    get_last_reviews_global,
+    get_top_tracks_by_rating,
+    get_genres,
+    get_recent_reviews_with_text,
+    get_review,
+    get_track_reviews,
+    get_track_reviews_with_text,
+)
+from keyboards import back_to_menu_button, back_to_list_button, genre_picker_rows
+from utils import genre_title
+from callback_codec import encode_track, resolve_track
 
 
 def _format_timestamp(ts):
@@ -19,18 +27,28 @@ def _format_timestamp(ts):
         return "недавно"
 
 
+STATS_GENRE_PREFIX = "stats_genre"
+
+
 async def show_general_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Общая статистика: топ треков по количеству оценок + последние рецензии.
+    view_global_reviews — топ по всем трекам, stats_genre_{жанр} — топ одного жанра.
     """
     query = update.callback_query
     await query.answer()
+    data = query.data or ""
+    genre = data[len(STATS_GENRE_PREFIX) + 1:] if data.startswith(STATS_GENRE_PREFIX + "_") else None
 
-    top_tracks = get_top_tracks_by_rating(limit=10)
-    recent_reviews = get_recent_reviews_with_text(limit=5)
+    top_tracks = await get_top_tracks_by_rating(limit=10, genre=genre)
+    recent_reviews = await get_recent_reviews_with_text(limit=5)
+    genres = await get_genres()
 
     lines = ["🌍 *Общая статистика*\n"]
-    lines.append("🏆 *Топ-10 треков по количеству оценок:*\n")
+    if genre:
+        lines.append(f"🏆 *Топ-10 треков: {genre_title(genre)}*\n")
+    else:
+        lines.append("🏆 *Топ-10 треков по количеству оценок:*\n")
     if top_tracks:
         for i, t in enumerate(top_tracks, 1):
             lines.append(f"{i}. *{t['title']}* — {t['artist']}\n   {t['avg_score']}/50 ({t['count']} оценок)\n")
@@ -44,7 +62,8 @@ async def show_general_stats(update: Update, context: ContextTypes.DEFAULT_TYPE)
     else:
         lines.append("Пока нет рецензий.\n")
 
-    keyboard = [
+    keyboard = genre_picker_rows(genres, STATS_GENRE_PREFIX, "view_global_reviews", current=genre) if genres else []
+    keyboard += [
         [InlineKeyboardButton("👥 Последние оценки пользователей", callback_data="view_global_reviews_list")],
         [InlineKeyboardButton("📖 Список последних рецензий", callback_data="view_recent_reviews")],
         [InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")],
@@ -56,10 +75,7 @@ async def show_general_stats(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def view_global_reviews(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    reviews = get_last_reviews_global(limit=10)
-
-    if len(hash_to_track_id) > 100:
-        hash_to_track_id.clear()
+    reviews = await get_last_reviews_global(limit=10)
 
     if not reviews:
         await query.edit_message_text("🌍 Пока нет оценок от других.", reply_markup=back_to_menu_button())
@@ -76,13 +92,12 @@ async def view_global_reviews(update: Update, context: ContextTypes.DEFAULT_TYPE
 
         button_text = f"{line1}\n{line2}\n{line3}"
 
-        safe_hash = hash_id(r['track_id'])
-        hash_to_track_id[safe_hash] = r['track_id']
+        token = encode_track(r['track_id'])
 
         buttons.append([
             InlineKeyboardButton(
                 button_text,
-                callback_data=f"global_detail_{r['user_id']}_{safe_hash}"
+                callback_data=f"global_detail_{r['user_id']}_{token}"
             )
         ])
 
@@ -95,17 +110,7 @@ async def view_recent_reviews(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     await query.answer()
 
-    conn = sqlite3.connect('reviews.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT nickname, track_title, track_artist, review_text, total, timestamp
-        FROM reviews
-        WHERE review_text IS NOT NULL AND review_text != ''
-        ORDER BY rowid DESC
-        LIMIT 10
-    ''')
-    rows = cursor.fetchall()
-    conn.close()
+    rows = await get_recent_reviews_with_text(limit=10)
 
     if not rows:
         await query.edit_message_text("📖 Пока нет текстовых рецензий от других.", reply_markup=back_to_menu_button())
@@ -113,41 +118,44 @@ async def view_recent_reviews(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     message = "📖 Последние рецензии других пользователей:\n\n"
     buttons = []
-    for i, (nickname, title, artist, text, score, ts) in enumerate(rows):
-        nick_display = nickname or "Аноним"
+    for r in rows:
+        nick_display, title, text, score, ts = r["nickname"], r["title"], r["text"], r["total"], r["timestamp"]
         short_text = (text[:30] + "...") if len(text) > 30 else text
         time_str = format_timestamp(ts)
         button_text = f"{nick_display}\n{title}\n{short_text} | {score}/50\n{time_str}"
+        token = encode_track(r["track_id"])
         buttons.append([
-            InlineKeyboardButton(button_text, callback_data=f"review_detail_{i}")
+            InlineKeyboardButton(button_text, callback_data=f"review_detail_{r['user_id']}_{token}")
         ])
     buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="back_to_menu")])
     await query.edit_message_text(message, reply_markup=InlineKeyboardMarkup(buttons))
 
 
 async def show_review_detail(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает полный текст рецензии по индексу (callback review_detail_0 .. review_detail_9)."""
+    """Показывает полный текст рецензии (callback review_detail_{user_id}_{токен}) поиском по ключу."""
     query = update.callback_query
     await query.answer()
     data = query.data
     if not data.startswith("review_detail_"):
         return
+    parts = data.split("_")
     try:
-        idx = int(data.replace("review_detail_", "", 1))
-    except ValueError:
+        author_id = int(parts[2])
+    except (IndexError, ValueError):
+        await query.answer("Рецензия не найдена.", show_alert=True)
         return
-    reviews = get_recent_reviews_with_text(limit=10)
-    if idx < 0 or idx >= len(reviews):
+    track_id = await resolve_track(parts[-1])
+    r = await get_review(author_id, track_id) if track_id else None
+    if not r or not r.get("review_text"):
         await query.answer("Рецензия не найдена.", show_alert=True)
         return
-    r = reviews[idx]
     time_str = _format_timestamp(r.get("timestamp"))
     text = (
         f"📖 *Рецензия*\n\n"
         f"👤 *{r['nickname']}*\n"
         f"🎵 {r['title']} — {r['artist']}\n"
         f"⭐ {r['total']}/50 | ⏰ {time_str}\n\n"
-        f"_{r['text']}_"
+        f"_{r['review_text']}_"
     )
     await query.edit_message_text(text, parse_mode="Markdown", reply_markup=back_to_list_button("view_recent_reviews"))
 
@@ -170,38 +178,29 @@ async def show_global_detail(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.answer("Неверный ID пользователя.", show_alert=True)
         return
 
-    track_hash = parts[-1]
-    if track_hash not in hash_to_track_id:
+    token = parts[-1]
+    track_id = await resolve_track(token)
+    if not track_id:
         await query.answer("Трек не найден.", show_alert=True)
         return
 
-    track_id = hash_to_track_id[track_hash]
-    conn = sqlite3.connect('reviews.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT track_title, track_artist, rhymes, rhythm, style, charisma, vibe, total, nickname
-        FROM reviews WHERE user_id = ? AND track_id = ?
-    ''', (user_id_in_data, track_id))
-    row = cursor.fetchone()
-    conn.close()
-
-    if not row:
+    review = await get_review(user_id_in_data, track_id)
+
+    if not review:
         await query.answer("Оценка не найдена.", show_alert=True)
         return
 
-    title, artist, r1, r2, r3, r4, r5, total, nickname = row
-    display_name = nickname or f"Пользователь {user_id_in_data}"
-
+    ratings = review["ratings"]
     detail_text = (
-        f"🌍 *Оценка от {display_name}*\n\n"
-        f"🎵 *{title}*\n"
-        f"👤 {artist}\n\n"
-        f"📊 *Общий балл: {total}/50*\n\n"
-        f"🔸 Рифмы/образы: {r1}\n"
-        f"🔸 Структура/ритмика: {r2}\n"
-        f"🔸 Реализация стиля: {r3}\n"
-        f"🔸 Харизма: {r4}\n"
-        f"🔸 Атмосфера: {r5}"
+        f"🌍 *Оценка от {review['nickname']}*\n\n"
+        f"🎵 *{review['title']}*\n"
+        f"👤 {review['artist']}\n\n"
+        f"📊 *Общий балл: {review['total']}/50*\n\n"
+        f"🔸 Рифмы/образы: {ratings['rhymes']}\n"
+        f"🔸 Структура/ритмика: {ratings['rhythm']}\n"
+        f"🔸 Реализация стиля: {ratings['style']}\n"
+        f"🔸 Харизма: {ratings['charisma']}\n"
+        f"🔸 Атмосфера: {ratings['vibe']}"
     )
 
     await query.edit_message_text(detail_text, parse_mode='Markdown', reply_markup=back_to_list_button("view_global_reviews"))
@@ -211,28 +210,20 @@ async def show_global_reviews_for_track(update: Update, context: ContextTypes.DE
     query = update.callback_query
     await query.answer()
     data = query.data.replace("global_for_track_", "", 1)
-    if data not in hash_to_track_id:
+    track_id = await resolve_track(data)
+    if not track_id:
         await query.answer("Трек не найден.", show_alert=True)
         return
 
-    track_id = hash_to_track_id[data]
-    conn = sqlite3.connect('reviews.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT nickname, total, timestamp
-        FROM reviews WHERE track_id = ? ORDER BY total DESC
-    ''', (track_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    rows = await get_track_reviews(track_id)
 
     if not rows:
         await query.edit_message_text("❌ По этому треку пока нет оценок.", reply_markup=back_to_list_button("view_reviews"))
         return
 
     message = f"👥 *Оценки других по треку*\n\n"
-    for nickname, total, ts in rows:
-        nick_display = nickname or "Аноним"
-        message += f"• `{nick_display}` — *{total}/50* ({format_timestamp(ts)})\n"
+    for r in rows:
+        message += f"• `{r['nickname']}` — *{r['total']}/50* ({format_timestamp(r['timestamp'])})\n"
 
     await query.edit_message_text(message, parse_mode='Markdown', reply_markup=back_to_list_button("view_reviews"))
 
@@ -242,31 +233,21 @@ async def show_reviews_for_track(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
     data = query.data.replace("reviews_for_track_", "", 1)
-    if data not in hash_to_track_id:
+    track_id = await resolve_track(data)
+    if not track_id:
         await query.answer("Трек не найден.", show_alert=True)
         return
 
-    track_id = hash_to_track_id[data]
-    conn = sqlite3.connect('reviews.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT nickname, review_text, total, timestamp
-        FROM reviews
-        WHERE track_id = ? AND review_text IS NOT NULL AND review_text != ''
-        ORDER BY total DESC
-    ''', (track_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    rows = await get_track_reviews_with_text(track_id)
 
     if not rows:
         await query.edit_message_text("❌ По этому треку пока нет текстовых рецензий.", reply_markup=back_to_list_button("view_reviews"))
         return
 
     message = f"💬 *Рецензии других по треку*\n\n"
-    for nickname, text, score, ts in rows:
-        nick_display = nickname or "Аноним"
-        time_str = format_timestamp(ts)
-        message += f"👤 *{nick_display}* | ⭐ {score}/50 | ⏰ {time_str}\n💬 _{text}_\n\n"
+    for r in rows:
+        time_str = format_timestamp(r["timestamp"])
+        message += f"👤 *{r['nickname']}* | ⭐ {r['total']}/50 | ⏰ {time_str}\n💬 _{r['text']}_\n\n"
 
     await query.edit_message_text(message, parse_mode='Markdown', reply_markup=back_to_list_button("view_reviews"))
 
@@ -1,32 +1,64 @@
 # handlers/my_reviews_db_handler.py
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
-from database import get_last_reviews, get_user_progress, get_favorites, get_downloads
-from keyboards import back_to_menu_button, back_to_list_button, reviews_list_buttons_paginated
-from utils import user_states, hash_id, hash_to_track_id, level_progress_bar
+from db_async import (
+    get_last_reviews,
+    get_review,
+    get_user_summary,
+    get_favorites,
+    count_favorites,
+    get_downloads,
+    count_downloads,
+    mark_download_message_missing,
+)
+from keyboards import (
+    back_to_menu_button,
+    back_to_list_button,
+    reviews_list_buttons_paginated,
+    favorites_list_buttons,
+    downloads_page_buttons,
+)
+from utils import user_states, level_progress_bar, parse_page_callback
+from callback_codec import FALLBACK_PREFIX, resolve_track
 
-REVIEWS_FETCH_LIMIT = 100
 PAGE_SIZE = 10
+FAVORITES_PAGE_SIZE = 20
+DOWNLOADS_PAGE_SIZE = 10
 
 
-def _page_from_callback(data: str) -> int:
-    if data == "view_reviews":
-        return 0
-    if data.startswith("view_reviews_page_"):
-        try:
-            return max(0, int(data.split("_")[-1]))
-        except ValueError:
-            return 0
-    return 0
+async def _load_page(fetch, user_id, data, prefix, per_page):
+    """
+    Одна страница списка по курсору из callback (prefix_n/p_N_{курсор}).
+    Если страница по курсору пуста (строки удалены) — первая страница.
+    Возвращает (page, items).
+    """
+    token = (data or "").rsplit("_", 1)[-1]
+    if token.startswith(FALLBACK_PREFIX):
+        await resolve_track(token)  # нечисловой id курсора — из callback_ids в кэш codec
+    page, before, after = parse_page_callback(data or "", prefix)
+    items = await fetch(user_id, limit=per_page, before=before, after=after)
+    if not items and (before or after):
+        page, items = 0, await fetch(user_id, limit=per_page)
+    if after and len(items) < per_page:
+        # Дошли до начала списка — показываем полную первую страницу
+        page, items = 0, await fetch(user_id, limit=per_page)
+    return page, items
+
+
+def _total_pages(count, per_page):
+    return max(1, (count + per_page - 1) // per_page)
 
 
 async def view_reviews(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    progress = get_user_progress(user_id)
-    fav_count = len(get_favorites(user_id))
-    reviews = get_last_reviews(user_id, limit=REVIEWS_FETCH_LIMIT)
+    progress = await get_user_summary(user_id)
+    fav_count = progress["favorites_count"]
+    page, reviews = 0, []
+    if progress["reviews_count"]:
+        page, reviews = await _load_page(get_last_reviews, user_id, query.data, "view_reviews", PAGE_SIZE)
 
     if not reviews:
         from keyboards import main_menu
@@ -38,10 +70,8 @@ async def view_reviews(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    page = _page_from_callback(query.data or "")
-    total_pages = (len(reviews) + PAGE_SIZE - 1) // PAGE_SIZE
-    if page >= total_pages:
-        page = max(0, total_pages - 1)
+    total_pages = _total_pages(progress["reviews_count"], PAGE_SIZE)
+    page = min(page, total_pages - 1)
 
     message = (
         f"📊 *Моя статистика*\n"
@@ -50,7 +80,7 @@ async def view_reviews(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"📌 Твои оценки — стр. {page + 1}/{total_pages}\n\n"
     )
     reply_markup = reviews_list_buttons_paginated(
-        reviews, page=page, per_page=PAGE_SIZE, fav_count=fav_count
+        reviews, page=page, total_pages=total_pages, fav_count=fav_count
     )
     await query.edit_message_text(message, reply_markup=reply_markup, parse_mode="Markdown")
 
@@ -63,15 +93,14 @@ async def show_detail_review(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not data.startswith("detail_"):
         return
 
-    track_hash = data.replace("detail_", "", 1)
-    if track_hash not in hash_to_track_id:
+    token = data.replace("detail_", "", 1)
+    real_track_id = await resolve_track(token)
+    if not real_track_id:
         await query.answer("❌ Оценка не найдена.", show_alert=True)
         return
 
-    real_track_id = hash_to_track_id[track_hash]
     user_id = query.from_user.id
-    reviews = get_last_reviews(user_id, limit=100)
-    review = next((r for r in reviews if r['track_id'] == real_track_id), None)
+    review = await get_review(user_id, real_track_id)
 
     if not review:
         await query.answer("❌ Оценка не найдена.", show_alert=True)
@@ -93,31 +122,29 @@ async def show_detail_review(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 
 async def view_favorites(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Список избранных треков; по нажатию — карточка трека."""
+    """Список избранных треков постранично; по нажатию — карточка трека."""
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    favs = get_favorites(user_id, limit=30)
+    page, favs = await _load_page(get_favorites, user_id, query.data, "view_favorites", FAVORITES_PAGE_SIZE)
     if not favs:
         await query.edit_message_text(
             "🤍 В избранном пока пусто. Добавляй треки кнопкой «В избранное» на карточке.",
             reply_markup=back_to_menu_button(),
         )
         return
-    tracks_for_buttons = [{"id": t["track_id"], "title": t["title"], "artist": t["artist"]} for t in favs]
-    from keyboards import chart_list_buttons, back_to_menu_button
-    text = f"🤍 *Моё избранное* ({len(favs)})\n\nВыбери трек:"
-    reply_markup = chart_list_buttons(tracks_for_buttons)
-    # Клавиатура возвращает tuple; делаем список строк и заменяем последнюю на «Назад в меню»
-    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-    rows = [list(row) for row in reply_markup.inline_keyboard]
-    rows = rows[:-1] + [[InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")]]
-    reply_markup = InlineKeyboardMarkup(rows)
+    fav_count = await count_favorites(user_id)
+    total_pages = _total_pages(fav_count, FAVORITES_PAGE_SIZE)
+    text = f"🤍 *Моё избранное* ({fav_count})\n\nВыбери трек:"
+    reply_markup = favorites_list_buttons(favs, page=page, total_pages=total_pages)
     await query.edit_message_text(text, parse_mode="Markdown", reply_markup=reply_markup)
 
 
 async def view_downloads(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Сначала копирует сохранённые сообщения с треками; если сообщение удалено — переотправляет через API."""
+    """
+    Отправляет страницу скачанных треков: сначала копирует сохранённые сообщения,
+    если сообщение удалено — отмечает это в базе и переотправляет через API.
+    """
     import io
     from telegram import InputFile
     from yandex_music_service import download_track_bytes
@@ -126,7 +153,7 @@ async def view_downloads(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     user_id = query.from_user.id
     chat_id = query.message.chat_id
-    downloads = get_downloads(user_id, limit=30)
+    page, downloads = await _load_page(get_downloads, user_id, query.data, "view_downloads", DOWNLOADS_PAGE_SIZE)
     if not downloads:
         await query.edit_message_text(
             "📥 Здесь будут треки, которые ты скачал по кнопке «Скачать» на карточке.",
@@ -150,11 +177,14 @@ async def view_downloads(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     sent_message_ids.append((chat_id, new_id))
                 sent += 1
                 copied = True
+            except BadRequest:
+                # Сообщение удалено из хранилища — больше не копируем, запись уберёт maintenance.py
+                await mark_download_message_missing(user_id, d["track_id"])
             except Exception:
                 pass
         if not copied:
             try:
-                audio_bytes, title, performer = download_track_bytes(d["track_id"])
+                audio_bytes, title, performer = await download_track_bytes(d["track_id"])
                 if not audio_bytes or len(audio_bytes) == 0:
                     continue
                 if len(audio_bytes) > 50 * 1024 * 1024:
@@ -174,8 +204,10 @@ async def view_downloads(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 continue
     if sent_message_ids:
         prev = user_states.get(user_id, {})
-        user_states[user_id] = {**prev, "messages_to_delete_on_back": sent_message_ids, "stage": "menu"}
+        to_delete = (prev.get("messages_to_delete_on_back") or []) + sent_message_ids
+        user_states[user_id] = {**prev, "messages_to_delete_on_back": to_delete, "stage": "menu"}
+    total_pages = _total_pages(await count_downloads(user_id), DOWNLOADS_PAGE_SIZE)
     await query.edit_message_text(
-        f"📥 Отправлено треков: {sent}.",
-        reply_markup=back_to_menu_button(),
+        f"📥 Отправлено треков: {sent} (стр. {page + 1}/{total_pages}).",
+        reply_markup=downloads_page_buttons(downloads, page=page, total_pages=total_pages),
     )
\ No newline at end of file
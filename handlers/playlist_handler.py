@@ -55,7 +55,7 @@ async def handle_playlist_link(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     await update.message.reply_text("📑 Загружаю плейлист...")
-    tracks = get_playlist_tracks(url)
+    tracks = await get_playlist_tracks(url)
     if not tracks:
         if user_id in user_states and user_states[user_id].get("stage") == "awaiting_playlist_link":
             del user_states[user_id]
@@ -2,16 +2,16 @@
 """Профиль пользователя: просмотр, редактирование (аватар, ник, описание, закреплённый трек). Лидерборд."""
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database import (
-    get_profile,
-    get_user_nickname,
+from db_async import (
     save_user_nickname,
-    get_user_progress,
+    get_user_summary,
     update_profile_avatar,
     update_profile_description,
     set_pinned_track,
     clear_pinned_track,
     get_leaderboard,
+    get_leaderboard_size,
+    get_user_rank,
     get_last_reviews,
     get_favorites,
 )
@@ -23,12 +23,13 @@ from keyboards import (
     leaderboard_buttons,
     back_to_leaderboard_button,
 )
-from utils import user_states, hash_to_track_id, level_progress_bar
+from utils import user_states, level_progress_bar
+from callback_codec import resolve_track
 
 
-def _profile_text(profile: dict, progress: dict) -> str:
-    """Текст профиля: ник, описание, закреплённый трек, уровень."""
-    parts = [f"👤 *{profile['nickname']}*", f"📊 {level_progress_bar(progress['level'], progress['exp'])}"]
+def _profile_text(profile: dict) -> str:
+    """Текст профиля (по сводке get_user_summary): ник, описание, закреплённый трек, уровень."""
+    parts = [f"👤 *{profile['nickname']}*", f"📊 {level_progress_bar(profile['level'], profile['exp'])}"]
     if profile.get("description"):
         parts.append(f"\n📄 {profile['description']}")
     if profile.get("pinned_track_id"):
@@ -51,19 +52,9 @@ async def show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
         msg = update.message
         chat_id = msg.chat_id
 
-    profile = get_profile(user_id)
-    if not profile:
-        nickname = get_user_nickname(user_id) or f"User_{user_id}"
-        profile = {
-            "nickname": nickname,
-            "avatar_file_id": None,
-            "description": "",
-            "pinned_track_id": None,
-            "pinned_track_title": None,
-            "pinned_track_artist": None,
-        }
-    progress = get_user_progress(user_id)
-    text = _profile_text(profile, progress)
+    profile = await get_user_summary(user_id)
+    profile["nickname"] = profile["nickname"] or f"User_{user_id}"
+    text = _profile_text(profile)
 
     try:
         if query and getattr(msg, "photo", None):
@@ -174,8 +165,8 @@ async def profile_pin_track(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    reviews = get_last_reviews(user_id, limit=50)
-    favorites = get_favorites(user_id, limit=50)
+    reviews = await get_last_reviews(user_id, limit=50)
+    favorites = await get_favorites(user_id, limit=50)
     seen = set()
     tracks = []
     for r in reviews:
@@ -238,24 +229,24 @@ async def profile_pin_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def profile_do_pin_track(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Установить закреплённый трек по callback pin_track_{hash}."""
+    """Установить закреплённый трек по callback pin_track_{токен}."""
     query = update.callback_query
     await query.answer()
     data = query.data or ""
     if not data.startswith("pin_track_"):
         return
-    track_hash = data.replace("pin_track_", "", 1)
-    if track_hash not in hash_to_track_id:
+    token = data.replace("pin_track_", "", 1)
+    track_id = await resolve_track(token)
+    if not track_id:
         await query.answer("Трек не найден.", show_alert=True)
         return
-    track_id = hash_to_track_id[track_hash]
     user_id = query.from_user.id
     state = user_states.get(user_id, {})
     tracks = state.get("pin_tracks") or []
     track = next((t for t in tracks if t["track_id"] == track_id), None)
     if not track:
         track = {"track_id": track_id, "title": "Трек", "artist": ""}
-    set_pinned_track(user_id, track_id, track.get("title"), track.get("artist"))
+    await set_pinned_track(user_id, track_id, track.get("title"), track.get("artist"))
     await query.edit_message_text("✅ Трек закреплён в профиле.", reply_markup=InlineKeyboardMarkup([
         [InlineKeyboardButton("👤 В профиль", callback_data="show_profile")],
     ]))
@@ -265,7 +256,7 @@ async def profile_unpin_track(update: Update, context: ContextTypes.DEFAULT_TYPE
     """Убрать закреплённый трек."""
     query = update.callback_query
     await query.answer()
-    clear_pinned_track(query.from_user.id)
+    await clear_pinned_track(query.from_user.id)
     await query.edit_message_text(
         "Закрепление снято.",
         reply_markup=InlineKeyboardMarkup([
@@ -284,7 +275,7 @@ async def handle_profile_photo(update: Update, context: ContextTypes.DEFAULT_TYP
         return
     photo = update.message.photo[-1]
     file_id = photo.file_id
-    update_profile_avatar(user_id, file_id)
+    await update_profile_avatar(user_id, file_id)
     user_states[user_id] = {"stage": "menu"}
     await show_profile(update, context)
 
@@ -301,7 +292,7 @@ async def handle_profile_nickname_text(update: Update, context: ContextTypes.DEF
     if not text or len(text) > 30:
         await update.message.reply_text("Никнейм от 1 до 30 символов. Попробуй снова.")
         return True
-    save_user_nickname(user_id, text)
+    await save_user_nickname(user_id, text)
     user_states[user_id] = {"stage": "menu"}
     await update.message.reply_text(f"✅ Никнейм изменён на *{text}*!", parse_mode="Markdown", reply_markup=profile_view_buttons())
     return True
@@ -318,30 +309,71 @@ async def handle_profile_description_text(update: Update, context: ContextTypes.
     text = update.message.text.strip()
     if text == "-" or text == "—":
         text = ""
-    update_profile_description(user_id, text)
+    await update_profile_description(user_id, text)
     user_states[user_id] = {"stage": "menu"}
     msg = "✅ Описание очищено!" if not text else "✅ Описание сохранено!"
     await update.message.reply_text(msg, reply_markup=profile_view_buttons())
     return True
 
 
+LEADERBOARD_SIZE = 100
+LEADERBOARD_PAGE_SIZE = 10
+
+
+def _leaderboard_page_from_callback(data: str) -> int:
+    if data.startswith("leaderboard_page_"):
+        try:
+            return max(0, int(data.split("_")[-1]))
+        except ValueError:
+            return 0
+    return 0
+
+
+def _leader_line(u: dict) -> str:
+    rank = u["rank"]
+    medal = "🥇" if rank == 1 else "🥈" if rank == 2 else "🥉" if rank == 3 else f"{rank}."
+    return f"{medal} {u['nickname']} — {u['exp']} EXP (ур. {u['level']})"
+
+
+def _my_rank_text(my_rank) -> str:
+    """Блок «Твоё место» с соседями сверху и снизу."""
+    if not my_rank:
+        return "📍 Тебя пока нет в рейтинге — оцени трек, чтобы получить EXP!"
+    lines = [f"📍 *Твоё место: #{my_rank['rank']} из {my_rank['total']}* — {my_rank['exp']} EXP"]
+    for u in my_rank["above"]:
+        lines.append(f"⬆️ #{u['rank']} {u['nickname']} — {u['exp']} EXP")
+    for u in my_rank["below"]:
+        lines.append(f"⬇️ #{u['rank']} {u['nickname']} — {u['exp']} EXP")
+    return "\n".join(lines)
+
+
 async def show_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Лидерборд: топ-3 главных ценителя по EXP. По нажатию — полный профиль (аватар, описание, трек)."""
+    """
+    Лидерборд: топ-100 по EXP постранично, место пользователя и соседи.
+    По нажатию на пользователя — полный профиль (аватар, описание, трек).
+    """
     query = update.callback_query
     if query:
         await query.answer()
     chat_id = query.message.chat_id if query else update.message.chat_id
-    leaders = get_leaderboard(limit=3)
+    user_id = query.from_user.id if query else update.message.from_user.id
+    page = _leaderboard_page_from_callback((query.data if query else "") or "")
+
+    total = min(await get_leaderboard_size(), LEADERBOARD_SIZE)
+    total_pages = max(1, (total + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE)
+    page = min(page, total_pages - 1)
+    leaders = await get_leaderboard(limit=LEADERBOARD_PAGE_SIZE, offset=page * LEADERBOARD_PAGE_SIZE)
     if not leaders:
         text = "🏆 Пока никого в лидерборде. Оцени треки и накапливай EXP!"
         kb = back_to_menu_button()
     else:
-        lines = ["🏆 *Топ-3 главных ценителя*\n_(по активности — EXP)_\n"]
-        for i, u in enumerate(leaders, 1):
-            medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
-            lines.append(f"{medal} {u['nickname']} — {u['exp']} EXP (ур. {u['level']})")
+        my_rank = await get_user_rank(user_id)
+        lines = [f"🏆 *Лидерборд* — топ-{LEADERBOARD_SIZE}, стр. {page + 1}/{total_pages}\n_(по активности — EXP)_\n"]
+        lines.extend(_leader_line(u) for u in leaders)
+        lines.append("━━━━━━━━━━━━━━━━")
+        lines.append(_my_rank_text(my_rank))
         text = "\n".join(lines) + "\n\n_Нажми на профиль, чтобы посмотреть полностью._"
-        kb = leaderboard_buttons(leaders)
+        kb = leaderboard_buttons(leaders, page=page, total_pages=total_pages)
     if query:
         try:
             await query.edit_message_text(text, parse_mode="Markdown", reply_markup=kb)
@@ -360,19 +392,9 @@ async def _send_profile_for_user(chat_id: int, target_user_id: int, context: Con
     Отправляет в chat_id полный профиль пользователя target_user_id (аватар, текст).
     edit_message — сообщение для редактирования (если без фото); иначе отправляем новое.
     """
-    profile = get_profile(target_user_id)
-    if not profile:
-        nickname = get_user_nickname(target_user_id) or f"User_{target_user_id}"
-        profile = {
-            "nickname": nickname,
-            "avatar_file_id": None,
-            "description": "",
-            "pinned_track_id": None,
-            "pinned_track_title": None,
-            "pinned_track_artist": None,
-        }
-    progress = get_user_progress(target_user_id)
-    text = _profile_text(profile, progress)
+    profile = await get_user_summary(target_user_id)
+    profile["nickname"] = profile["nickname"] or f"User_{target_user_id}"
+    text = _profile_text(profile)
     kb = back_to_leaderboard_button()
 
     if profile.get("avatar_file_id"):
@@ -402,7 +424,7 @@ async def _send_profile_for_user(chat_id: int, target_user_id: int, context: Con
 
 
 async def show_leader_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать полный профиль выбранного из лидерборда (топ-3): аватар, ник, описание, закреплённый трек."""
+    """Показать полный профиль выбранного из лидерборда: аватар, ник, описание, закреплённый трек."""
     query = update.callback_query
     if not query or not query.data or not query.data.startswith("leader_"):
         return
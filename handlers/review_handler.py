@@ -1,9 +1,10 @@
 # handlers/review_handler.py
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils import user_states, hash_id, hash_to_track_id
+from utils import user_states
+from callback_codec import resolve_track
 from keyboards import back_to_menu_button, cancel_review_button
-import sqlite3
+from db_async import get_track_reviews_with_text
 
 
 async def ask_for_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -18,12 +19,12 @@ async def ask_for_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not data.startswith("ask_review_"):
         return
 
-    track_hash = data.replace("ask_review_", "", 1)
-    if track_hash not in hash_to_track_id:
+    token = data.replace("ask_review_", "", 1)
+    track_id = await resolve_track(token)
+    if not track_id:
         await query.edit_message_text("❌ Данные устарели.", reply_markup=back_to_menu_button())
         return
 
-    track_id = hash_to_track_id[track_hash]
     user_id = query.from_user.id
 
     user_states[user_id] = {
@@ -61,22 +62,13 @@ async def show_reviews_for_track(update: Update, context: ContextTypes.DEFAULT_T
     if not data.startswith("reviews_for_track_"):
         return
 
-    track_hash = data.replace("reviews_for_track_", "", 1)
-    if track_hash not in hash_to_track_id:
+    token = data.replace("reviews_for_track_", "", 1)
+    track_id = await resolve_track(token)
+    if not track_id:
         await query.edit_message_text("❌ Трек не найден.", reply_markup=back_to_menu_button())
         return
 
-    track_id = hash_to_track_id[track_hash]
-    conn = sqlite3.connect('reviews.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT nickname, review_text, total, timestamp
-        FROM reviews
-        WHERE track_id = ? AND review_text IS NOT NULL AND review_text != ''
-        ORDER BY total DESC
-    ''', (track_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    rows = await get_track_reviews_with_text(track_id)
 
     if not rows:
         await query.edit_message_text(
@@ -86,8 +78,8 @@ async def show_reviews_for_track(update: Update, context: ContextTypes.DEFAULT_T
         return
 
     message = f"💬 *Рецензии по треку*\n\n"
-    for nickname, text, score, ts in rows:
-        nick_display = nickname or "Аноним"
+    for r in rows:
+        nick_display, text, score, ts = r["nickname"], r["text"], r["total"], r["timestamp"]
         try:
             date_part = ts.split()[0][5:].replace('-', '.')
             time_part = ts.split()[1][:5]
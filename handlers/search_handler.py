@@ -2,11 +2,14 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 from yandex import search_track
-from database import save_review
+from db_async import commit_rating, search_catalog
 from keyboards import rating_buttons, after_review_buttons, back_to_menu_button
 from utils import user_states, CRITERIA_NAMES
 from handlers.track_card_handler import send_track_card
 
+# Минимальная уверенность локального совпадения; ниже — ищем через API Яндекс.Музыки
+LOCAL_SEARCH_MIN_SCORE = 0.7
+
 
 async def start_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -26,8 +29,17 @@ async def handle_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if query.startswith('/'):
         return
 
+    user_id = update.message.from_user.id
+    local = await search_catalog(query, limit=1)
+    if local and local[0]["score"] >= LOCAL_SEARCH_MIN_SCORE:
+        track = local[0]["track"]
+        # Трек без загруженной из API карточки (обложка, жанр) карточка догрузит сама
+        await send_track_card(update.message, track["id"], user_id,
+                              track_dict=track if track.get("fetched_at") else None)
+        return
+
     await update.message.reply_text("🔍 Ищу трек...")
-    tracks = search_track(query, limit=1)
+    tracks = await search_track(query, limit=1)
 
     if not tracks:
         await update.message.reply_text(
@@ -36,7 +48,6 @@ async def handle_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    user_id = update.message.from_user.id
     await send_track_card(update.message, tracks[0]["id"], user_id, track_dict=tracks[0])
 
 
@@ -96,7 +107,7 @@ async def handle_rating_callback(update: Update, context: ContextTypes.DEFAULT_T
             )
             await query.edit_message_text(result_text, parse_mode='Markdown')
 
-            save_review(
+            await commit_rating(
                 user_id=user_id,
                 track_id=state['track_id'],
                 ratings=state['ratings'],
@@ -2,7 +2,7 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 from keyboards import main_menu
-from database import get_user_nickname, save_user_nickname, get_user_progress
+from db_async import save_user_nickname, get_user_summary
 from utils import user_states, level_progress_bar
 
 
@@ -11,7 +11,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Главное меню: Трек дня, Чарт, Найти трек, Моя статистика, Общая статистика, Топ треков.
     """
     user_id = update.message.from_user.id
-    nickname = get_user_nickname(user_id)
+    summary = await get_user_summary(user_id)
+    nickname = summary["nickname"]
 
     if not nickname:
         await update.message.reply_text(
@@ -22,8 +23,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     user_states[user_id] = {'stage': 'menu', 'nickname': nickname}
-    progress = get_user_progress(user_id)
-    lvl, exp = progress["level"], progress["exp"]
+    lvl, exp = summary["level"], summary["exp"]
     bar = level_progress_bar(lvl, exp)
 
     await update.message.reply_text(
@@ -47,7 +47,7 @@ async def handle_nickname(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Никнейм должен быть от 1 до 30 символов. Попробуй ещё раз:")
         return
 
-    save_user_nickname(user_id, text)
+    await save_user_nickname(user_id, text)
     user_states[user_id] = {'stage': 'menu', 'nickname': text}
 
     await update.message.reply_text(
@@ -75,10 +75,10 @@ async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await context.bot.delete_message(chat_id=cid, message_id=mid)
         except Exception:
             pass
-    nickname = get_user_nickname(user_id) or state.get("nickname") or "Пользователь"
+    summary = await get_user_summary(user_id)
+    nickname = summary["nickname"] or state.get("nickname") or "Пользователь"
     user_states[user_id] = {"stage": "menu", "nickname": nickname}
-    progress = get_user_progress(user_id)
-    lvl, exp = progress["level"], progress["exp"]
+    lvl, exp = summary["level"], summary["exp"]
     bar = level_progress_bar(lvl, exp)
     text = (
         f"🎵 *Главное меню*\n\n"
@@ -1,24 +1,34 @@
 # handlers/top_tracks_handler.py
-from telegram import Update, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database import get_top_tracks_by_rating
-from keyboards import back_to_menu_button
+from db_async import get_top_tracks_by_rating, get_genres
+from keyboards import genre_picker_rows
+from utils import genre_title
+
+TOP_GENRE_PREFIX = "top_genre"
 
 
 async def show_top_tracks(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Топ-10 по оценкам: show_top_tracks — все треки, top_genre_{жанр} — один жанр."""
     query = update.callback_query
     await query.answer()
+    data = query.data or ""
+    genre = data[len(TOP_GENRE_PREFIX) + 1:] if data.startswith(TOP_GENRE_PREFIX + "_") else None
 
-    top_tracks = get_top_tracks_by_rating(limit=10)
+    top_tracks = await get_top_tracks_by_rating(limit=10, genre=genre)
+    genres = await get_genres()
+    keyboard = genre_picker_rows(genres, TOP_GENRE_PREFIX, "show_top_tracks", current=genre) if genres else []
+    keyboard.append([InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")])
+    reply_markup = InlineKeyboardMarkup(keyboard)
 
     if not top_tracks:
-        await query.edit_message_text(
-            "Пока нет данных для рейтинга. Оцени больше треков!",
-            reply_markup=back_to_menu_button()
-        )
+        text = (f"В жанре «{genre_title(genre)}» пока нет оценённых треков." if genre
+                else "Пока нет данных для рейтинга. Оцени больше треков!")
+        await query.edit_message_text(text, reply_markup=reply_markup)
         return
 
-    message = "🏆 *Топ-10 треков по оценкам*\n\n"
+    title = f"🏆 *Топ-10 треков: {genre_title(genre)}*" if genre else "🏆 *Топ-10 треков по оценкам*"
+    message = title + "\n\n"
     for i, t in enumerate(top_tracks, 1):
         stars = "⭐" * (max(1, int(t['avg_score'] / 10)))  # Примерная визуализация
         message += (
@@ -27,4 +37,4 @@ async def show_top_tracks(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"   {stars}\n\n"
         )
 
-    await query.edit_message_text(message, parse_mode='Markdown', reply_markup=back_to_menu_button())
\ No newline at end of file
+    await query.edit_message_text(message, parse_mode='Markdown', reply_markup=reply_markup)
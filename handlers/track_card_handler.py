@@ -8,47 +8,80 @@ from telegram.ext import ContextTypes
 from telegram.error import TimedOut, BadRequest
 from yandex_music_service import get_track_by_id, download_track_bytes
 import config
-from database import is_in_favorites, add_favorite, remove_favorite, add_exp, add_download, get_track_rating_stats
+import track_cache
+from db_async import (
+    is_in_favorites,
+    add_favorite,
+    remove_favorite,
+    add_exp,
+    add_download,
+    get_track_rating_stats,
+    get_user_nickname,
+    get_catalog_track,
+)
 from keyboards import track_card_buttons, rating_buttons
-from utils import user_states, hash_to_track_id, CRITERIA_NAMES, EXP_FOR_FAVORITE
-from database import get_user_nickname
+from utils import user_states, CRITERIA_NAMES, EXP_FOR_FAVORITE
+from callback_codec import resolve_track
 
 
-def _get_track_dict(track_id, track_dict=None):
-    """Возвращает словарь трека: либо переданный, либо загрузка по id."""
+async def _get_track_dict(track_id, track_dict=None):
+    """
+    Возвращает словарь трека: переданный или по id — из кэша метаданных, свежей записи
+    локального каталога или Яндекс.Музыки (см. get_track_by_id).
+    """
     if track_dict and isinstance(track_dict, dict) and track_dict.get("id"):
         return track_dict
-    return get_track_by_id(track_id)
+    return await get_track_by_id(track_id)
 
 
-def build_card_caption(track):
-    """Текст карточки: название, исполнитель, жанр; средний балл из БД при наличии."""
+async def _get_track_brief(track_id):
+    """
+    Название, исполнитель и ссылка трека для действий без перерисовки карточки (избранное):
+    кэш метаданных, затем запись каталога без проверки свежести; к API — только если трека
+    в каталоге нет. Срок свежести каталога (track_cache.DISK_TTL) — только для карточки.
+    """
+    track = track_cache.cache.get(track_id)
+    if track:
+        return track
+    try:
+        track = await get_catalog_track(track_id)
+    except Exception as e:
+        print(f"track_card_handler catalog read error: {e}")
+        track = None
+    return track or await get_track_by_id(track_id)
+
+
+def build_card_caption(track, stats=None):
+    """Текст карточки: название, исполнитель, жанр; средний балл из БД (stats) при наличии."""
     title = track.get("title", "Без названия")
     artist = track.get("artist", "Неизвестен")
     genre = track.get("genre", "—")
     lines = [f"🎧 *{title}*", f"👤 {artist}", f"🏷 {genre}"]
-    track_id = track.get("id")
-    if track_id:
-        stats = get_track_rating_stats(track_id)
-        if stats:
-            lines.append(f"📊 Средний балл: {stats['avg']}/50, оценок: {stats['count']}")
+    if stats:
+        lines.append(f"📊 Средний балл: {stats['avg']}/50, оценок: {stats['count']}")
     lines.append("━━━━━━━━━━━━━━━━")
     return "\n".join(lines)
 
 
+async def card_caption(track):
+    """Подпись карточки со статистикой оценок, загруженной из БД."""
+    stats = await get_track_rating_stats(track["id"]) if track.get("id") else None
+    return build_card_caption(track, stats)
+
+
 async def send_track_card(message_or_query, track_id, user_id, track_dict=None, parse_mode="Markdown"):
     """
     Отправляет карточку трека (фото + подпись + кнопки).
     message_or_query — объект message (для reply_photo) или callback_query (для answer + reply_photo от имени message).
     """
-    track = _get_track_dict(track_id, track_dict)
+    track = await _get_track_dict(track_id, track_dict)
     if not track:
         if hasattr(message_or_query, "reply_text"):
             await message_or_query.reply_text("❌ Не удалось загрузить трек.")
         return None
-    caption = build_card_caption(track)
+    caption = await card_caption(track)
     url = track.get("track_url") or f"https://music.yandex.ru/search?text={track.get('artist', '')}+{track.get('title', '')}"
-    in_fav = is_in_favorites(user_id, track["id"])
+    in_fav = await is_in_favorites(user_id, track["id"])
     markup = track_card_buttons(track["id"], url, in_fav)
     photo = track.get("cover_url") or None
     msg = getattr(message_or_query, "message", message_or_query)
@@ -60,25 +93,25 @@ async def send_track_card(message_or_query, track_id, user_id, track_dict=None,
 
 
 async def handle_chart_track(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Callback chart_track_{hash} — показать карточку выбранного трека из чарта."""
+    """Callback chart_track_{токен} — показать карточку выбранного трека из чарта."""
     query = update.callback_query
     await query.answer()
     data = query.data
     if not data.startswith("chart_track_"):
         return
-    track_hash = data.replace("chart_track_", "", 1)
-    if track_hash not in hash_to_track_id:
+    token = data.replace("chart_track_", "", 1)
+    track_id = await resolve_track(token)
+    if not track_id:
         await query.edit_message_text("❌ Трек не найден.", reply_markup=None)
         return
-    track_id = hash_to_track_id[track_hash]
     user_id = query.from_user.id
-    track = _get_track_dict(track_id)
+    track = await _get_track_dict(track_id)
     if not track:
         await query.edit_message_text("❌ Не удалось загрузить трек.")
         return
-    caption = build_card_caption(track)
+    caption = await card_caption(track)
     url = track.get("track_url") or ""
-    in_fav = is_in_favorites(user_id, track["id"])
+    in_fav = await is_in_favorites(user_id, track["id"])
     markup = track_card_buttons(track["id"], url, in_fav)
     photo = track.get("cover_url")
     try:
@@ -92,25 +125,25 @@ async def handle_chart_track(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 
 async def handle_playlist_track(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Callback playlist_track_{hash} — карточка трека из плейлиста (как в чарте)."""
+    """Callback playlist_track_{токен} — карточка трека из плейлиста (как в чарте)."""
     query = update.callback_query
     await query.answer()
     data = query.data
     if not data.startswith("playlist_track_"):
         return
-    track_hash = data.replace("playlist_track_", "", 1)
-    if track_hash not in hash_to_track_id:
+    token = data.replace("playlist_track_", "", 1)
+    track_id = await resolve_track(token)
+    if not track_id:
         await query.edit_message_text("❌ Трек не найден.", reply_markup=None)
         return
-    track_id = hash_to_track_id[track_hash]
     user_id = query.from_user.id
-    track = _get_track_dict(track_id)
+    track = await _get_track_dict(track_id)
     if not track:
         await query.edit_message_text("❌ Не удалось загрузить трек.")
         return
-    caption = build_card_caption(track)
+    caption = await card_caption(track)
     url = track.get("track_url") or ""
-    in_fav = is_in_favorites(user_id, track["id"])
+    in_fav = await is_in_favorites(user_id, track["id"])
     markup = track_card_buttons(track["id"], url, in_fav)
     photo = track.get("cover_url")
     try:
@@ -124,25 +157,25 @@ async def handle_playlist_track(update: Update, context: ContextTypes.DEFAULT_TY
 
 
 async def handle_search_track(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Callback search_track_{hash} — карточка трека из результатов поиска."""
+    """Callback search_track_{токен} — карточка трека из результатов поиска."""
     query = update.callback_query
     await query.answer()
     data = query.data
     if not data.startswith("search_track_"):
         return
-    track_hash = data.replace("search_track_", "", 1)
-    if track_hash not in hash_to_track_id:
+    token = data.replace("search_track_", "", 1)
+    track_id = await resolve_track(token)
+    if not track_id:
         await query.edit_message_text("❌ Трек не найден.", reply_markup=None)
         return
-    track_id = hash_to_track_id[track_hash]
     user_id = query.from_user.id
-    track = _get_track_dict(track_id)
+    track = await _get_track_dict(track_id)
     if not track:
         await query.edit_message_text("❌ Не удалось загрузить трек.")
         return
-    caption = build_card_caption(track)
+    caption = await card_caption(track)
     url = track.get("track_url") or ""
-    in_fav = is_in_favorites(user_id, track["id"])
+    in_fav = await is_in_favorites(user_id, track["id"])
     markup = track_card_buttons(track["id"], url, in_fav)
     photo = track.get("cover_url")
     try:
@@ -156,23 +189,23 @@ async def handle_search_track(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 
 async def handle_rate_track(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Callback rate_track_{hash} — начать оценку трека (переход в состояние rating)."""
+    """Callback rate_track_{токен} — начать оценку трека (переход в состояние rating)."""
     query = update.callback_query
     await query.answer()
     data = query.data
     if not data.startswith("rate_track_"):
         return
-    track_hash = data.replace("rate_track_", "", 1)
-    if track_hash not in hash_to_track_id:
+    token = data.replace("rate_track_", "", 1)
+    track_id = await resolve_track(token)
+    if not track_id:
         await query.answer("❌ Трек не найден.", show_alert=True)
         return
-    track_id = hash_to_track_id[track_hash]
     user_id = query.from_user.id
-    track = _get_track_dict(track_id)
+    track = await _get_track_dict(track_id)
     if not track:
         await query.answer("❌ Не удалось загрузить трек.", show_alert=True)
         return
-    nickname = get_user_nickname(user_id) or user_states.get(user_id, {}).get("nickname", "Аноним")
+    nickname = await get_user_nickname(user_id) or user_states.get(user_id, {}).get("nickname", "Аноним")
     user_states[user_id] = {
         "stage": "rating",
         "track_id": track_id,
@@ -216,17 +249,17 @@ def _download_key(user_id: int, track_id: str):
 
 
 async def handle_download_track(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Callback download_track_{hash} — скачать трек через API и отправить пользователю файлом."""
+    """Callback download_track_{токен} — скачать трек через API и отправить пользователю файлом."""
     query = update.callback_query
     data = query.data
     if not data.startswith("download_track_"):
         await query.answer()
         return
-    track_hash = data.replace("download_track_", "", 1)
-    if track_hash not in hash_to_track_id:
+    token = data.replace("download_track_", "", 1)
+    track_id = await resolve_track(token)
+    if not track_id:
         await query.answer("❌ Трек не найден.", show_alert=True)
         return
-    track_id = hash_to_track_id[track_hash]
     user_id = query.from_user.id
     key = _download_key(user_id, track_id)
     if key in _downloading:
@@ -240,7 +273,7 @@ async def handle_download_track(update: Update, context: ContextTypes.DEFAULT_TY
         status_msg = await query.message.reply_text(
             "⏳ _Загружаю трек из Яндекс.Музыки..._", parse_mode="Markdown"
         )
-        audio_bytes, title, performer = download_track_bytes(track_id)
+        audio_bytes, title, performer = await download_track_bytes(track_id)
 
         if not audio_bytes or len(audio_bytes) == 0:
             if status_msg:
@@ -279,7 +312,7 @@ async def handle_download_track(update: Update, context: ContextTypes.DEFAULT_TY
                         title=title[:64] if title else None,
                         performer=performer[:64] if performer else None,
                     )
-                    add_download(
+                    await add_download(
                         user_id, track_id,
                         title or "Без названия", performer or "Неизвестен",
                         message_id=storage_msg.message_id,
@@ -294,14 +327,14 @@ async def handle_download_track(update: Update, context: ContextTypes.DEFAULT_TY
                         "Не удалось отправить трек в хранилище (STORAGE_CHAT_ID): %s. Сохраняю сообщение пользователя.",
                         e,
                     )
-                    add_download(
+                    await add_download(
                         user_id, track_id,
                         title or "Без названия", performer or "Неизвестен",
                         message_id=audio_msg.message_id,
                         chat_id=audio_msg.chat_id,
                     )
             else:
-                add_download(
+                await add_download(
                     user_id, track_id,
                     title or "Без названия", performer or "Неизвестен",
                     message_id=audio_msg.message_id,
@@ -331,33 +364,33 @@ async def handle_download_track(update: Update, context: ContextTypes.DEFAULT_TY
 
 
 async def handle_fav_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Callback fav_toggle_{hash} — добавить/убрать из избранного и обновить кнопку."""
+    """Callback fav_toggle_{токен} — добавить/убрать из избранного и обновить кнопку."""
     query = update.callback_query
     await query.answer()
     data = query.data
     if not data.startswith("fav_toggle_"):
         return
-    track_hash = data.replace("fav_toggle_", "", 1)
-    if track_hash not in hash_to_track_id:
+    token = data.replace("fav_toggle_", "", 1)
+    track_id = await resolve_track(token)
+    if not track_id:
         await query.answer("❌ Трек не найден.", show_alert=True)
         return
-    track_id = hash_to_track_id[track_hash]
     user_id = query.from_user.id
-    track = _get_track_dict(track_id)
+    track = await _get_track_brief(track_id)
     if not track:
         await query.answer("❌ Ошибка загрузки трека.", show_alert=True)
         return
     url = track.get("track_url") or ""
-    in_fav = is_in_favorites(user_id, track_id)
+    in_fav = await is_in_favorites(user_id, track_id)
     if in_fav:
-        remove_favorite(user_id, track_id)
+        await remove_favorite(user_id, track_id)
         in_fav = False
     else:
-        add_favorite(user_id, track_id, track["title"], track["artist"])
-        add_exp(user_id, EXP_FOR_FAVORITE)
+        await add_favorite(user_id, track_id, track["title"], track["artist"])
+        await add_exp(user_id, EXP_FOR_FAVORITE)
         in_fav = True
     markup = track_card_buttons(track_id, url, in_fav)
-    caption = build_card_caption(track)
+    caption = await card_caption(track)
     try:
         await query.edit_message_reply_markup(reply_markup=markup)
     except Exception:
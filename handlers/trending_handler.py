@@ -0,0 +1,39 @@
+# handlers/trending_handler.py
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from db_async import get_trending
+
+# callback_data → (окно в часах, подпись)
+TRENDING_WINDOWS = {
+    "trending_24h": (24, "за сутки"),
+    "trending_7d": (168, "за неделю"),
+}
+
+
+def _trending_buttons(current):
+    row = [
+        InlineKeyboardButton(("• " if data == current else "") + label.capitalize(), callback_data=data)
+        for data, (_, label) in TRENDING_WINDOWS.items()
+    ]
+    return InlineKeyboardMarkup([row, [InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")]])
+
+
+async def show_trending(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """«В тренде»: show_trending / trending_24h — за сутки, trending_7d — за неделю."""
+    query = update.callback_query
+    await query.answer()
+    data = query.data if query.data in TRENDING_WINDOWS else "trending_24h"
+    hours, label = TRENDING_WINDOWS[data]
+
+    tracks = await get_trending(hours=hours, limit=10)
+    if not tracks:
+        await query.edit_message_text(
+            f"🔥 {label.capitalize()} треки ещё не оценивали. Оцени что-нибудь первым!",
+            reply_markup=_trending_buttons(data),
+        )
+        return
+
+    lines = [f"🔥 *В тренде {label}*\n"]
+    for i, t in enumerate(tracks, 1):
+        lines.append(f"{i}. *{t['title']}* — {t['artist']}\n   {t['count']} оценок, в среднем {t['avg_score']}/50\n")
+    await query.edit_message_text("".join(lines), parse_mode="Markdown", reply_markup=_trending_buttons(data))
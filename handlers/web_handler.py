@@ -2,7 +2,7 @@
 from telegram import Update
 from telegram.ext import ContextTypes, MessageHandler, filters
 import json
-from database import save_review
+from db_async import commit_rating
 
 
 async def handle_webapp_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -14,7 +14,7 @@ async def handle_webapp_data(update: Update, context: ContextTypes.DEFAULT_TYPE)
         review = json.loads(data)
 
         # Сохраняем оценку
-        save_review(
+        await commit_rating(
             user_id=review['user_id'],
             track_id=review['track_id'],
             ratings=review['ratings'],
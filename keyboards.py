@@ -10,12 +10,14 @@ def main_menu():
         [InlineKeyboardButton("🌞 Трек дня", callback_data="show_daily_track")],
         [InlineKeyboardButton("📊 Чарт Яндекс Музыки", callback_data="show_chart")],
         [InlineKeyboardButton("🎧 Найти трек", callback_data="start_search")],
+        [InlineKeyboardButton("🔎 Поиск по рецензиям", callback_data="start_find")],
         [InlineKeyboardButton("📑 Треки из плейлиста", callback_data="start_playlist")],
         [InlineKeyboardButton("🤍 Моё избранное", callback_data="view_favorites")],
         [InlineKeyboardButton("📥 Мои скачанные", callback_data="view_downloads")],
         [InlineKeyboardButton("📋 Моя статистика", callback_data="view_reviews")],
         [InlineKeyboardButton("🌍 Общая статистика", callback_data="view_global_reviews")],
         [InlineKeyboardButton("🏆 Топ треков", callback_data="show_top_tracks")],
+        [InlineKeyboardButton("🔥 В тренде", callback_data="show_trending")],
     ]
     return InlineKeyboardMarkup(keyboard)
 
@@ -29,15 +31,29 @@ def profile_view_buttons():
     ])
 
 
-def leaderboard_buttons(leaders):
+def leaderboard_buttons(leaders, page=0, total_pages=1):
     """
-    Кнопки лидерборда: топ-3 — «Профиль» для просмотра профиля.
-    leaders — список dict с ключом user_id (первые 3).
+    Кнопки лидерборда: «Профиль» для каждого на странице (по 2 в ряд), пагинация, назад.
+    leaders — список dict с ключами user_id, nickname, rank.
     """
     buttons = []
-    for u in leaders[:3]:
-        label = f"👤 {u.get('nickname', 'User')[:25]}"
-        buttons.append([InlineKeyboardButton(label, callback_data=f"leader_{u['user_id']}")])
+    row = []
+    for u in leaders:
+        label = f"{u.get('rank', '')}. {u.get('nickname', 'User')[:20]}".lstrip(". ")
+        row.append(InlineKeyboardButton(label, callback_data=f"leader_{u['user_id']}"))
+        if len(row) == 2:
+            buttons.append(row)
+            row = []
+    if row:
+        buttons.append(row)
+    if total_pages > 1:
+        nav = []
+        if page > 0:
+            nav.append(InlineKeyboardButton("◀ Назад", callback_data=f"leaderboard_page_{page - 1}"))
+        nav.append(InlineKeyboardButton(f"Стр. {page + 1}/{total_pages}", callback_data="noop"))
+        if page < total_pages - 1:
+            nav.append(InlineKeyboardButton("Вперёд ▶", callback_data=f"leaderboard_page_{page + 1}"))
+        buttons.append(nav)
     buttons.append([InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")])
     return InlineKeyboardMarkup(buttons)
 
@@ -61,16 +77,15 @@ def profile_edit_buttons():
 
 
 def profile_pin_track_buttons(tracks, page=0, per_page=8):
-    """Список треков для закрепления: из оценок/избранного. callback pin_track_{hash}."""
-    from utils import hash_id, hash_to_track_id
+    """Список треков для закрепления: из оценок/избранного. callback pin_track_{токен}."""
+    from callback_codec import encode_track
     start = page * per_page
     chunk = tracks[start : start + per_page]
     buttons = []
     for t in chunk:
-        safe_hash = hash_id(t["track_id"])
-        hash_to_track_id[safe_hash] = t["track_id"]
+        token = encode_track(t["track_id"])
         label = f"{t.get('title', t.get('track_title', ''))} — {t.get('artist', t.get('track_artist', ''))}"[:50]
-        buttons.append([InlineKeyboardButton(label, callback_data=f"pin_track_{safe_hash}")])
+        buttons.append([InlineKeyboardButton(label, callback_data=f"pin_track_{token}")])
     total_pages = (len(tracks) + per_page - 1) // per_page if tracks else 1
     nav = []
     if page > 0:
@@ -110,6 +125,19 @@ def cancel_review_button():
     ])
 
 
+def genre_picker_rows(genres, prefix, all_callback, current=None, per_row=3):
+    """
+    Ряды кнопок выбора жанра: «Все жанры» (all_callback) и {prefix}_{жанр}.
+    Текущий выбор отмечен «•»; жанры со слишком длинным кодом для callback_data пропускаются.
+    """
+    from utils import genre_title
+    items = [("Все жанры", all_callback, current is None)]
+    items += [(genre_title(g), f"{prefix}_{g}", g == current) for g in genres if len(f"{prefix}_{g}".encode()) <= 64]
+    buttons = [InlineKeyboardButton(f"• {label}" if active else label, callback_data=data)
+               for label, data, active in items]
+    return [buttons[i:i + per_row] for i in range(0, len(buttons), per_row)]
+
+
 def back_to_list_button(back_callback: str):
     """Кнопка «Назад» к списку (callback_data = back_callback)"""
     return InlineKeyboardMarkup([
@@ -120,15 +148,14 @@ def back_to_list_button(back_callback: str):
 def after_review_buttons(track_id=None):
     """
     Кнопки после оценки: написать рецензию, скачать, избранное, назад.
-    track_id — для ask_review_ и favorite_ (передаётся как hash).
+    track_id — для ask_review_ и favorite_ (передаётся токеном callback_codec).
     """
-    from utils import hash_id, hash_to_track_id
+    from callback_codec import encode_track
     buttons = []
     if track_id:
-        safe_hash = hash_id(track_id)
-        hash_to_track_id[safe_hash] = track_id
+        token = encode_track(track_id)
         buttons.append([
-            InlineKeyboardButton("✍️ Рецензия", callback_data=f"ask_review_{safe_hash}"),
+            InlineKeyboardButton("✍️ Рецензия", callback_data=f"ask_review_{token}"),
         ])
     buttons.append([InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")])
     return InlineKeyboardMarkup(buttons)
@@ -139,19 +166,18 @@ def track_card_buttons(track_id: str, track_url: str, in_favorites: bool):
     Клавиатура карточки трека: Оценить | Рецензия | Скачать (файл) | В избранное, Назад.
     Скачать — callback: бот скачивает трек через API и отправляет пользователю.
     """
-    from utils import hash_id, hash_to_track_id
-    safe_hash = hash_id(track_id)
-    hash_to_track_id[safe_hash] = track_id
+    from callback_codec import encode_track
+    token = encode_track(track_id)
 
     row1 = [
-        InlineKeyboardButton("⭐ Оценить", callback_data=f"rate_track_{safe_hash}"),
-        InlineKeyboardButton("✍️ Рецензия", callback_data=f"ask_review_{safe_hash}"),
+        InlineKeyboardButton("⭐ Оценить", callback_data=f"rate_track_{token}"),
+        InlineKeyboardButton("✍️ Рецензия", callback_data=f"ask_review_{token}"),
     ]
     row2 = [
-        InlineKeyboardButton("📥 Скачать", callback_data=f"download_track_{safe_hash}"),
+        InlineKeyboardButton("📥 Скачать", callback_data=f"download_track_{token}"),
         InlineKeyboardButton(
             "❤️ Убрать из избранного" if in_favorites else "🤍 В избранное",
-            callback_data=f"fav_toggle_{safe_hash}"
+            callback_data=f"fav_toggle_{token}"
         ),
     ]
     row3 = [InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")]
@@ -160,16 +186,15 @@ def track_card_buttons(track_id: str, track_url: str, in_favorites: bool):
 
 def chart_list_buttons(tracks):
     """
-    Список кнопок для чарта: каждая — callback chart_track_{hash}.
+    Список кнопок для чарта: каждая — callback chart_track_{токен}.
     tracks — список dict с ключами id, title, artist (для подписи кнопки).
     """
-    from utils import hash_id, hash_to_track_id
+    from callback_codec import encode_track
     buttons = []
     for t in tracks:
-        safe_hash = hash_id(t["id"])
-        hash_to_track_id[safe_hash] = t["id"]
+        token = encode_track(t["id"])
         label = f"{t['title']} — {t['artist']}"[:60]
-        buttons.append([InlineKeyboardButton(label, callback_data=f"chart_track_{safe_hash}")])
+        buttons.append([InlineKeyboardButton(label, callback_data=f"chart_track_{token}")])
     buttons.append([InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")])
     return InlineKeyboardMarkup(buttons)
 
@@ -185,13 +210,12 @@ def chart_list_buttons_paginated(tracks, page=0, per_page=None):
     per_page = per_page or CHART_PAGE_SIZE
     start = page * per_page
     chunk = tracks[start : start + per_page]
-    from utils import hash_id, hash_to_track_id
+    from callback_codec import encode_track
     buttons = []
     for t in chunk:
-        safe_hash = hash_id(t["id"])
-        hash_to_track_id[safe_hash] = t["id"]
+        token = encode_track(t["id"])
         label = f"{t['title']} — {t['artist']}"[:60]
-        buttons.append([InlineKeyboardButton(label, callback_data=f"chart_track_{safe_hash}")])
+        buttons.append([InlineKeyboardButton(label, callback_data=f"chart_track_{token}")])
     total_pages = (len(tracks) + per_page - 1) // per_page if tracks else 1
     nav = []
     if page > 0:
@@ -209,18 +233,17 @@ PLAYLIST_PAGE_SIZE = 10
 
 def playlist_list_buttons_paginated(tracks, page=0, per_page=None):
     """
-    Плейлист с пагинацией по 10 треков: callback playlist_track_{hash}, playlist_page_N.
+    Плейлист с пагинацией по 10 треков: callback playlist_track_{токен}, playlist_page_N.
     """
     per_page = per_page or PLAYLIST_PAGE_SIZE
     start = page * per_page
     chunk = tracks[start : start + per_page]
-    from utils import hash_id, hash_to_track_id
+    from callback_codec import encode_track
     buttons = []
     for t in chunk:
-        safe_hash = hash_id(t["id"])
-        hash_to_track_id[safe_hash] = t["id"]
+        token = encode_track(t["id"])
         label = f"{t['title']} — {t['artist']}"[:60]
-        buttons.append([InlineKeyboardButton(label, callback_data=f"playlist_track_{safe_hash}")])
+        buttons.append([InlineKeyboardButton(label, callback_data=f"playlist_track_{token}")])
     total_pages = (len(tracks) + per_page - 1) // per_page if tracks else 1
     nav = []
     if page > 0:
@@ -235,16 +258,15 @@ def playlist_list_buttons_paginated(tracks, page=0, per_page=None):
 
 def search_list_buttons(tracks):
     """
-    Список результатов поиска: каждая кнопка — search_track_{hash}.
+    Список результатов поиска: каждая кнопка — search_track_{токен}.
     tracks — список dict с ключами id, title, artist.
     """
-    from utils import hash_id, hash_to_track_id
+    from callback_codec import encode_track
     buttons = []
     for t in tracks:
-        safe_hash = hash_id(t["id"])
-        hash_to_track_id[safe_hash] = t["id"]
+        token = encode_track(t["id"])
         label = f"{t['title']} — {t['artist']}"[:60]
-        buttons.append([InlineKeyboardButton(label, callback_data=f"search_track_{safe_hash}")])
+        buttons.append([InlineKeyboardButton(label, callback_data=f"search_track_{token}")])
     buttons.append([InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")])
     return InlineKeyboardMarkup(buttons)
 
@@ -252,30 +274,57 @@ def search_list_buttons(tracks):
 REVIEWS_PAGE_SIZE = 10
 
 
-def reviews_list_buttons_paginated(reviews, page=0, per_page=None, fav_count=0):
+def keyset_nav_row(prefix, items, page, total_pages):
+    """
+    Навигация по списку с курсором: ◀ Назад | Стр. N/M | Вперёд ▶.
+    items — строки текущей страницы (с timestamp и track_id); курсор берётся с краёв страницы.
+    """
+    from utils import page_cursor
+    nav = []
+    if page > 0 and items:
+        nav.append(InlineKeyboardButton("◀ Назад", callback_data=f"{prefix}_p_{page - 1}_{page_cursor(items[0])}"))
+    nav.append(InlineKeyboardButton(f"Стр. {page + 1}/{max(total_pages, 1)}", callback_data="noop"))
+    if page < total_pages - 1 and items:
+        nav.append(InlineKeyboardButton("Вперёд ▶", callback_data=f"{prefix}_n_{page + 1}_{page_cursor(items[-1])}"))
+    return nav
+
+
+def reviews_list_buttons_paginated(reviews, page=0, total_pages=1, fav_count=0):
     """
     Список «Мои оценки» с пагинацией.
-    reviews — полный список, page — номер страницы.
-    Кнопки: detail_{hash}, навигация view_reviews_page_N, Назад в меню.
+    reviews — строки текущей страницы, page — номер страницы, total_pages — всего страниц.
+    Кнопки: detail_{токен}, навигация view_reviews_n/p_N_{курсор}, Назад в меню.
     """
-    per_page = per_page or REVIEWS_PAGE_SIZE
-    from utils import hash_id, hash_to_track_id
-    start = page * per_page
-    chunk = reviews[start : start + per_page]
+    from callback_codec import encode_track
     fav_label = f"🤍 Моё избранное ({fav_count})" if fav_count is not None else "🤍 Моё избранное"
     buttons = [[InlineKeyboardButton(fav_label, callback_data="view_favorites")]]
-    for r in chunk:
-        safe_hash = hash_id(r["track_id"])
-        hash_to_track_id[safe_hash] = r["track_id"]
+    for r in reviews:
+        token = encode_track(r["track_id"])
         text = f"{r['title']} — {r['artist']} | {r['total']}/50"[:60]
-        buttons.append([InlineKeyboardButton(text, callback_data=f"detail_{safe_hash}")])
-    total_pages = (len(reviews) + per_page - 1) // per_page if reviews else 1
-    nav = []
-    if page > 0:
-        nav.append(InlineKeyboardButton("◀ Назад", callback_data=f"view_reviews_page_{page - 1}"))
-    nav.append(InlineKeyboardButton(f"Стр. {page + 1}/{total_pages}", callback_data="noop"))
-    if page < total_pages - 1:
-        nav.append(InlineKeyboardButton("Вперёд ▶", callback_data=f"view_reviews_page_{page + 1}"))
-    buttons.append(nav)
+        buttons.append([InlineKeyboardButton(text, callback_data=f"detail_{token}")])
+    buttons.append(keyset_nav_row("view_reviews", reviews, page, total_pages))
+    buttons.append([InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")])
+    return InlineKeyboardMarkup(buttons)
+
+
+def favorites_list_buttons(favorites, page=0, total_pages=1):
+    """Страница «Моё избранное»: кнопки chart_track_{токен}, навигация view_favorites_n/p_N_{курсор}."""
+    from callback_codec import encode_track
+    buttons = []
+    for f in favorites:
+        token = encode_track(f["track_id"])
+        label = f"{f['title']} — {f['artist']}"[:60]
+        buttons.append([InlineKeyboardButton(label, callback_data=f"chart_track_{token}")])
+    if total_pages > 1:
+        buttons.append(keyset_nav_row("view_favorites", favorites, page, total_pages))
+    buttons.append([InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")])
+    return InlineKeyboardMarkup(buttons)
+
+
+def downloads_page_buttons(downloads, page=0, total_pages=1):
+    """Под отправленной страницей «Мои скачанные»: навигация view_downloads_n/p_N_{курсор} и Назад в меню."""
+    buttons = []
+    if total_pages > 1:
+        buttons.append(keyset_nav_row("view_downloads", downloads, page, total_pages))
     buttons.append([InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")])
     return InlineKeyboardMarkup(buttons)
@@ -0,0 +1,95 @@
+# leaderboard.py
+"""
+Рейтинг пользователей по EXP в памяти.
+
+Отсортированный список ключей (-exp, user_id): место пользователя, страница топа и соседи
+находятся двоичным поиском за O(log n) вместо COUNT(*) WHERE exp > ? по таблице.
+Индекс заполняется из user_progress и обновляется при каждом начислении EXP (database.add_exp).
+
+Начисление — O(n): удаление и вставка в список сдвигают хвост (memmove указателей, для
+100 тыс. пользователей — десятки микросекунд), зато чтение топа и мест — срез и bisect без
+дополнительных структур. Если пользователей станет на порядки больше, список ключей стоит
+заменить деревом или списком блоков.
+Все методы берут блокировку: индекс читают потоки пула чтения, пока поток БД начисляет EXP.
+"""
+import bisect
+import threading
+
+
+class RankIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []  # [(-exp, user_id)], по возрастанию = по убыванию EXP
+        self._exp = {}  # user_id -> exp
+
+    def load(self, rows):
+        """rows — итерируемое (user_id, exp)."""
+        with self._lock:
+            self._exp = {user_id: exp or 0 for user_id, exp in rows}
+            self._keys = sorted((-exp, user_id) for user_id, exp in self._exp.items())
+
+    def add(self, user_id, delta):
+        """Прибавляет delta к EXP пользователя (новый пользователь стартует с 0)."""
+        with self._lock:
+            old = self._exp.get(user_id)
+            if old is not None:
+                i = bisect.bisect_left(self._keys, (-old, user_id))
+                del self._keys[i]
+            new = (old or 0) + delta
+            self._exp[user_id] = new
+            bisect.insort(self._keys, (-new, user_id))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._keys)
+
+    def exp(self, user_id):
+        with self._lock:
+            return self._exp.get(user_id)
+
+    def rank(self, user_id):
+        """Место (1 = лучший): число пользователей с большим EXP + 1. None, если пользователя нет."""
+        with self._lock:
+            exp = self._exp.get(user_id)
+            if exp is None:
+                return None
+            return bisect.bisect_left(self._keys, (-exp,)) + 1
+
+    def page(self, offset, limit):
+        """[(rank, user_id, exp)] для позиций offset..offset+limit-1."""
+        with self._lock:
+            chunk = self._keys[offset:offset + limit]
+            return [(bisect.bisect_left(self._keys, (neg,)) + 1, uid, -neg) for neg, uid in chunk]
+
+    def neighbours(self, user_id, count=1):
+        """(выше, ниже) — до count соседей над и под пользователем: [(rank, user_id, exp)]."""
+        with self._lock:
+            exp = self._exp.get(user_id)
+            if exp is None:
+                return [], []
+            return self._neighbours(user_id, exp, count)
+
+    def position(self, user_id, count=1):
+        """
+        (rank, total, exp, above, below) одним снимком под блокировкой (для database.get_user_rank).
+        None, если пользователя нет.
+        """
+        with self._lock:
+            exp = self._exp.get(user_id)
+            if exp is None:
+                return None
+            above, below = self._neighbours(user_id, exp, count)
+            rank = bisect.bisect_left(self._keys, (-exp,)) + 1
+            return rank, len(self._keys), exp, above, below
+
+    def _neighbours(self, user_id, exp, count):
+        # Под self._lock
+        i = bisect.bisect_left(self._keys, (-exp, user_id))
+
+        def entry(j):
+            neg, uid = self._keys[j]
+            return bisect.bisect_left(self._keys, (neg,)) + 1, uid, -neg
+
+        above = [entry(j) for j in range(max(0, i - count), i)]
+        below = [entry(j) for j in range(i + 1, min(len(self._keys), i + 1 + count))]
+        return above, below
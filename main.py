@@ -1,4 +1,5 @@
 # main.py
+import asyncio
 from telegram.ext import (
     Application,
     ApplicationBuilder,
@@ -11,7 +12,6 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.request import HTTPXRequest
 import config
-import sqlite3
 
 # Импортируем обработчики
 from handlers.start_handler import start, handle_nickname, back_to_menu
@@ -19,6 +19,7 @@ from handlers.search_handler import start_search, handle_search, handle_rating_c
 from handlers.daily_track_handler import show_daily_track
 from handlers.chart_handler import show_chart
 from handlers.top_tracks_handler import show_top_tracks
+from handlers.trending_handler import show_trending
 from handlers.my_reviews_db_handler import view_reviews, show_detail_review, view_favorites, view_downloads
 from handlers.global_reviews_handler import (
     show_general_stats,
@@ -39,6 +40,7 @@ from handlers.track_card_handler import (
     handle_download_track,
 )
 from handlers.commands_handler import cmd_chart, cmd_daily, cmd_stats, cmd_search, cmd_info
+from handlers.find_handler import cmd_find, start_find, handle_find_query
 from handlers.playlist_handler import start_playlist, handle_playlist_link, show_playlist_page
 from handlers.profile_handler import (
     show_profile,
@@ -57,9 +59,15 @@ from handlers.profile_handler import (
     handle_profile_description_text,
 )
 from handlers.web_handler import webapp_handler
-from database import init_db, add_exp
-from utils import user_states, EXP_FOR_REVIEW
-from keyboards import after_review_buttons
+from handlers.admin_handler import cmd_backup, cmd_dbstats
+from database import init_db
+import db_async
+import backup
+import maintenance
+import sessions
+import callback_codec
+from utils import user_states
+from keyboards import after_review_buttons, back_to_menu_button
 
 
 async def _noop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -84,6 +92,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await handle_playlist_link(update, context)
         return
 
+    if state.get("stage") == "awaiting_find_query":
+        await handle_find_query(update, context)
+        return
+
     if state.get("stage") == "awaiting_profile_nickname":
         if await handle_profile_nickname_text(update, context):
             return
@@ -101,26 +113,50 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Слишком длинно! До 500 символов.")
             return
 
-        conn = sqlite3.connect("reviews.db")
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE reviews SET review_text = ? WHERE user_id = ? AND track_id = ?",
-            (review_text, user_id, state["track_id"]),
-        )
-        conn.commit()
-        conn.close()
-
-        add_exp(user_id, EXP_FOR_REVIEW)
         track_id = state["track_id"]
+        attached = await db_async.attach_review_text(user_id, track_id, review_text)
         del user_states[user_id]
+        if not attached:
+            await update.message.reply_text(
+                "❌ Сначала оцени трек — рецензия добавляется к оценке.",
+                reply_markup=back_to_menu_button(),
+            )
+            return
         await update.message.reply_text("✅ Рецензия добавлена!", reply_markup=after_review_buttons(track_id=track_id))
         return
 
     await handle_search(update, context)
 
 
+async def _on_startup(app: Application):
+    """Фоновые задачи: резервные копии, обслуживание базы, запись сессий, построение индекса каталога."""
+    loop = asyncio.get_running_loop()
+    app.bot_data["backup_task"] = loop.create_task(backup.backup_loop())
+    app.bot_data["maintenance_task"] = loop.create_task(maintenance.maintenance_loop())
+    app.bot_data["sessions_task"] = loop.create_task(sessions.session_flush_loop(user_states))
+    app.bot_data["callback_ids_task"] = loop.create_task(callback_codec.flush_loop())
+    app.bot_data["track_index_task"] = db_async.warm_track_index()
+
+
+async def _on_shutdown(app: Application):
+    """Останавливаем фоновые задачи и дожидаемся записи всех поставленных в очередь операций БД."""
+    for name in ("backup_task", "maintenance_task", "sessions_task", "callback_ids_task", "track_index_task"):
+        task = app.bot_data.get(name)
+        if task:
+            task.cancel()
+    for flush in (user_states.flush, callback_codec.flush):
+        try:
+            await db_async.run_db(flush)
+        except Exception as e:
+            print(f"flush error: {e}")
+    db_async.shutdown()
+
+
 def main():
     init_db()
+    restored = user_states.load()
+    if restored:
+        print(f"Восстановлено сессий: {restored}")
     # Увеличенные таймауты: отправка аудио может быть долгой (медленная сеть, большие файлы)
     request = HTTPXRequest(
         read_timeout=30.0,
@@ -132,6 +168,8 @@ def main():
         ApplicationBuilder()
         .token(config.TELEGRAM_BOT_TOKEN)
         .request(request)
+        .post_init(_on_startup)
+        .post_shutdown(_on_shutdown)
         .build()
     )
 
@@ -141,11 +179,15 @@ def main():
     app.add_handler(CommandHandler("daily", cmd_daily))
     app.add_handler(CommandHandler("stats", cmd_stats))
     app.add_handler(CommandHandler("search", cmd_search))
+    app.add_handler(CommandHandler("find", cmd_find))
+    app.add_handler(CommandHandler("backup", cmd_backup))
+    app.add_handler(CommandHandler("dbstats", cmd_dbstats))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     app.add_handler(MessageHandler(filters.PHOTO, handle_profile_photo))
 
     # Поиск и оценка
     app.add_handler(CallbackQueryHandler(start_search, pattern="^start_search$"))
+    app.add_handler(CallbackQueryHandler(start_find, pattern="^start_find$"))
     app.add_handler(CallbackQueryHandler(handle_rate_track, pattern="^rate_track_"))
     app.add_handler(CallbackQueryHandler(handle_rating_callback, pattern="^rate_"))
     app.add_handler(CallbackQueryHandler(handle_rating_callback, pattern="^cancel_rating$"))
@@ -164,7 +206,8 @@ def main():
     app.add_handler(CallbackQueryHandler(show_playlist_page, pattern="^playlist_page_\\d+$"))
 
     # Топ треков
-    app.add_handler(CallbackQueryHandler(show_top_tracks, pattern="^show_top_tracks$"))
+    app.add_handler(CallbackQueryHandler(show_top_tracks, pattern="^(show_top_tracks|top_genre_.+)$"))
+    app.add_handler(CallbackQueryHandler(show_trending, pattern="^(show_trending|trending_24h|trending_7d)$"))
 
     # Профиль и лидерборд
     app.add_handler(CallbackQueryHandler(show_profile, pattern="^show_profile$"))
@@ -177,17 +220,18 @@ def main():
     app.add_handler(CallbackQueryHandler(profile_do_pin_track, pattern="^pin_track_"))
     app.add_handler(CallbackQueryHandler(profile_unpin_track, pattern="^profile_unpin_track$"))
     app.add_handler(CallbackQueryHandler(show_leaderboard, pattern="^show_leaderboard$"))
+    app.add_handler(CallbackQueryHandler(show_leaderboard, pattern="^leaderboard_page_\\d+$"))
     app.add_handler(CallbackQueryHandler(show_leader_profile, pattern="^leader_\\d+$"))
 
     # Моя статистика и избранное
     app.add_handler(CallbackQueryHandler(view_reviews, pattern="^view_reviews$"))
-    app.add_handler(CallbackQueryHandler(view_reviews, pattern="^view_reviews_page_\\d+$"))
-    app.add_handler(CallbackQueryHandler(view_favorites, pattern="^view_favorites$"))
-    app.add_handler(CallbackQueryHandler(view_downloads, pattern="^view_downloads$"))
+    app.add_handler(CallbackQueryHandler(view_reviews, pattern="^view_reviews_(page_\\d+|[np]_\\d+_\\d{14}_.+)$"))
+    app.add_handler(CallbackQueryHandler(view_favorites, pattern="^view_favorites(_[np]_\\d+_\\d{14}_.+)?$"))
+    app.add_handler(CallbackQueryHandler(view_downloads, pattern="^view_downloads(_[np]_\\d+_\\d{14}_.+)?$"))
     app.add_handler(CallbackQueryHandler(show_detail_review, pattern="^detail_"))
 
     # Общая статистика и оценки других
-    app.add_handler(CallbackQueryHandler(show_general_stats, pattern="^view_global_reviews$"))
+    app.add_handler(CallbackQueryHandler(show_general_stats, pattern="^(view_global_reviews|stats_genre_.+)$"))
     app.add_handler(CallbackQueryHandler(view_global_reviews, pattern="^view_global_reviews_list$"))
     app.add_handler(CallbackQueryHandler(view_recent_reviews, pattern="^view_recent_reviews$"))
     app.add_handler(CallbackQueryHandler(show_review_detail, pattern="^review_detail_"))
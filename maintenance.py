@@ -0,0 +1,181 @@
+# maintenance.py
+"""
+Политики хранения и уплотнение базы на долгоживущем боте.
+
+Политика — строки одной таблицы, которые больше не нужны (RETENTION_POLICIES). Удаление идёт
+пачками по PURGE_BATCH_ROWS строк, каждая пачка — своя короткая транзакция. После удаления
+свободные страницы возвращаются системе через PRAGMA incremental_vacuum (база в режиме
+auto_vacuum = INCREMENTAL: новые создаются так сразу, существующие переводит
+python db_tools.py enable-auto-vacuum).
+
+Вся работа ограничена по времени: run_maintenance делает столько пачек, сколько успевает
+за time_budget секунд, остаток доделывает следующий запуск. В боте maintenance_loop (задача
+main.py) выполняет её короткими отрезками в потоке БД (db_async), между отрезками успевают
+выполниться запросы обработчиков.
+
+Ручной запуск: python db_tools.py maintenance
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import callback_codec
+import database
+import db_async
+import trending
+
+# Записи скачиваний, сообщение которых удалено (message_missing_at), хранятся столько дней
+MISSING_DOWNLOADS_KEEP_DAYS = float(os.environ.get("MUSIC_BOT_MISSING_DOWNLOADS_KEEP_DAYS", "30"))
+# Все записи скачиваний старше стольких дней; 0 — хранить бессрочно
+DOWNLOADS_KEEP_DAYS = float(os.environ.get("MUSIC_BOT_DOWNLOADS_KEEP_DAYS", "0"))
+# Интервал обслуживания в минутах; 0 — не запускать по расписанию
+MAINTENANCE_INTERVAL_MINUTES = float(os.environ.get("MUSIC_BOT_MAINTENANCE_INTERVAL_MINUTES", "60"))
+
+PURGE_BATCH_ROWS = 500  # строк в одной транзакции удаления
+VACUUM_PAGES_PER_STEP = 256  # страниц за один шаг incremental_vacuum
+SLICE_SECONDS = 0.05  # один отрезок работы в потоке БД бота
+SLICE_PAUSE = 0.05  # пауза между отрезками, сек
+RUN_SECONDS = 5.0  # не больше стольких секунд работы за один запуск по расписанию
+
+
+def _cutoff(days):
+    """Граница «старше days дней» в формате CURRENT_TIMESTAMP."""
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _missing_downloads():
+    return ("message_missing_at IS NOT NULL AND message_missing_at < ?", (_cutoff(MISSING_DOWNLOADS_KEEP_DAYS),))
+
+
+def _old_downloads():
+    if DOWNLOADS_KEEP_DAYS <= 0:
+        return None
+    return ("downloaded_at < ?", (_cutoff(DOWNLOADS_KEEP_DAYS),))
+
+
+def _old_trending_buckets():
+    return ("hour <= ?", (trending.current_hour() - trending.KEEP_HOURS,))
+
+
+def _expired_sessions():
+    return ("expires_at < ?", (time.time(),))
+
+
+def _stale_callback_ids():
+    # Давно не показанные токены и всё сверх FALLBACK_MAX_ROWS самых недавних
+    return (
+        "used_at < ? OR rowid <= (SELECT MAX(rowid) FROM callback_ids) - ?",
+        (time.time() - callback_codec.FALLBACK_KEEP_DAYS * 86400, callback_codec.FALLBACK_MAX_ROWS),
+    )
+
+
+# (имя, таблица, функция → (условие WHERE, параметры) или None, если политика выключена)
+RETENTION_POLICIES = [
+    ("missing_downloads", "user_downloads", _missing_downloads),
+    ("old_downloads", "user_downloads", _old_downloads),
+    ("trending_buckets", "track_hourly", _old_trending_buckets),
+    ("expired_sessions", "sessions", _expired_sessions),
+    ("callback_ids", "callback_ids", _stale_callback_ids),
+]
+
+
+def purge_step(table, where, params=(), limit=PURGE_BATCH_ROWS) -> int:
+    """Удаляет до limit строк table по условию where одной транзакцией. Возвращает число удалённых."""
+    conn = database._connect()
+    with conn:
+        cur = conn.execute(
+            f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)',
+            (*params, limit),
+        )
+    return cur.rowcount
+
+
+def vacuum_step(pages=VACUUM_PAGES_PER_STEP) -> int:
+    """Возвращает системе до pages свободных страниц. Возвращает число освобождённых."""
+    conn = database._connect()
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return 0
+    before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if not before:
+        return 0
+    # executescript прогоняет PRAGMA до конца (execute освобождает одну страницу за шаг)
+    conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+    return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def run_maintenance(time_budget=SLICE_SECONDS, batch=PURGE_BATCH_ROWS, pages=VACUUM_PAGES_PER_STEP):
+    """
+    Политики хранения, затем incremental_vacuum — пока не кончится работа или time_budget.
+    Возвращает dict: deleted ({политика: строк}), freed_pages, done (вся работа сделана), seconds.
+    """
+    started = time.perf_counter()
+    deadline = started + time_budget
+    deleted = {}
+    freed = 0
+    done = True
+    for name, table, condition in RETENTION_POLICIES:
+        rule = condition()
+        if rule is None:
+            continue
+        while True:
+            if time.perf_counter() >= deadline:
+                done = False
+                break
+            count = purge_step(table, rule[0], rule[1], batch)
+            if count:
+                deleted[name] = deleted.get(name, 0) + count
+            if count < batch:
+                break
+        if not done:
+            break
+    while done:
+        if time.perf_counter() >= deadline:
+            done = False
+            break
+        step = vacuum_step(pages)
+        freed += step
+        if step < pages:
+            break
+    return {
+        "deleted": deleted,
+        "freed_pages": freed,
+        "done": done,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+async def run_maintenance_sliced(run_seconds=RUN_SECONDS):
+    """
+    Обслуживание в потоке БД бота отрезками по SLICE_SECONDS с паузами между ними.
+    Возвращает суммарный результат (как run_maintenance).
+    """
+    total = {"deleted": {}, "freed_pages": 0, "done": False, "seconds": 0.0}
+    started = time.perf_counter()
+    while time.perf_counter() - started < run_seconds:
+        info = await db_async.run_db(run_maintenance, time_budget=SLICE_SECONDS)
+        for name, count in info["deleted"].items():
+            total["deleted"][name] = total["deleted"].get(name, 0) + count
+        total["freed_pages"] += info["freed_pages"]
+        total["seconds"] = round(total["seconds"] + info["seconds"], 3)
+        if info["done"]:
+            total["done"] = True
+            break
+        await asyncio.sleep(SLICE_PAUSE)
+    return total
+
+
+async def maintenance_loop(interval_minutes=None):
+    """Периодическое обслуживание (задача main.py); ошибки печатаются и не останавливают цикл."""
+    interval_minutes = MAINTENANCE_INTERVAL_MINUTES if interval_minutes is None else interval_minutes
+    if interval_minutes <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval_minutes * 60)
+        try:
+            info = await run_maintenance_sliced()
+            if info["deleted"] or info["freed_pages"]:
+                print(f"maintenance: удалено {info['deleted']}, освобождено страниц {info['freed_pages']}"
+                      f"{'' if info['done'] else ' (продолжение в следующий раз)'}")
+        except Exception as e:
+            print(f"maintenance error: {e}")
@@ -0,0 +1,292 @@
+# sessions.py
+"""
+Хранилище диалоговых сессий пользователей (utils.user_states).
+
+Сессия — словарь состояния обработчика ({"stage": ..., ...}) в компактном объекте Session
+(__slots__). Хранилище ведёт себя как dict по user_id (get, [], del, in, pop), а сверху:
+- срок жизни по этапу (STAGE_TTLS): ввод текста живёт минуты, незавершённая оценка — часы;
+  истёкшая сессия не возвращается и удаляется (при обращении и периодическом sweep);
+- бюджет памяти (memory_budget, оценка по размеру данных): при превышении вытесняются
+  давно не использованные сессии (LRU), кроме начатой оценки и рецензии (PINNED_STAGES);
+- сохранение в SQLite (таблица sessions): изменённые сессии записываются пачкой
+  (flush — из session_flush_loop в потоке БД и при остановке), при старте load() поднимает
+  несохранившиеся этапы, и начатая оценка переживает перезапуск. Большие списки, которые можно
+  получить заново (TRANSIENT_KEYS: треки плейлиста, список для закрепления), не сохраняются.
+
+Хранится сам переданный словарь, а get/[] отдают его же, поэтому правка на месте
+(state["ratings"][...] = ...) видна сразу. Выданные с прошлого flush сессии flush сравнивает
+с сохранённой версией и записывает изменившиеся — вызывать save() после правки не нужно.
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+MINUTE = 60
+HOUR = 3600
+
+# Срок жизни сессии по этапу (секунды); этапы ввода текста с префиксом awaiting_ — AWAITING_TTL
+STAGE_TTLS = {
+    "rating": 6 * HOUR,
+    "writing_review": 6 * HOUR,
+    "profile_pin_list": 1 * HOUR,
+    "menu": 24 * HOUR,
+}
+AWAITING_TTL = 30 * MINUTE
+DEFAULT_TTL = 24 * HOUR
+
+MEMORY_BUDGET = int(os.environ.get("MUSIC_BOT_SESSIONS_MEMORY_MB", "64")) * 1024 * 1024
+PERSIST = os.environ.get("MUSIC_BOT_SESSIONS_PERSIST", "1").strip() not in ("0", "false", "no")
+FLUSH_INTERVAL = 5.0  # секунд между записями изменённых сессий в базу
+SWEEP_INTERVAL = 60.0  # не чаще, чем раз в столько секунд, удаляем истёкшие сессии
+
+# Ключи, которые не сохраняются в базу (большие и восстановимые)
+TRANSIENT_KEYS = ("playlist_tracks", "pin_tracks")
+# Этапы, которые не вытесняются по бюджету памяти (незавершённый ввод пользователя)
+PINNED_STAGES = ("rating", "writing_review")
+
+
+def stage_ttl(stage) -> float:
+    if stage in STAGE_TTLS:
+        return STAGE_TTLS[stage]
+    if stage and str(stage).startswith("awaiting_"):
+        return AWAITING_TTL
+    return DEFAULT_TTL
+
+
+def _estimate_size(obj, depth=0) -> int:
+    """Примерный размер в байтах (sys.getsizeof с вложенными dict/list/tuple/str)."""
+    size = sys.getsizeof(obj)
+    if depth > 4:
+        return size
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _estimate_size(key, depth + 1) + _estimate_size(value, depth + 1)
+    elif isinstance(obj, (list, tuple, set)):
+        for item in obj:
+            size += _estimate_size(item, depth + 1)
+    return size
+
+
+class Session:
+    __slots__ = ("data", "expires_at", "size", "saved")
+
+    def __init__(self, data, expires_at, size, saved=None):
+        self.data = data
+        self.expires_at = expires_at
+        self.size = size
+        self.saved = saved  # JSON последней записанной в базу версии
+
+
+def _persisted_json(data) -> str:
+    return json.dumps({k: v for k, v in data.items() if k not in TRANSIENT_KEYS},
+                      ensure_ascii=False, default=str)
+
+
+class SessionStore:
+    def __init__(self, memory_budget=MEMORY_BUDGET, persist=PERSIST, clock=None):
+        self._lock = threading.RLock()
+        self._sessions = OrderedDict()  # user_id -> Session, от давно использованных к недавним
+        self._memory = 0
+        self._dirty = set()  # user_id изменённых (или удалённых) с последнего flush
+        self._touched = set()  # user_id выданных наружу с последнего flush (могли измениться на месте)
+        self._last_sweep = 0.0
+        self.memory_budget = memory_budget
+        self.persist = persist
+        self._clock = clock or time.time
+        self.evicted = 0
+        self.expired = 0
+
+    # --- dict-подобный интерфейс ---
+
+    def get(self, user_id, default=None):
+        with self._lock:
+            session = self._live(user_id)
+            if session is None:
+                return default
+            self._touched.add(user_id)
+            return session.data
+
+    def __getitem__(self, user_id):
+        session = self.get(user_id)
+        if session is None:
+            raise KeyError(user_id)
+        return session
+
+    def __setitem__(self, user_id, state):
+        with self._lock:
+            self._put(user_id, state)
+            self._dirty.add(user_id)
+            self._enforce_budget()
+            self._maybe_sweep()
+
+    def __delitem__(self, user_id):
+        with self._lock:
+            if not self._drop(user_id):
+                raise KeyError(user_id)
+
+    def __contains__(self, user_id):
+        with self._lock:
+            return self._live(user_id) is not None
+
+    def __len__(self):
+        now = self._clock()
+        with self._lock:
+            return sum(1 for s in self._sessions.values() if s.expires_at > now)
+
+    def pop(self, user_id, default=None):
+        with self._lock:
+            session = self._live(user_id)
+            if session is None:
+                return default
+            self._drop(user_id)
+            return session.data
+
+    def save(self, user_id):
+        """Сразу пересчитать размер и продлить срок жизни после правки на месте (запись в базу — в flush)."""
+        with self._lock:
+            session = self._live(user_id)
+            if session is not None:
+                self._put(user_id, session.data)
+                self._dirty.add(user_id)
+                self._enforce_budget()
+
+    def stats(self):
+        return {"sessions": len(self._sessions), "memory": self._memory, "budget": self.memory_budget,
+                "evicted": self.evicted, "expired": self.expired, "dirty": len(self._dirty)}
+
+    # --- внутреннее (под self._lock) ---
+
+    def _live(self, user_id):
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+        if session.expires_at <= self._clock():
+            self._drop(user_id)
+            self.expired += 1
+            return None
+        self._sessions.move_to_end(user_id)
+        return session
+
+    def _put(self, user_id, data, saved=None):
+        old = self._sessions.pop(user_id, None)
+        if old is not None:
+            self._memory -= old.size
+        session = Session(data, self._clock() + stage_ttl(data.get("stage")), _estimate_size(data), saved)
+        self._sessions[user_id] = session
+        self._memory += session.size
+
+    def _drop(self, user_id):
+        session = self._sessions.pop(user_id, None)
+        if session is None:
+            return False
+        self._memory -= session.size
+        self._dirty.add(user_id)
+        return True
+
+    def _enforce_budget(self):
+        # Последнюю (только что записанную) сессию и PINNED_STAGES не вытесняем
+        if self._memory <= self.memory_budget:
+            return
+        newest = next(reversed(self._sessions), None)
+        for user_id in list(self._sessions):
+            if self._memory <= self.memory_budget:
+                break
+            session = self._sessions[user_id]
+            if user_id == newest or session.data.get("stage") in PINNED_STAGES:
+                continue
+            del self._sessions[user_id]
+            self._memory -= session.size
+            self._dirty.add(user_id)
+            self.evicted += 1
+
+    def _maybe_sweep(self):
+        now = self._clock()
+        if now - self._last_sweep >= SWEEP_INTERVAL:
+            self.sweep(now)
+
+    def sweep(self, now=None):
+        """Удаляет истёкшие сессии. Возвращает их число."""
+        with self._lock:
+            now = self._clock() if now is None else now
+            self._last_sweep = now
+            expired = [uid for uid, s in self._sessions.items() if s.expires_at <= now]
+            for user_id in expired:
+                self._drop(user_id)
+            self.expired += len(expired)
+            return len(expired)
+
+    # --- сохранение в SQLite ---
+
+    def flush(self) -> int:
+        """Записывает изменённые сессии в базу (в потоке БД). Возвращает число записанных/удалённых."""
+        if not self.persist:
+            with self._lock:
+                self._dirty.clear()
+            return 0
+        import database
+        with self._lock:
+            dirty, touched = self._dirty, self._touched - self._dirty
+            self._dirty, self._touched = set(), set()
+            rows, removed, saved = [], [], []
+            for user_id in dirty | touched:
+                session = self._sessions.get(user_id)
+                if session is None:
+                    if user_id in dirty:
+                        removed.append(user_id)
+                    continue
+                data = _persisted_json(session.data)
+                if user_id in touched and data == session.saved:
+                    continue
+                if user_id in touched:
+                    # Изменена на месте: пересчитываем размер и продлеваем срок жизни
+                    self._memory -= session.size
+                    session.size = _estimate_size(session.data)
+                    self._memory += session.size
+                    session.expires_at = self._clock() + stage_ttl(session.data.get("stage"))
+                rows.append((user_id, data, session.expires_at))
+                saved.append((session, data))
+        try:
+            database.save_sessions(rows, removed)
+        except Exception:
+            with self._lock:
+                self._dirty |= dirty | {row[0] for row in rows}
+            raise
+        for session, data in saved:
+            session.saved = data
+        return len(rows) + len(removed)
+
+    def load(self) -> int:
+        """Поднимает несохранившиеся сессии из базы (при старте). Возвращает число загруженных."""
+        if not self.persist:
+            return 0
+        import database
+        loaded = 0
+        now = self._clock()
+        with self._lock:
+            for user_id, data, expires_at in database.load_sessions(now):
+                try:
+                    state = json.loads(data)
+                except ValueError:
+                    continue
+                self._put(user_id, state, saved=data)
+                self._sessions[user_id].expires_at = expires_at
+                loaded += 1
+            self._enforce_budget()
+        return loaded
+
+
+async def session_flush_loop(store, interval=FLUSH_INTERVAL):
+    """Периодически записывает изменённые сессии в базу в потоке БД (задача main.py)."""
+    import db_async
+    if not store.persist:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await db_async.run_db(store.flush)
+        except Exception as e:
+            print(f"sessions flush error: {e}")
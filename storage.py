@@ -0,0 +1,368 @@
+# storage.py
+"""
+Репозиторий данных бота: оценки, пользователи, избранное, прогресс, скачанные, трек дня.
+
+Storage — интерфейс (методы повторяют функции database.py с теми же аргументами и результатами):
+- SQLiteStorage — реализация поверх database.py (текущая база database.DATABASE_PATH);
+- MemoryStorage — всё в памяти с той же семантикой (порядок «новые первыми», курсоры
+  (время, track_id), общий каталог названий, начисление EXP), для тестов обработчиков
+  и бенчмарков без диска (см. bench_storage.py).
+
+Обработчики пока работают с db_async напрямую; Storage используют тесты и bench_storage.py.
+"""
+import bisect
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+import database
+from utils import EXP_FOR_RATING, EXP_FOR_REVIEW
+
+
+class Storage(ABC):
+    """Интерфейс репозитория (абстрактный). Описание методов — у одноимённых функций database.py."""
+
+    # Пользователи
+    @abstractmethod
+    def save_user_nickname(self, user_id, nickname):
+        ...
+
+    @abstractmethod
+    def get_user_nickname(self, user_id):
+        ...
+
+    # Оценки
+    @abstractmethod
+    def commit_rating(self, user_id, track_id, ratings, track_title, track_artist, nickname,
+                      genre=None, review_text=None):
+        ...
+
+    @abstractmethod
+    def attach_review_text(self, user_id, track_id, review_text):
+        ...
+
+    @abstractmethod
+    def get_review(self, user_id, track_id):
+        ...
+
+    @abstractmethod
+    def get_last_reviews(self, user_id, limit=10, before=None, after=None):
+        ...
+
+    @abstractmethod
+    def count_reviews(self, user_id):
+        ...
+
+    @abstractmethod
+    def get_track_rating_stats(self, track_id):
+        ...
+
+    # Избранное
+    @abstractmethod
+    def add_favorite(self, user_id, track_id, track_title, track_artist):
+        ...
+
+    @abstractmethod
+    def remove_favorite(self, user_id, track_id):
+        ...
+
+    @abstractmethod
+    def is_in_favorites(self, user_id, track_id):
+        ...
+
+    @abstractmethod
+    def get_favorites(self, user_id, limit=50, before=None, after=None):
+        ...
+
+    @abstractmethod
+    def count_favorites(self, user_id):
+        ...
+
+    # Прогресс
+    @abstractmethod
+    def add_exp(self, user_id, amount):
+        ...
+
+    @abstractmethod
+    def get_user_progress(self, user_id):
+        ...
+
+    # Скачанные
+    @abstractmethod
+    def add_download(self, user_id, track_id, track_title, track_artist, message_id=None, chat_id=None):
+        ...
+
+    @abstractmethod
+    def get_downloads(self, user_id, limit=50, before=None, after=None):
+        ...
+
+    @abstractmethod
+    def count_downloads(self, user_id):
+        ...
+
+    # Трек дня
+    @abstractmethod
+    def get_cached_daily_track(self):
+        ...
+
+    @abstractmethod
+    def set_daily_track(self, track_id):
+        ...
+
+
+class SQLiteStorage(Storage):
+    """Репозиторий поверх database.py: база — database.DATABASE_PATH."""
+
+    def __init__(self):
+        database.init_db()
+
+    def save_user_nickname(self, user_id, nickname):
+        return database.save_user_nickname(user_id, nickname)
+
+    def get_user_nickname(self, user_id):
+        return database.get_user_nickname(user_id)
+
+    def commit_rating(self, user_id, track_id, ratings, track_title, track_artist, nickname,
+                      genre=None, review_text=None):
+        return database.commit_rating(user_id, track_id, ratings, track_title, track_artist, nickname,
+                                      genre=genre, review_text=review_text)
+
+    def attach_review_text(self, user_id, track_id, review_text):
+        return database.attach_review_text(user_id, track_id, review_text)
+
+    def get_review(self, user_id, track_id):
+        return database.get_review(user_id, track_id)
+
+    def get_last_reviews(self, user_id, limit=10, before=None, after=None):
+        return database.get_last_reviews(user_id, limit=limit, before=before, after=after)
+
+    def count_reviews(self, user_id):
+        return database.count_reviews(user_id)
+
+    def get_track_rating_stats(self, track_id):
+        return database.get_track_rating_stats(track_id)
+
+    def add_favorite(self, user_id, track_id, track_title, track_artist):
+        return database.add_favorite(user_id, track_id, track_title, track_artist)
+
+    def remove_favorite(self, user_id, track_id):
+        return database.remove_favorite(user_id, track_id)
+
+    def is_in_favorites(self, user_id, track_id):
+        return database.is_in_favorites(user_id, track_id)
+
+    def get_favorites(self, user_id, limit=50, before=None, after=None):
+        return database.get_favorites(user_id, limit=limit, before=before, after=after)
+
+    def count_favorites(self, user_id):
+        return database.count_favorites(user_id)
+
+    def add_exp(self, user_id, amount):
+        return database.add_exp(user_id, amount)
+
+    def get_user_progress(self, user_id):
+        return database.get_user_progress(user_id)
+
+    def add_download(self, user_id, track_id, track_title, track_artist, message_id=None, chat_id=None):
+        return database.add_download(user_id, track_id, track_title, track_artist, message_id, chat_id)
+
+    def get_downloads(self, user_id, limit=50, before=None, after=None):
+        return database.get_downloads(user_id, limit=limit, before=before, after=after)
+
+    def count_downloads(self, user_id):
+        return database.count_downloads(user_id)
+
+    def get_cached_daily_track(self):
+        return database.get_cached_daily_track()
+
+    def set_daily_track(self, track_id):
+        return database.set_daily_track(track_id)
+
+
+class _TimeOrdered:
+    """
+    Строки одного пользователя, упорядоченные по (время, track_id) — аналог индекса
+    (user_id, time, track_id) в SQLite: страница по курсору читается двоичным поиском.
+    """
+
+    def __init__(self):
+        self.keys = []  # [(time, track_id)] по возрастанию
+        self.rows = {}  # track_id -> (time, данные)
+
+    def put(self, track_id, time, data):
+        self.remove(track_id)
+        self.rows[track_id] = (time, data)
+        bisect.insort(self.keys, (time, track_id))
+
+    def remove(self, track_id):
+        old = self.rows.pop(track_id, None)
+        if old is not None:
+            del self.keys[bisect.bisect_left(self.keys, (old[0], track_id))]
+        return old
+
+    def page(self, limit, before=None, after=None):
+        """[(time, track_id, данные)] новые первыми; before/after — как в database._keyset."""
+        if after:
+            start = bisect.bisect_right(self.keys, tuple(after))
+            chunk = self.keys[start:start + limit][::-1]
+        else:
+            end = bisect.bisect_left(self.keys, tuple(before)) if before else len(self.keys)
+            chunk = self.keys[max(0, end - limit):end][::-1]
+        return [(time, track_id, self.rows[track_id][1]) for time, track_id in chunk]
+
+
+class MemoryStorage(Storage):
+    """
+    Репозиторий в памяти. clock — функция без аргументов, возвращающая время строкой
+    'YYYY-MM-DD HH:MM:SS' (по умолчанию текущее UTC, как CURRENT_TIMESTAMP в SQLite).
+    """
+
+    def __init__(self, clock=None):
+        self._clock = clock or (lambda: datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'))
+        self._nicknames = {}
+        self._tracks = {}  # track_id -> [title, artist] — общий каталог, как таблица tracks
+        self._reviews = {}  # user_id -> _TimeOrdered, данные — dict оценки
+        self._track_reviews = {}  # track_id -> {user_id: total} — как track_stats
+        self._favorites = {}  # user_id -> _TimeOrdered
+        self._downloads = {}  # user_id -> _TimeOrdered, данные — (message_id, chat_id)
+        self._exp = {}
+        self._daily = None  # (track_id, updated_at)
+
+    def _remember_track(self, track_id, title, artist):
+        entry = self._tracks.setdefault(track_id, [None, None])
+        entry[0] = title or entry[0]
+        entry[1] = artist or entry[1]
+
+    def _title_artist(self, track_id):
+        return tuple(self._tracks.get(track_id, (None, None)))
+
+    def save_user_nickname(self, user_id, nickname):
+        if not nickname or len(nickname.strip()) == 0:
+            return
+        self._nicknames[user_id] = nickname.strip()[:50]
+
+    def get_user_nickname(self, user_id):
+        return self._nicknames.get(user_id)
+
+    def commit_rating(self, user_id, track_id, ratings, track_title, track_artist, nickname,
+                      genre=None, review_text=None):
+        total = sum(ratings.values())
+        self._remember_track(track_id, track_title, track_artist)
+        row = {
+            'total': total,
+            'ratings': {k: ratings[k] for k in ('rhymes', 'rhythm', 'style', 'charisma', 'vibe')},
+            'review_text': review_text,
+            'nickname': self._nicknames.get(user_id) or nickname or f"Пользователь {user_id}",
+        }
+        self._reviews.setdefault(user_id, _TimeOrdered()).put(track_id, self._clock(), row)
+        self._track_reviews.setdefault(track_id, {})[user_id] = total
+        self.add_exp(user_id, EXP_FOR_RATING)
+
+    def attach_review_text(self, user_id, track_id, review_text):
+        found = self._reviews.get(user_id, _TimeOrdered()).rows.get(track_id)
+        if not found:
+            return False
+        found[1]['review_text'] = review_text
+        self.add_exp(user_id, EXP_FOR_REVIEW)
+        return True
+
+    def _review_dict(self, time, track_id, row):
+        title, artist = self._title_artist(track_id)
+        return {
+            'track_id': track_id,
+            'title': title,
+            'artist': artist,
+            'total': row['total'],
+            'ratings': dict(row['ratings']),
+            'review_text': row['review_text'],
+            'timestamp': time,
+        }
+
+    def get_review(self, user_id, track_id):
+        found = self._reviews.get(user_id, _TimeOrdered()).rows.get(track_id)
+        if not found:
+            return None
+        time, row = found
+        review = self._review_dict(time, track_id, row)
+        review.update(user_id=user_id, nickname=row['nickname'])
+        return review
+
+    def get_last_reviews(self, user_id, limit=10, before=None, after=None):
+        rows = self._reviews.get(user_id)
+        if rows is None:
+            return []
+        return [self._review_dict(*item) for item in rows.page(limit, before, after)]
+
+    def count_reviews(self, user_id):
+        rows = self._reviews.get(user_id)
+        return len(rows.rows) if rows else 0
+
+    def get_track_rating_stats(self, track_id):
+        totals = self._track_reviews.get(track_id)
+        if not totals:
+            return None
+        return {'avg': round(sum(totals.values()) / len(totals), 1), 'count': len(totals)}
+
+    def add_favorite(self, user_id, track_id, track_title, track_artist):
+        self._remember_track(track_id, track_title, track_artist)
+        self._favorites.setdefault(user_id, _TimeOrdered()).put(track_id, self._clock(), None)
+
+    def remove_favorite(self, user_id, track_id):
+        rows = self._favorites.get(user_id)
+        if rows is not None:
+            rows.remove(track_id)
+
+    def is_in_favorites(self, user_id, track_id):
+        rows = self._favorites.get(user_id)
+        return rows is not None and track_id in rows.rows
+
+    def get_favorites(self, user_id, limit=50, before=None, after=None):
+        rows = self._favorites.get(user_id)
+        if rows is None:
+            return []
+        out = []
+        for time, track_id, _ in rows.page(limit, before, after):
+            title, artist = self._title_artist(track_id)
+            out.append({'track_id': track_id, 'title': title, 'artist': artist, 'timestamp': time})
+        return out
+
+    def count_favorites(self, user_id):
+        rows = self._favorites.get(user_id)
+        return len(rows.rows) if rows else 0
+
+    def add_exp(self, user_id, amount):
+        self._exp[user_id] = self._exp.get(user_id, 0) + amount
+
+    def get_user_progress(self, user_id):
+        exp = self._exp.get(user_id, 0)
+        return {'exp': exp, 'level': 1 + exp // 100}
+
+    def add_download(self, user_id, track_id, track_title, track_artist, message_id=None, chat_id=None):
+        self._remember_track(track_id, track_title, track_artist)
+        self._downloads.setdefault(user_id, _TimeOrdered()).put(track_id, self._clock(), (message_id, chat_id))
+
+    def get_downloads(self, user_id, limit=50, before=None, after=None):
+        rows = self._downloads.get(user_id)
+        if rows is None:
+            return []
+        out = []
+        for time, track_id, (message_id, chat_id) in rows.page(limit, before, after):
+            title, artist = self._title_artist(track_id)
+            out.append({'track_id': track_id, 'title': title, 'artist': artist,
+                        'message_id': message_id, 'chat_id': chat_id, 'timestamp': time})
+        return out
+
+    def count_downloads(self, user_id):
+        rows = self._downloads.get(user_id)
+        return len(rows.rows) if rows else 0
+
+    def get_cached_daily_track(self):
+        if not self._daily:
+            return None
+        track_id, updated_at = self._daily
+        age = (datetime.now(timezone.utc) - datetime.fromisoformat(updated_at)).total_seconds()
+        if age < 0 or age > database.DAILY_TRACK_TTL_SECONDS:
+            return None
+        return self._daily
+
+    def set_daily_track(self, track_id):
+        self._daily = (track_id, datetime.now(timezone.utc).isoformat())
@@ -16,8 +16,10 @@ def temp_db():
         database.init_db()
         yield path
     finally:
+        database.close_connections()
         database.DATABASE_PATH = prev_path
-        try:
-            os.unlink(path)
-        except OSError:
-            pass
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.unlink(path + suffix)
+            except OSError:
+                pass
@@ -0,0 +1,24 @@
+"""Тесты резервного копирования (backup)."""
+import asyncio
+import sqlite3
+
+
+def test_backup_snapshot_is_complete_checked_and_rotated(temp_db, tmp_path):
+    import backup
+    import database
+    r = {"rhymes": 1, "rhythm": 1, "style": 1, "charisma": 1, "vibe": 1}
+    for i in range(50):
+        database.save_review(i, f"{i}:1", r, "T", "A", "N")
+
+    info = backup.create_backup(dest_dir=str(tmp_path), keep=2, pages=1, pause=0)
+    snap = sqlite3.connect(info["path"])
+    assert snap.execute("SELECT COUNT(*) FROM reviews").fetchone()[0] == 50
+    assert snap.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    snap.close()
+
+    for stamp in ("20000101-000000", "20000102-000000"):
+        (tmp_path / f"{backup._snapshot_prefix()}{stamp}.db").write_bytes(b"")
+    info = asyncio.run(backup.run_backup(dest_dir=str(tmp_path), keep=2, pause=0))
+    assert len(backup.list_backups(str(tmp_path))) == 2
+    assert len(info["removed"]) == 2
+    assert not list(tmp_path.glob("*.part"))
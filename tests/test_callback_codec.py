@@ -0,0 +1,42 @@
+"""Тесты упаковки track_id в callback_data (callback_codec)."""
+import asyncio
+
+import callback_codec
+from callback_codec import decode_track, encode_track, resolve_track
+
+
+def test_numeric_ids_roundtrip_without_state():
+    for track_id in ("0", "7", "123:456", "118596285:27399487", "99999999999:1"):
+        token = encode_track(track_id)
+        assert "_" not in token and len(token) <= 16
+        assert decode_track(token) == track_id
+    assert callback_codec.flush() == 0  # числовые id ничего не запоминают
+
+
+def test_legacy_and_garbage_tokens():
+    assert decode_track("0123456789") is None  # старый MD5-хэш
+    assert decode_track("abc-def") is None
+    assert decode_track("~0000000000") is None
+
+
+def test_fallback_persisted_and_bounded(temp_db, monkeypatch):
+    monkeypatch.setattr(callback_codec, "FALLBACK_CACHE_SIZE", 2)
+    ids = ["ugc-abc", "0123:45", "x" * 80]
+    tokens = [encode_track(t) for t in ids]
+    assert all(t.startswith("~") and len(t) == 11 for t in tokens)
+    assert decode_track(tokens[0]) is None  # вытеснен из памяти
+    assert callback_codec.flush() == 3
+
+    resolved = asyncio.run(_resolve_all(tokens))
+    assert resolved == ids
+
+    import database
+    import maintenance
+    monkeypatch.setattr(callback_codec, "FALLBACK_MAX_ROWS", 1)
+    where, params = maintenance._stale_callback_ids()
+    assert maintenance.purge_step("callback_ids", where, params) == 2
+    assert database.get_callback_track(tokens[-1]) == ids[-1]
+
+
+async def _resolve_all(tokens):
+    return [await resolve_track(t) for t in tokens]
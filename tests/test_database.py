@@ -66,6 +66,26 @@ def test_get_top_tracks_by_rating(temp_db):
     assert top[0]["count"] == 2
 
 
+def test_top_tracks_by_genre(temp_db):
+    import database
+    hi = {"rhymes": 10, "rhythm": 10, "style": 10, "charisma": 10, "vibe": 10}
+    lo = {"rhymes": 2, "rhythm": 2, "style": 2, "charisma": 2, "vibe": 2}
+    database.save_review(1, "1:1", lo, "Rap low", "A", "U", genre="rusrap")
+    database.save_review(1, "2:1", hi, "Rap high", "A", "U", genre="rusrap")
+    database.save_review(1, "3:1", hi, "Pop", "B", "U", genre="pop")
+    database.save_review(1, "4:1", hi, "Unknown", "C", "U", genre="—")
+    # Жанр, известный только каталогу, подставляется в оценку; узнанный позже — в агрегат
+    database.upsert_tracks([{"id": "5:1", "title": "Rock", "artist": "D", "genre": "rock"}])
+    database.save_review(1, "5:1", lo, "Rock", "D", "U")
+    database.upsert_tracks([{"id": "4:1", "title": "Unknown", "artist": "C", "genre": "jazz"}])
+
+    assert database.get_genres() == ["jazz", "pop", "rock", "rusrap"]
+    assert [t["title"] for t in database.get_top_tracks_by_rating(10, genre="rusrap")] == ["Rap high", "Rap low"]
+    assert [t["track_id"] for t in database.get_top_tracks_by_rating(10, genre="jazz")] == ["4:1"]
+    assert database.get_top_tracks_by_rating(10, genre="metal") == []
+    assert len(database.get_top_tracks_by_rating(10)) == 5
+
+
 def test_get_recent_reviews_with_text(temp_db):
     import database
     r = {"rhymes": 1, "rhythm": 1, "style": 1, "charisma": 1, "vibe": 1}
@@ -73,3 +93,328 @@ def test_get_recent_reviews_with_text(temp_db):
     recent = database.get_recent_reviews_with_text(limit=5)
     assert len(recent) == 1
     assert recent[0]["text"] == "Cool track"
+
+
+def test_connection_is_persistent_and_tuned(temp_db):
+    import database
+    conn = database._connect()
+    assert database._connect() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == database.BUSY_TIMEOUT_MS
+
+
+def test_review_text_and_track_queries(temp_db):
+    import database
+    r = {"rhymes": 2, "rhythm": 2, "style": 2, "charisma": 2, "vibe": 2}
+    database.save_review(1, "t1", r, "T", "A", "U1")
+    database.save_review(2, "t1", r, "T", "A", "U2")
+    assert database.attach_review_text(1, "t1", "Nice") is True
+    assert database.attach_review_text(1, "missing", "Nope") is False
+    review = database.get_review(1, "t1")
+    assert review["review_text"] == "Nice"
+    assert review["ratings"]["vibe"] == 2
+    assert database.get_review(3, "t1") is None
+    assert len(database.get_track_reviews("t1")) == 2
+    texts = database.get_track_reviews_with_text("t1")
+    assert [t["text"] for t in texts] == ["Nice"]
+
+
+def test_migrations_are_versioned_and_idempotent(temp_db):
+    import database
+    assert database.get_schema_version() == database.SCHEMA_VERSION
+    database.init_db()
+    conn = database._connect()
+    assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == 1
+
+
+def test_hot_queries_use_indexes(temp_db):
+    import database
+    conn = database._connect()
+
+    def plan(sql, params=()):
+        return " ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall())
+
+    p = plan("SELECT track_id FROM reviews WHERE user_id = ? ORDER BY timestamp DESC LIMIT 10", (1,))
+    assert "idx_reviews_user_time" in p and "TEMP B-TREE" not in p
+    p = plan("SELECT nickname FROM reviews WHERE review_text IS NOT NULL AND review_text != '' "
+             "ORDER BY timestamp DESC LIMIT 5")
+    assert "idx_reviews_with_text" in p
+    p = plan("SELECT user_id FROM user_progress ORDER BY exp DESC LIMIT 3")
+    assert "idx_progress_exp" in p and "TEMP B-TREE" not in p
+
+
+def _stats_from_reviews(conn):
+    rows = conn.execute(
+        "SELECT track_id, COUNT(*), SUM(total), SUM(vibe) FROM reviews GROUP BY track_id ORDER BY track_id"
+    ).fetchall()
+    return [(r[0], r[1], r[2], r[3]) for r in rows]
+
+
+def _stats_from_table(conn):
+    rows = conn.execute(
+        "SELECT track_id, cnt, sum_total, sum_vibe FROM track_stats ORDER BY track_id"
+    ).fetchall()
+    return [(r[0], r[1], r[2], r[3]) for r in rows]
+
+
+def test_track_stats_follow_insert_replace_update_delete(temp_db):
+    import database
+    conn = database._connect()
+    low = {"rhymes": 1, "rhythm": 1, "style": 1, "charisma": 1, "vibe": 1}
+    high = {"rhymes": 9, "rhythm": 9, "style": 9, "charisma": 9, "vibe": 9}
+    database.save_review(1, "t1", low, "A", "X", "U1")
+    database.save_review(2, "t1", high, "A", "X", "U2")
+    database.save_review(1, "t2", high, "B", "Y", "U1")
+    database.save_review(1, "t1", high, "A", "X", "U1")  # повторная оценка (REPLACE)
+    assert _stats_from_table(conn) == _stats_from_reviews(conn)
+    assert database.get_track_rating_stats("t1") == {"avg": 45.0, "count": 2}
+
+    with conn:
+        conn.execute("UPDATE reviews SET vibe = 5, total = 41 WHERE user_id = 2 AND track_id = 't1'")
+        conn.execute("UPDATE reviews SET review_text = 'txt' WHERE user_id = 1 AND track_id = 't1'")
+    assert _stats_from_table(conn) == _stats_from_reviews(conn)
+
+    with conn:
+        conn.execute("DELETE FROM reviews WHERE track_id = 't2'")
+    assert _stats_from_table(conn) == _stats_from_reviews(conn)
+    assert database.get_track_rating_stats("t2") is None
+
+
+def test_rebuild_track_stats(temp_db):
+    import database
+    r = {"rhymes": 3, "rhythm": 3, "style": 3, "charisma": 3, "vibe": 3}
+    database.save_review(1, "t1", r, "A", "X", "U1")
+    conn = database._connect()
+    with conn:
+        conn.execute("DELETE FROM track_stats")
+    assert database.get_top_tracks_by_rating() == []
+    assert database.rebuild_track_stats() == 1
+    assert database.get_top_tracks_by_rating()[0]["avg_score"] == 15.0
+
+
+def test_write_behind_batches_and_reads_own_writes(temp_db):
+    import database
+    database.set_write_behind(True)
+    try:
+        before = database.write_behind_stats()
+        for _ in range(5):
+            database.add_exp(7, 10)
+        database.add_favorite(7, "t1", "T", "A")
+        database.remove_favorite(7, "t1")
+        database.add_favorite(7, "t2", "T2", "A2")
+        database.add_download(7, "t2", "T2", "A2", message_id=1, chat_id=2)
+
+        conn = database._connect()
+        assert conn.execute("SELECT COUNT(*) FROM user_progress").fetchone()[0] == 0
+        assert database.get_user_progress(7)["exp"] == 50
+        assert database.is_in_favorites(7, "t1") is False
+        assert database.is_in_favorites(7, "t2") is True
+
+        assert [f["track_id"] for f in database.get_favorites(7)] == ["t2"]
+        assert database.get_downloads(7)[0]["message_id"] == 1
+        assert database.get_user_progress(7)["exp"] == 50
+        stats = database.write_behind_stats()
+        assert stats["enqueued"] - before["enqueued"] == 9
+        assert stats["transactions"] - before["transactions"] == 1
+    finally:
+        database.set_write_behind(False)
+
+
+def test_commit_rating_and_attach_review_text(temp_db):
+    import database
+    from utils import EXP_FOR_RATING, EXP_FOR_REVIEW
+    database.save_user_nickname(5, "Stored")
+    r = {"rhymes": 4, "rhythm": 4, "style": 4, "charisma": 4, "vibe": 4}
+    database.commit_rating(5, "t1", r, "T", "A", "Passed")
+    assert database.get_review(5, "t1")["nickname"] == "Stored"
+    assert database.get_user_progress(5)["exp"] == EXP_FOR_RATING
+
+    assert database.attach_review_text(5, "missing", "text") is False
+    assert database.get_user_progress(5)["exp"] == EXP_FOR_RATING
+    assert database.attach_review_text(5, "t1", "text") is True
+    assert database.get_review(5, "t1")["review_text"] == "text"
+    assert database.get_user_progress(5)["exp"] == EXP_FOR_RATING + EXP_FOR_REVIEW
+
+
+def test_track_catalog_is_shared_by_reviews_favorites_downloads(temp_db):
+    import database
+    r = {"rhymes": 3, "rhythm": 3, "style": 3, "charisma": 3, "vibe": 3}
+    database.save_review(1, "10:20", r, "Song", "Band", "N")
+    database.add_favorite(1, "10:20", "Song", "Band")
+    database.add_download(1, "10:20", "Song", "Band", 5, 6)
+    conn = database._connect()
+    assert conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0] == 1
+    assert conn.execute("SELECT track_title FROM reviews").fetchone()[0] is None
+    assert database.get_last_reviews(1)[0]["title"] == "Song"
+    assert database.get_favorites(1)[0]["title"] == "Song"
+    assert database.get_downloads(1)[0]["artist"] == "Band"
+    assert database.get_top_tracks_by_rating(1)[0]["title"] == "Song"
+
+    database.upsert_tracks([{"id": "10:20", "title": "Song (Remastered)", "artist": "Band",
+                             "cover_url": "https://c/200x200", "genre": "rock"}])
+    track = database.get_catalog_track("10:20")
+    assert track["title"] == "Song (Remastered)" and track["genre"] == "rock"
+    assert track["track_url"] == "https://music.yandex.ru/album/20/track/10"
+    assert track["fetched_at"] is not None
+    assert database.get_review(1, "10:20")["title"] == "Song (Remastered)"
+
+
+def test_track_catalog_migration_backfills_legacy_rows(temp_db):
+    import database
+    conn = database._connect()
+    with conn:
+        # Откат к схеме v3: каталог и всё, что от него зависит (поиск по рецензиям)
+        for trigger in ("insert", "delete", "update"):
+            conn.execute(f"DROP TRIGGER trg_reviews_fts_{trigger}")
+        conn.execute("DROP TABLE reviews_fts")
+        conn.execute("DROP TABLE tracks")
+        conn.execute("UPDATE schema_version SET version = 3")
+        conn.execute("INSERT INTO users (user_id, nickname, pinned_track_id, pinned_track_title, "
+                     "pinned_track_artist) VALUES (1, 'N', '7:8', 'Pinned', 'P')")
+        conn.execute("INSERT INTO reviews (user_id, track_id, rhymes, rhythm, style, charisma, vibe, total, "
+                     "track_title, track_artist, nickname) VALUES (1, '1:2', 1, 1, 1, 1, 1, 5, 'Old', 'A', 'N')")
+        conn.execute("INSERT INTO user_favorites (user_id, track_id, track_title, track_artist) "
+                     "VALUES (1, '3:4', 'Fav', 'B')")
+    database.init_db()
+    assert database.get_schema_version() == database.SCHEMA_VERSION
+    assert conn.execute("SELECT COUNT(*) FROM reviews WHERE track_title IS NOT NULL").fetchone()[0] == 0
+    assert database.get_last_reviews(1)[0]["title"] == "Old"
+    assert database.get_favorites(1)[0]["title"] == "Fav"
+    assert database.get_profile(1)["pinned_track_title"] == "Pinned"
+    assert database.get_catalog_track("1:2")["fetched_at"] is None
+
+    # Копия без строки в каталоге не обнуляется и остаётся запасным значением для чтения
+    with conn:
+        conn.execute("INSERT INTO user_favorites (user_id, track_id, track_title, track_artist) "
+                     "VALUES (1, '9:9', 'Orphan', 'C')")
+        conn.execute("UPDATE user_favorites SET track_title = 'Fav', track_artist = 'B' WHERE track_id = '3:4'")
+        database._drop_catalogued_copies(conn.cursor(), "user_favorites", "track_id", "track_title", "track_artist")
+    copies = dict(conn.execute("SELECT track_id, track_title FROM user_favorites").fetchall())
+    assert copies == {"9:9": "Orphan", "3:4": None}
+    assert {f["title"] for f in database.get_favorites(1)} == {"Orphan", "Fav"}
+
+
+def test_user_summary_and_counts(temp_db):
+    import database
+    empty = database.get_user_summary(42)
+    assert empty["nickname"] is None and empty["exp"] == 0 and empty["level"] == 1
+    assert empty["reviews_count"] == empty["favorites_count"] == empty["downloads_count"] == 0
+
+    database.save_user_nickname(42, "Sum")
+    r = {"rhymes": 2, "rhythm": 2, "style": 2, "charisma": 2, "vibe": 2}
+    database.save_review(42, "1:1", r, "A", "B", "Sum")
+    database.save_review(42, "2:2", r, "C", "D", "Sum")
+    database.add_favorite(42, "1:1", "A", "B")
+    database.add_download(42, "2:2", "C", "D", 1, 1)
+    database.set_pinned_track(42, "1:1", "A", "B")
+
+    summary = database.get_user_summary(42)
+    assert summary["nickname"] == "Sum"
+    assert summary["exp"] == database.get_user_progress(42)["exp"]
+    assert (summary["reviews_count"], summary["favorites_count"], summary["downloads_count"]) == (2, 1, 1)
+    assert summary["pinned_track_title"] == "A"
+    assert database.count_reviews(42) == 2
+    assert database.count_favorites(42) == 1
+    assert database.count_downloads(42) == 1
+
+
+def test_keyset_pages_cover_whole_list(temp_db):
+    import database
+    conn = database._connect()
+    with conn:
+        conn.executemany(
+            "INSERT INTO reviews (user_id, track_id, rhymes, rhythm, style, charisma, vibe, total, timestamp) "
+            "VALUES (1, ?, 1, 1, 1, 1, 1, 5, ?)",
+            # по две оценки на секунду: порядок внутри секунды решает track_id
+            [(f"{i}:1", f"2026-01-01 00:00:{i // 2:02d}") for i in range(25)],
+        )
+    first_page = page = database.get_last_reviews(1, limit=10)
+    seen = []
+    while page:
+        seen.extend(r["track_id"] for r in page)
+        last = page[-1]
+        page = database.get_last_reviews(1, limit=10, before=(last["timestamp"], last["track_id"]))
+    assert len(seen) == len(set(seen)) == 25
+
+    edge = first_page[-1]
+    first = database.get_last_reviews(1, limit=10, before=(edge["timestamp"], edge["track_id"]))[0]
+    back = database.get_last_reviews(1, limit=10, after=(first["timestamp"], first["track_id"]))
+    assert [r["track_id"] for r in back] == seen[:10]
+
+    plan = " ".join(r[-1] for r in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT track_id FROM reviews WHERE user_id = ? AND (timestamp, track_id) < (?, ?) "
+        "ORDER BY timestamp DESC, track_id DESC LIMIT 10", (1, "2026", "x")).fetchall())
+    assert "idx_reviews_user_time" in plan and "TEMP B-TREE" not in plan
+
+
+def test_get_review_is_point_lookup_beyond_recent_window(temp_db):
+    import database
+    conn = database._connect()
+    with conn:
+        conn.executemany(
+            "INSERT INTO reviews (user_id, track_id, rhymes, rhythm, style, charisma, vibe, total, timestamp) "
+            "VALUES (3, ?, 1, 1, 1, 1, 1, 5, datetime('2026-01-01', ? || ' seconds'))",
+            [(f"{i}:1", i) for i in range(150)],
+        )
+    assert "0:1" not in [r["track_id"] for r in database.get_last_reviews(3, limit=100)]
+    assert database.get_review(3, "0:1")["total"] == 5
+    plan = " ".join(r[-1] for r in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT total FROM reviews WHERE user_id = ? AND track_id = ?", (3, "0:1")).fetchall())
+    assert "SEARCH" in plan and "INDEX" in plan
+
+
+def test_search_reviews_fts_follows_reviews_and_catalog(temp_db):
+    import database
+    r = {"rhymes": 8, "rhythm": 8, "style": 8, "charisma": 8, "vibe": 8}
+    database.save_user_nickname(1, "Critic")
+    database.save_review(1, "1:1", r, "Осень", "Кино", "Critic")
+    database.attach_review_text(1, "1:1", "Пронзительные гитары и холодный вайб")
+    database.save_review(2, "2:2", r, "Summer", "Band", "Other")
+
+    hits = database.search_reviews("гитар")
+    assert [h["track_id"] for h in hits] == ["1:1"]
+    assert "«" in hits[0]["snippet"] and hits[0]["nickname"] == "Critic"
+    assert [h["track_id"] for h in database.search_reviews("кино")] == ["1:1"]
+    assert database.search_reviews('"NEAR* (') == []
+
+    # Переименование трека в каталоге и переоценка (REPLACE) поддерживают индекс в актуальном состоянии
+    database.upsert_tracks([{"id": "2:2", "title": "Winter", "artist": "Band"}])
+    assert database.search_reviews("summer") == []
+    assert [h["track_id"] for h in database.search_reviews("winter")] == ["2:2"]
+    database.save_review(2, "2:2", r, "Winter", "Band", "Other")
+    assert len(database.search_reviews("winter")) == 1
+
+    conn = database._connect()
+    with conn:
+        conn.execute("DELETE FROM reviews WHERE user_id = 2")
+    assert database.search_reviews("winter") == []
+    assert database.rebuild_review_search() == 1
+
+
+def test_search_catalog_sees_every_upserted_track(temp_db):
+    import database
+    database.upsert_tracks([{"id": "1:1", "title": "Бассок", "artist": "Платина", "cover_url": "c"}])
+    hits = database.search_catalog("platina bassok")
+    assert hits[0]["score"] == 1.0 and hits[0]["track"]["cover_url"] == "c"
+    # Индекс уже загружен — новые треки (оценка, избранное) попадают в него сразу
+    database.add_favorite(1, "2:2", "Группа крови", "Кино")
+    assert database.search_catalog("кино группа")[0]["track"]["id"] == "2:2"
+
+
+def test_timestamp_migration_makes_rows_pageable(temp_db):
+    import database
+    r = {"rhymes": 1, "rhythm": 1, "style": 1, "charisma": 1, "vibe": 1}
+    database.save_review(1, "1:1", r, "T", "A", "N")
+    database.save_review(1, "2:2", r, "T", "A", "N")
+    conn = database._connect()
+    with conn:
+        # Откат к v11 (без триггера трендов на UPDATE, как в базах до него) и старые форматы времени
+        conn.execute("DROP TRIGGER trg_reviews_trending_update")
+        conn.execute("UPDATE reviews SET timestamp = NULL WHERE track_id = '1:1'")
+        conn.execute("UPDATE reviews SET timestamp = '2026-03-04T05:06:07Z' WHERE track_id = '2:2'")
+        conn.execute("UPDATE schema_version SET version = 11")
+    database.init_db()
+    stamps = dict(conn.execute("SELECT track_id, timestamp FROM reviews").fetchall())
+    assert stamps == {"1:1": database.LEGACY_TIMESTAMP, "2:2": "2026-03-04 05:06:07"}
+    assert [x["track_id"] for x in database.get_last_reviews(1, before=("2026-03-04 05:06:07", "2:2"))] == ["1:1"]
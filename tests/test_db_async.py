@@ -0,0 +1,133 @@
+"""Тесты асинхронного слоя БД (db_async)."""
+import asyncio
+import threading
+
+
+def test_async_calls_match_sync(temp_db):
+    import db_async
+
+    async def scenario():
+        await db_async.save_user_nickname(1, "Async")
+        ratings = {"rhymes": 5, "rhythm": 5, "style": 5, "charisma": 5, "vibe": 5}
+        await db_async.save_review(1, "t:1", ratings, "Track", "Artist", "Async")
+        nickname = await db_async.get_user_nickname(1)
+        reviews = await db_async.get_last_reviews(1, limit=5)
+        progress = await db_async.get_user_progress(1)
+        return nickname, reviews, progress
+
+    nickname, reviews, progress = asyncio.run(scenario())
+    assert nickname == "Async"
+    assert len(reviews) == 1 and reviews[0]["total"] == 25
+    assert progress["exp"] == 10
+
+
+def test_calls_run_outside_event_loop_thread(temp_db):
+    import db_async
+
+    def current_thread_name():
+        return threading.current_thread().name
+
+    async def scenario():
+        return await db_async.run_db(current_thread_name)
+
+    name = asyncio.run(scenario())
+    assert name != threading.current_thread().name
+    assert name.startswith("db")
+
+
+def test_reads_use_read_only_pool_and_do_not_block_writes(temp_db):
+    import sqlite3
+    import time
+    import database
+    import db_async
+    if db_async._readers is None:
+        return
+    ratings = {"rhymes": 5, "rhythm": 5, "style": 5, "charisma": 5, "vibe": 5}
+
+    def slow_read():
+        conn = database._connect()
+        conn.execute("BEGIN")
+        conn.execute("SELECT COUNT(*) FROM reviews").fetchone()
+        time.sleep(0.3)
+        conn.execute("COMMIT")
+        return threading.current_thread().name
+
+    def try_write():
+        try:
+            database._connect().execute("DELETE FROM reviews")
+        except sqlite3.OperationalError as e:
+            return str(e)
+
+    async def scenario():
+        read = asyncio.ensure_future(db_async.run_read(slow_read))
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        await db_async.save_review(1, "t:1", ratings, "Track", "Artist", "N")
+        write_seconds = time.perf_counter() - started
+        reviews = await db_async.get_last_reviews(1)
+        return await read, write_seconds, reviews, await db_async.run_read(try_write)
+
+    reader, write_seconds, reviews, error = asyncio.run(scenario())
+    assert reader.startswith("db-read")
+    assert write_seconds < 0.25
+    assert len(reviews) == 1
+    assert "readonly" in error
+
+
+def test_reads_see_pending_write_behind(temp_db):
+    import database
+    import db_async
+    database.set_write_behind(True)
+    try:
+        async def scenario():
+            await db_async.add_favorite(1, "t:1", "Track", "Artist")
+            return await db_async.get_favorites(1), await db_async.count_favorites(1)
+
+        favorites, count = asyncio.run(scenario())
+        assert [f["track_id"] for f in favorites] == ["t:1"] and count == 1
+    finally:
+        database.set_write_behind(False)
+
+
+def test_index_reads_move_to_pool_once_loaded(temp_db):
+    import database
+    import db_async
+    if db_async._readers is None:
+        return
+    threads = []
+    original = database.get_leaderboard
+
+    def traced(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return original(*args, **kwargs)
+
+    async def scenario():
+        await db_async.save_user_nickname(1, "A")
+        await db_async.add_exp(1, 30)
+        wrapped = db_async._wrap(traced, read=True, ready=database.rank_index_ready)
+        first = await wrapped(limit=5)
+        second = await wrapped(limit=5)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert threads[0].startswith("db") and not threads[0].startswith("db-read")  # загрузка индекса — в потоке БД
+    assert threads[1].startswith("db-read")
+    assert first == second and first[0]["user_id"] == 1
+
+
+def test_catalog_index_is_warmed_off_the_writer(temp_db):
+    import database
+    import db_async
+
+    async def scenario():
+        await db_async.upsert_tracks([{"id": "1:1", "title": "Бассок", "artist": "Платина"}])
+        before = await db_async.search_catalog("платина")  # индекса ещё нет — поиск через API
+        task = db_async.warm_track_index()
+        await db_async.upsert_tracks([{"id": "2:2", "title": "Группа крови", "artist": "Кино"}])
+        await task
+        return before, await db_async.search_catalog("платина"), await db_async.search_catalog("кино")
+
+    before, first, second = asyncio.run(scenario())
+    assert before == [] and database.track_index_ready()
+    assert first[0]["track"]["id"] == "1:1"
+    assert second[0]["track"]["id"] == "2:2"
@@ -0,0 +1,66 @@
+"""Тесты метрик запросов (db_metrics)."""
+import asyncio
+
+
+def test_calls_are_timed_with_rows_and_caller(temp_db, monkeypatch):
+    import db_async
+    import db_metrics
+    db_metrics.reset()
+    monkeypatch.setattr(db_metrics, "SLOW_QUERY_MS", 0)
+
+    async def my_handler():
+        r = {"rhymes": 1, "rhythm": 1, "style": 1, "charisma": 1, "vibe": 1}
+        for i in range(3):
+            await db_async.save_review(1, f"{i}:1", r, "T", "A", "N")
+        return await db_async.get_last_reviews(1, limit=10)
+
+    assert len(asyncio.run(my_handler())) == 3
+    stats = db_metrics.snapshot()
+    assert stats["save_review"]["count"] == 3
+    assert stats["get_last_reviews"]["rows"] == 3
+    assert stats["get_last_reviews"]["p95_ms"] >= stats["get_last_reviews"]["p50_ms"] > 0
+
+    slow = db_metrics.slow_queries(limit=50)
+    reads = [e for e in slow if e["function"] == "get_last_reviews"]
+    assert reads and reads[0]["caller"] == "my_handler"
+    plans = [step for q in reads[0]["queries"] for step in q["plan"]]
+    assert any("idx_reviews_user_time" in step for step in plans)
+    assert not any(q["full_scan"] for q in reads[0]["queries"])
+
+    text = db_metrics.prometheus_text()
+    assert 'music_bot_db_call_seconds_count{function="save_review"} 3' in text
+    assert 'le="+Inf"} 3' in text
+    db_metrics.reset()
+
+
+def test_full_scan_is_flagged(temp_db, monkeypatch):
+    import database
+    import db_metrics
+    db_metrics.reset()
+    monkeypatch.setattr(db_metrics, "SLOW_QUERY_MS", 0)
+
+    def unindexed():
+        return database._connect().execute("SELECT * FROM reviews ORDER BY nickname").fetchall()
+
+    db_metrics.measure("unindexed", "test", unindexed)
+    entry = db_metrics.slow_queries(limit=1)[0]
+    assert entry["function"] == "unindexed" and entry["queries"][0]["full_scan"]
+    db_metrics.reset()
+
+
+def test_statements_outside_db_async_are_timed(temp_db):
+    import database
+    import db_metrics
+    db_metrics.reset()
+    database.set_write_behind(True)
+    try:
+        database.add_favorite(1, "t:1", "Track", "Artist")
+        database.add_exp(1, 5)
+        database.flush_writes()  # сброс отложенной записи идёт мимо db_async
+    finally:
+        database.set_write_behind(False)
+    stats = db_metrics.snapshot()
+    assert stats["sql:_write_favorites"]["count"] >= 1
+    assert stats["sql:_write_exp"]["rows"] == 1  # executemany
+    assert not any(name.startswith("sql:_explain") for name in stats)
+    db_metrics.reset()
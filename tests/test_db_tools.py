@@ -0,0 +1,56 @@
+"""Тесты служебного CLI: выгрузка и загрузка данных."""
+import pytest
+
+
+@pytest.mark.parametrize("fmt", ["jsonl", "csv"])
+def test_export_import_roundtrip(temp_db, tmp_path, fmt):
+    import database
+    import db_tools
+    r = {"rhymes": 1, "rhythm": 2, "style": 3, "charisma": 4, "vibe": 5}
+    database.save_user_nickname(1, "Nick")
+    database.save_review(1, "1:1", r, "Song", "Band", "Nick")
+    database.attach_review_text(1, "1:1", "Текст, с запятой и \"кавычками\"")
+    database.add_favorite(1, "2:2", "Fav", "X")
+    out = tmp_path / "dump"
+    db_tools.main(["export", str(out), "--format", fmt])
+
+    conn = database._connect()
+    with conn:
+        for table in db_tools.DATA_TABLES:
+            conn.execute(f"DELETE FROM {table}")
+    database.close_connections()
+    db_tools.main(["import", str(out), "--format", fmt, "--batch", "1"])
+
+    review = database.get_review(1, "1:1")
+    assert review["title"] == "Song" and review["total"] == 15
+    assert review["review_text"] == "Текст, с запятой и \"кавычками\""
+    assert database.get_favorites(1)[0]["title"] == "Fav"
+    assert database.get_user_progress(1)["exp"] == database.get_user_summary(1)["exp"] > 0
+    assert database.get_track_rating_stats("1:1")["count"] == 1
+    assert database.search_reviews("запятой")[0]["track_id"] == "1:1"
+
+
+def test_import_normalizes_timestamps_for_page_cursors(temp_db, tmp_path):
+    import json
+    import database
+    import db_tools
+    from utils import page_cursor, parse_page_callback
+    out = tmp_path / "dump"
+    out.mkdir()
+    rows = [
+        {"user_id": 1, "track_id": "1:1", "created_at": "2026-01-02T03:04:05.123+03:00"},
+        {"user_id": 1, "track_id": "2:2", "created_at": None},
+        {"user_id": 1, "track_id": "3:3", "created_at": 1767225600},
+        {"user_id": 1, "track_id": "4:4", "created_at": "вчера"},
+    ]
+    (out / "user_favorites.jsonl").write_text("\n".join(json.dumps(r) for r in rows), encoding="utf-8")
+    db_tools.main(["import", str(out), "--tables", "user_favorites"])
+
+    favorites = database.get_favorites(1)
+    stamps = {f["track_id"]: f["timestamp"] for f in favorites}
+    assert stamps["1:1"] == "2026-01-02 00:04:05"
+    assert stamps["3:3"] == "2026-01-01 00:00:00"
+    assert stamps["2:2"] == stamps["4:4"] == database.LEGACY_TIMESTAMP
+    for favorite in favorites:
+        page, before, _ = parse_page_callback(f"view_favorites_n_1_{page_cursor(favorite)}", "view_favorites")
+        assert page == 1 and before == (favorite["timestamp"], favorite["track_id"])
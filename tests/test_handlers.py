@@ -14,3 +14,36 @@ def test_download_key():
     from handlers.track_card_handler import _download_key
     k = _download_key(123, "t:a")
     assert k == (123, "t:a")
+
+
+def test_find_results_link_to_detail_screens():
+    from handlers.find_handler import _results_message
+    hits = [
+        {"user_id": 1, "track_id": "1:1", "nickname": "A", "title": "Song", "artist": "Band",
+         "total": 40, "review_text": "text", "snippet": "«text»"},
+        {"user_id": 2, "track_id": "2:2", "nickname": "B", "title": "Other", "artist": "X",
+         "total": 30, "review_text": None, "snippet": ""},
+    ]
+    text, markup = _results_message("song", hits)
+    assert "«text»" in text
+    data = [row[0].callback_data for row in markup.inline_keyboard]
+    assert data[0].startswith("review_detail_1_")
+    assert data[1].startswith("global_detail_2_")
+    assert data[-1] == "back_to_menu"
+
+
+def test_fav_toggle_reads_stale_catalog_without_api(temp_db, monkeypatch):
+    import asyncio
+    import database
+    from handlers import track_card_handler
+    # Как после миграции v4: в каталоге есть название, но fetched_at пуст
+    database.add_favorite(1, "5:6", "Old", "Artist")
+    database.remove_favorite(1, "5:6")
+
+    async def no_api(track_id):
+        raise AssertionError("запрос к API")
+
+    monkeypatch.setattr(track_card_handler, "get_track_by_id", no_api)
+    track = asyncio.run(track_card_handler._get_track_brief("5:6"))
+    assert track["title"] == "Old" and track["fetched_at"] is None
+    assert track["track_url"] == "https://music.yandex.ru/album/6/track/5"
@@ -44,10 +44,11 @@ def test_back_to_menu_button():
 
 
 def test_track_card_buttons():
-    from utils import hash_id
+    from callback_codec import encode_track
     mk = track_card_buttons("123:456", "https://example.com", False)
     data = _collect_callback_data(mk)
-    h = hash_id("123:456")
+    h = encode_track("123:456")
+    assert h == "1z.7M"
     assert f"rate_track_{h}" in data
     assert f"ask_review_{h}" in data
     assert f"download_track_{h}" in data
@@ -61,3 +62,12 @@ def test_chart_list_buttons():
     data = _collect_callback_data(mk)
     assert len(data) == 2  # one track + back
     assert "back_to_menu" in data
+
+
+def test_genre_picker_rows():
+    from keyboards import genre_picker_rows
+    rows = genre_picker_rows(["pop", "rusrap", "x" * 80], "top_genre", "show_top_tracks", current="rusrap")
+    buttons = [b for row in rows for b in row]
+    assert [b.callback_data for b in buttons] == ["show_top_tracks", "top_genre_pop", "top_genre_rusrap"]
+    assert buttons[2].text == "• Русский рэп"
+    assert all(len(row) <= 3 for row in rows)
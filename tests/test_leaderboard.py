@@ -0,0 +1,47 @@
+"""Тесты индекса мест лидерборда."""
+from leaderboard import RankIndex
+
+
+def test_rank_with_ties_and_updates():
+    idx = RankIndex()
+    idx.load([(1, 100), (2, 50), (3, 50), (4, 10)])
+    assert idx.rank(1) == 1
+    assert idx.rank(2) == 2 and idx.rank(3) == 2
+    assert idx.rank(4) == 4
+    idx.add(4, 200)
+    assert idx.rank(4) == 1 and idx.rank(1) == 2
+    idx.add(5, 5)
+    assert len(idx) == 5 and idx.rank(5) == 5
+    assert idx.rank(99) is None
+
+
+def test_page_and_neighbours():
+    idx = RankIndex()
+    idx.load([(u, u * 10) for u in range(1, 11)])
+    assert [uid for _, uid, _ in idx.page(0, 3)] == [10, 9, 8]
+    assert idx.page(9, 5) == [(10, 1, 10)]
+    above, below = idx.neighbours(5, count=2)
+    assert [uid for _, uid, _ in above] == [7, 6]
+    assert [uid for _, uid, _ in below] == [4, 3]
+    above, below = idx.neighbours(10)
+    assert above == [] and [r for r, _, _ in below] == [2]
+    rank, total, exp, above, below = idx.position(5, count=1)
+    assert (rank, total, exp) == (6, 10, 50)
+    assert [uid for _, uid, _ in above] == [6] and [uid for _, uid, _ in below] == [4]
+    assert idx.position(99) is None
+
+
+def test_database_rank_follows_add_exp(temp_db):
+    import database
+    database.save_user_nickname(1, "One")
+    database.add_exp(1, 30)
+    database.add_exp(2, 50)
+    assert database.get_user_rank(1)["rank"] == 2
+    database.add_exp(1, 40)
+    rank = database.get_user_rank(1)
+    assert rank["rank"] == 1 and rank["total"] == 2 and rank["exp"] == 70
+    assert rank["below"][0]["user_id"] == 2
+    top = database.get_leaderboard(limit=10)
+    assert [u["user_id"] for u in top] == [1, 2]
+    assert top[0]["nickname"] == "One"
+    assert database.get_user_rank(3) is None
@@ -0,0 +1,68 @@
+"""Тесты политик хранения и incremental_vacuum (maintenance)."""
+
+
+def test_missing_download_is_marked_then_purged_in_batches(temp_db, monkeypatch):
+    import database
+    import maintenance
+    for i in range(7):
+        database.add_download(1, f"{i}:1", "T", "A", message_id=100 + i, chat_id=-5)
+    assert database.mark_download_message_missing(1, "0:1")
+    assert not database.mark_download_message_missing(1, "0:1")
+    assert database.get_downloads(1)[-1]["message_id"] is None
+
+    # Отмеченные «сейчас» моложе порога — остаются
+    assert maintenance.run_maintenance(time_budget=10)["deleted"] == {}
+    conn = database._connect()
+    with conn:
+        conn.execute("UPDATE user_downloads SET message_missing_at = '2000-01-01 00:00:00' WHERE track_id = '0:1'")
+    info = maintenance.run_maintenance(time_budget=10, batch=2)
+    assert info["done"]
+    assert info["deleted"] == {"missing_downloads": 1}
+    assert [d["track_id"] for d in database.get_downloads(1)] == ["6:1", "5:1", "4:1", "3:1", "2:1", "1:1"]
+
+    # Повторное скачивание снимает отметку
+    database.mark_download_message_missing(1, "1:1")
+    database.add_download(1, "1:1", "T", "A", message_id=200, chat_id=-5)
+    assert {d["track_id"]: d["message_id"] for d in database.get_downloads(1)}["1:1"] == 200
+
+    monkeypatch.setattr(maintenance, "DOWNLOADS_KEEP_DAYS", 1)
+    with conn:
+        conn.execute("UPDATE user_downloads SET downloaded_at = '2000-01-01 00:00:00' WHERE track_id != '1:1'")
+    info = maintenance.run_maintenance(time_budget=10, batch=2)
+    assert info["deleted"] == {"old_downloads": 5}
+    assert database.count_downloads(1) == 1
+
+
+def test_new_database_is_incremental_and_vacuum_returns_pages(temp_db):
+    import os
+    import database
+    import maintenance
+    conn = database._connect()
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    r = {"rhymes": 1, "rhythm": 1, "style": 1, "charisma": 1, "vibe": 1}
+    for i in range(300):
+        database.save_review(i, f"{i}:1", r, "T", "A", "N", review_text="текст " * 200)
+    with conn:
+        conn.execute("DELETE FROM reviews")
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] > 10
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    size_before = os.path.getsize(temp_db)
+
+    info = maintenance.run_maintenance(time_budget=10, pages=8)
+    assert info["done"] and info["freed_pages"] > 10
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    assert os.path.getsize(temp_db) < size_before
+
+
+def test_time_budget_leaves_work_for_next_run(temp_db):
+    import database
+    import maintenance
+    for i in range(5):
+        database.add_download(1, f"{i}:1", "T", "A", message_id=i, chat_id=-5)
+    conn = database._connect()
+    with conn:
+        conn.execute("UPDATE user_downloads SET message_missing_at = '2000-01-01 00:00:00'")
+    assert not maintenance.run_maintenance(time_budget=0)["done"]
+    assert database.count_downloads(1) == 5
+    assert maintenance.run_maintenance(time_budget=10, batch=1)["deleted"] == {"missing_downloads": 5}
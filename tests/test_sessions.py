@@ -0,0 +1,77 @@
+"""Тесты хранилища сессий (sessions.SessionStore)."""
+from sessions import AWAITING_TTL, STAGE_TTLS, SessionStore
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_dict_interface_and_stage_ttl():
+    clock = FakeClock()
+    store = SessionStore(persist=False, clock=clock)
+    store[1] = {"stage": "awaiting_nickname"}
+    store[2] = {"stage": "rating", "ratings": {}}
+    assert 1 in store and store[1]["stage"] == "awaiting_nickname"
+    assert store.get(3, {}) == {}
+
+    clock.now += AWAITING_TTL + 1
+    assert len(store) == 1  # истёкшая, но ещё не удалённая сессия не считается
+    assert 1 not in store  # ввод текста истёк
+    assert store.get(2)["stage"] == "rating"  # оценка живёт дольше
+    clock.now += STAGE_TTLS["rating"]
+    assert store.pop(2) is None
+    assert len(store) == 0
+
+
+def test_lru_eviction_over_budget():
+    store = SessionStore(memory_budget=4000, persist=False, clock=FakeClock())
+    for uid in range(1, 6):
+        store[uid] = {"stage": "menu", "payload": "x" * 500}
+        store.get(1)  # первая сессия используется постоянно
+    assert store.evicted > 0
+    assert 1 in store and 5 in store
+    assert 2 not in store
+    assert store.stats()["memory"] <= 4000
+
+
+def test_active_rating_is_not_evicted():
+    store = SessionStore(memory_budget=3000, persist=False, clock=FakeClock())
+    store[1] = {"stage": "rating", "ratings": {}, "payload": "x" * 500}
+    store[2] = {"stage": "writing_review", "payload": "x" * 500}
+    for uid in range(3, 8):
+        store[uid] = {"stage": "menu", "payload": "x" * 500}
+    assert store.evicted > 0
+    assert 1 in store and 2 in store and 7 in store
+
+
+def test_persist_roundtrip_skips_transient(temp_db):
+    clock = FakeClock(2_000_000_000.0)
+    store = SessionStore(clock=clock)
+    store[10] = {"stage": "rating", "track_id": "1:2", "ratings": {}, "current_criteria": "rhymes"}
+    store[11] = {"stage": "menu", "playlist_tracks": [{"id": i} for i in range(100)],
+                 "messages_to_delete_on_back": [(5, 6)]}
+    store[12] = {"stage": "menu"}
+    del store[12]
+    assert store.flush() == 3
+    assert store.flush() == 0
+
+    state = store[10]
+    state["ratings"]["rhymes"] = 7  # правка на месте, без save()
+    state["current_criteria"] = "rhythm"
+    store.get(11)  # выдана, но не изменена — не переписывается
+    assert store.flush() == 1
+
+    restored = SessionStore(clock=clock)
+    assert restored.load() == 2
+    assert restored[10]["ratings"] == {"rhymes": 7}
+    assert "playlist_tracks" not in restored[11]
+    for chat_id, message_id in restored[11]["messages_to_delete_on_back"]:
+        assert (chat_id, message_id) == (5, 6)
+    assert 12 not in restored
+
+    clock.now += STAGE_TTLS["rating"] + 1
+    assert SessionStore(clock=clock).load() == 1  # истёкшая оценка не поднимается
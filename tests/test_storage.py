@@ -0,0 +1,73 @@
+"""Тесты репозитория: одни и те же сценарии на SQLite и в памяти."""
+import pytest
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def storage(request):
+    from storage import MemoryStorage, SQLiteStorage
+    if request.param == "memory":
+        return MemoryStorage()
+    request.getfixturevalue("temp_db")
+    return SQLiteStorage()
+
+
+R = {"rhymes": 5, "rhythm": 5, "style": 5, "charisma": 5, "vibe": 5}
+
+
+def test_reviews_and_progress(storage):
+    from utils import EXP_FOR_RATING, EXP_FOR_REVIEW
+    storage.save_user_nickname(1, "  Nick  ")
+    storage.commit_rating(1, "1:1", R, "Song", "Band", "Passed")
+    review = storage.get_review(1, "1:1")
+    assert review["nickname"] == "Nick" and review["total"] == 25 and review["title"] == "Song"
+    assert storage.attach_review_text(1, "missing", "x") is False
+    assert storage.attach_review_text(1, "1:1", "Nice") is True
+    assert storage.get_last_reviews(1)[0]["review_text"] == "Nice"
+    assert storage.get_user_progress(1) == {"exp": EXP_FOR_RATING + EXP_FOR_REVIEW, "level": 1}
+    storage.commit_rating(2, "1:1", {**R, "vibe": 10}, "Song", "Band", None)
+    assert storage.get_review(2, "1:1")["nickname"] == "Пользователь 2"
+    assert storage.get_track_rating_stats("1:1") == {"avg": 27.5, "count": 2}
+    assert storage.count_reviews(1) == 1 and storage.get_track_rating_stats("none") is None
+
+
+def test_favorites_and_downloads(storage):
+    storage.add_favorite(1, "1:1", "A", "B")
+    storage.add_favorite(1, "2:2", "C", "D")
+    assert storage.is_in_favorites(1, "1:1") and storage.count_favorites(1) == 2
+    storage.remove_favorite(1, "1:1")
+    assert not storage.is_in_favorites(1, "1:1")
+    assert [f["track_id"] for f in storage.get_favorites(1)] == ["2:2"]
+    storage.add_download(1, "2:2", "C", "D", 10, 20)
+    assert storage.get_downloads(1)[0]["message_id"] == 10 and storage.count_downloads(1) == 1
+
+
+def test_keyset_pages_match(storage):
+    for i in range(7):
+        storage.add_favorite(1, f"{i}:0", f"T{i}", "A")
+    first = storage.get_favorites(1, limit=3)
+    edge = first[-1]
+    second = storage.get_favorites(1, limit=3, before=(edge["timestamp"], edge["track_id"]))
+    top = second[0]
+    back = storage.get_favorites(1, limit=3, after=(top["timestamp"], top["track_id"]))
+    assert [f["track_id"] for f in back] == [f["track_id"] for f in first]
+    ids = [f["track_id"] for f in first + second]
+    assert len(set(ids)) == 6
+
+
+def test_daily_track(storage):
+    assert storage.get_cached_daily_track() is None
+    storage.set_daily_track("9:9")
+    assert storage.get_cached_daily_track()[0] == "9:9"
+
+
+def test_interface_is_abstract():
+    from storage import Storage
+
+    class Partial(Storage):
+        def get_user_nickname(self, user_id):
+            return None
+
+    with pytest.raises(TypeError):
+        Storage()
+    with pytest.raises(TypeError):
+        Partial()  # реализация без всех методов интерфейса не создаётся
@@ -0,0 +1,82 @@
+"""Тесты кэша метаданных треков (track_cache) и его использования в get_track_by_id."""
+import asyncio
+import time
+
+import track_cache
+from track_cache import TrackCache, is_fresh
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _track(track_id, title="T"):
+    return {"id": track_id, "title": title, "artist": "A", "cover_url": "", "genre": "rap", "track_url": None}
+
+
+def test_lru_and_ttl():
+    clock = FakeClock()
+    cache = TrackCache(max_size=2, ttl=60, clock=clock)
+    cache.put_many([_track("1:1"), _track("2:1"), {"id": "3:1", "title": None}])
+    assert cache.get("1:1")["title"] == "T"  # 1:1 — самый недавний
+    cache.put(_track("4:1"))
+    assert cache.get("2:1") is None and cache.get("1:1") is not None
+    cache.get("1:1")["title"] = "changed"
+    assert cache.get("1:1")["title"] == "T"  # наружу отдаётся копия
+
+    clock.now += 61
+    assert cache.get("1:1") is None and len(cache) == 1
+    assert cache.stats()["hits"] == 4
+
+
+def test_is_fresh():
+    now = time.time()
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - 3600))
+    assert is_fresh(stamp, max_age=7200, now=now)
+    assert not is_fresh(stamp, max_age=600, now=now)
+    assert not is_fresh(None) and not is_fresh("garbage")
+
+
+class _CountingClient:
+    def __init__(self):
+        self.calls = 0
+
+    async def tracks(self, ids):
+        self.calls += 1
+        return []
+
+
+def test_known_tracks_need_no_api_calls(temp_db, monkeypatch):
+    import database
+    import yandex_music_service as svc
+    client = _CountingClient()
+
+    async def get_client():
+        return client
+    monkeypatch.setattr(svc, "_get_client", get_client)
+    monkeypatch.setattr(svc, "ClientAsync", object)
+    monkeypatch.setattr(track_cache, "cache", TrackCache())
+
+    async def scenario():
+        await svc._remember([_track("10:20", "From chart")])  # как после чарта/поиска/плейлиста
+        first = await svc.get_track_by_id("10:20")
+        track_cache.cache.invalidate()
+        second = await svc.get_track_by_id("10:20")  # из каталога на диске
+        missing = await svc.get_track_by_id("30:40")
+        return first, second, missing
+
+    first, second, missing = asyncio.run(scenario())
+    assert first["title"] == second["title"] == "From chart"
+    assert missing is None
+    assert client.calls == 1  # только неизвестный трек
+    assert track_cache.cache.get("10:20") is not None
+
+    with database._connect() as conn:
+        conn.execute("UPDATE tracks SET fetched_at = '2000-01-01 00:00:00' WHERE track_id = '10:20'")
+    track_cache.cache.invalidate()
+    assert asyncio.run(svc.get_track_by_id("10:20")) is None  # устаревшая запись — снова к API
+    assert client.calls == 2
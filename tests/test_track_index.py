@@ -0,0 +1,57 @@
+"""Тесты поискового индекса каталога (track_index)."""
+from track_index import TrackSearchIndex, normalize
+
+
+def _index():
+    index = TrackSearchIndex()
+    index.add("1:1", "Бассок", "Платина")
+    index.add("2:2", "Группа крови", "Кино")
+    index.add("3:3", "Blinding Lights", "The Weeknd")
+    return index
+
+
+def test_normalize_translit_and_dashes():
+    assert normalize("Платина — Бассок") == normalize("platina - bassok")
+    assert normalize("Кино – Группа крови") == normalize("Kino Gruppa krovi")
+    assert normalize("Ёлка") == normalize("Елка")
+
+
+def test_prefix_autocomplete():
+    hits = _index().search("плат бас")
+    assert hits[0][1]["id"] == "1:1"
+    assert _index().search("Платина — Бассок")[0][0] == 1.0
+
+
+def test_fuzzy_trigram_with_typos_and_translit():
+    index = _index()
+    assert index.search("kino gruppa krovy")[0][1]["id"] == "2:2"
+    assert index.search("weekend blindin lights")[0][1]["id"] == "3:3"
+    assert index.search("совсем другое") == []
+
+
+def test_update_replaces_key():
+    index = _index()
+    index.add("3:3", "Save Your Tears", "The Weeknd")
+    assert index.search("blinding") == []
+    assert index.search("save your tears")[0][1]["id"] == "3:3"
+    assert len(index) == 3
+
+
+def test_short_prefixes_and_frequent_trigrams_are_bounded(monkeypatch):
+    import track_index
+    index = TrackSearchIndex()
+    index.add("1:1", "Кукла", "Король и шут")
+    index.add("2:2", "K", "Artist")
+    # Одна буква не раскрывается в префикс — только точный токен
+    assert index._prefix_ids("k") == {"2:2"}
+    assert index.search("кук")[0][1]["id"] == "1:1"
+    monkeypatch.setattr(track_index, "MAX_GRAM_POSTINGS", 0)
+    assert index.search("korol i shut kukla") != []  # префиксы без триграмм
+    assert index.search("korl i shut kukal") == []  # опечатки ищутся только по редким триграммам
+
+
+def test_update_drops_empty_postings():
+    index = _index()
+    index.add("3:3", "Save Your Tears", "The Weeknd")
+    assert "blinding" not in index._tokens and "blinding" not in index._postings
+    assert not any(" bl" == gram for gram in index._trigrams)
@@ -0,0 +1,59 @@
+"""Тесты трендов (trending.TrendingIndex и database.get_trending)."""
+
+
+def test_windows_expire_hour_by_hour(monkeypatch):
+    import trending
+    monkeypatch.setattr(trending, "CACHE_SECONDS", 0)
+    index = trending.TrendingIndex(windows=(2, 4))
+    index.load([(97, "old", 5, 50), (99, "a", 1, 40), (100, "b", 2, 20)], now_hour=100)
+    assert index.top(2, now_hour=100) == [("b", 2, 10.0), ("a", 1, 40.0)]
+    assert [t[0] for t in index.top(4, now_hour=100)] == ["old", "b", "a"]
+
+    index.add("a", 30, hour=101)
+    index.add("a", 20, hour=101)
+    assert index.top(2, now_hour=101) == [("a", 2, 25.0), ("b", 2, 10.0)]
+    assert index.top(4, now_hour=101)[0] == ("a", 3, 30.0)  # «old» (час 97) вышел из окна 4 ч
+    assert index.top(2, now_hour=103) == []
+    index.add("c", 50, hour=200)  # простой дольше окна — всё сбрасывается
+    assert index.top(4, now_hour=200) == [("c", 1, 50.0)]
+
+
+def test_trending_from_ratings_and_bucket_retention(temp_db, monkeypatch):
+    import database
+    import maintenance
+    import trending
+    monkeypatch.setattr(trending, "CACHE_SECONDS", 0)
+    hi = {"rhymes": 10, "rhythm": 10, "style": 10, "charisma": 10, "vibe": 10}
+    lo = {"rhymes": 1, "rhythm": 1, "style": 1, "charisma": 1, "vibe": 1}
+    database.save_review(1, "1:1", hi, "Hot", "A", "U")
+    assert [t["title"] for t in database.get_trending(24)] == ["Hot"]  # загружен из track_hourly
+    database.save_review(2, "2:1", lo, "Hotter", "B", "U")
+    database.save_review(3, "2:1", hi, "Hotter", "B", "U")
+    top = database.get_trending(24)
+    assert [(t["title"], t["count"], t["avg_score"]) for t in top] == [("Hotter", 2, 27.5), ("Hot", 1, 50.0)]
+
+    conn = database._connect()
+    with conn:
+        conn.execute("INSERT INTO track_hourly VALUES (1, 'ancient', 1, 10)")
+    assert maintenance.run_maintenance(time_budget=10)["deleted"] == {"trending_buckets": 1}
+    assert conn.execute("SELECT SUM(cnt) FROM track_hourly").fetchone()[0] == 3
+
+
+def test_rerating_replaces_previous_score(temp_db, monkeypatch):
+    import database
+    import trending
+    monkeypatch.setattr(trending, "CACHE_SECONDS", 0)
+    hi = {"rhymes": 10, "rhythm": 10, "style": 10, "charisma": 10, "vibe": 10}
+    lo = {"rhymes": 1, "rhythm": 1, "style": 1, "charisma": 1, "vibe": 1}
+    database.save_review(1, "1:1", lo, "T", "A", "U")
+    assert database.get_trending(24)[0]["count"] == 1  # индекс загружен
+    database.save_review(1, "1:1", hi, "T", "A", "U")  # повторная оценка
+    database.save_review(1, "1:1", hi, "T", "A", "U")
+    database.save_review(2, "1:1", lo, "T", "A", "U")
+    top = database.get_trending(24)
+    assert [(t["count"], t["avg_score"]) for t in top] == [(2, 27.5)]
+    conn = database._connect()
+    assert conn.execute("SELECT SUM(cnt), SUM(sum_total) FROM track_hourly").fetchone() == (2, 55)
+
+    database.close_connections()  # индекс заново читается из track_hourly
+    assert [(t["count"], t["avg_score"]) for t in database.get_trending(24)] == [(2, 27.5)]
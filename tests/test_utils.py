@@ -25,3 +25,18 @@ def test_criteria():
     assert "rhymes" in CRITERIA_NAMES
     assert MAX_SCORE == 50
     assert EXP_FOR_RATING == 10
+
+
+def test_page_cursor_roundtrip():
+    from utils import page_cursor, parse_page_callback
+    cursor = page_cursor({"timestamp": "2026-01-02 03:04:05", "track_id": "12:34"})
+    assert cursor == "20260102030405_C.Y"
+    long_id = page_cursor({"timestamp": "2026-01-02 03:04:05", "track_id": "u" * 200})
+    assert len(f"view_downloads_n_999_{long_id}".encode()) <= 64
+    assert parse_page_callback(f"view_downloads_n_1_{long_id}", "view_downloads")[1] == (
+        "2026-01-02 03:04:05", "u" * 200)
+    assert parse_page_callback(f"view_reviews_n_3_{cursor}", "view_reviews") == (
+        3, ("2026-01-02 03:04:05", "12:34"), None)
+    assert parse_page_callback(f"view_reviews_p_0_{cursor}", "view_reviews")[2] == ("2026-01-02 03:04:05", "12:34")
+    assert parse_page_callback("view_reviews_page_4", "view_reviews") == (0, None, None)
+    assert parse_page_callback("view_reviews", "view_reviews") == (0, None, None)
@@ -1,4 +1,6 @@
 """Тесты yandex_music_service (без реального API: моки или проверка формата)."""
+import asyncio
+
 import pytest
 
 
@@ -15,19 +17,110 @@ def test_get_track_by_id_returns_none_without_client(monkeypatch):
     """Без токена/клиента get_track_by_id может вернуть None при ошибке."""
     import yandex_music_service as svc
     # Вызов с невалидным id
-    result = svc.get_track_by_id("")
+    result = asyncio.run(svc.get_track_by_id(""))
     assert result is None
-    result = svc.get_track_by_id("invalid")
+    result = asyncio.run(svc.get_track_by_id("invalid"))
     assert result is None or isinstance(result, dict)
 
 
-def test_download_track_bytes_returns_tuple():
+class _SlowClient:
+    """Клиент-заглушка: tracks() отвечает через delay секунд, считая одновременные запросы."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+
+    async def tracks(self, ids):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return []
+
+
+def _use_client(monkeypatch, svc, client):
+    async def get_client():
+        svc._loop_guard()
+        return client
+    monkeypatch.setattr(svc, "_get_client", get_client)
+
+
+def test_download_track_bytes_returns_tuple(monkeypatch):
     """download_track_bytes возвращает (bytes|None, title|None, performer|None)."""
     import yandex_music_service as svc
-    # Без реального клиента получим (None, None, None) или ошибку
-    try:
-        out = svc.download_track_bytes("1:2")
-        assert isinstance(out, tuple)
-        assert len(out) == 3
-    except Exception:
-        pass
+    _use_client(monkeypatch, svc, _SlowClient(0))
+    out = asyncio.run(svc.download_track_bytes("1:2"))
+    assert out == (None, None, None)
+
+
+def test_calls_are_bounded_and_time_out(temp_db, monkeypatch):
+    import track_cache
+    import yandex_music_service as svc
+    if svc.ClientAsync is None:
+        pytest.skip("yandex-music не установлен")
+    monkeypatch.setattr(track_cache, "cache", track_cache.TrackCache())
+    client = _SlowClient(0.05)
+    _use_client(monkeypatch, svc, client)
+    monkeypatch.setattr(svc, "API_CONCURRENCY", 2)
+    monkeypatch.setattr(svc, "_client_loop", None)
+
+    async def many():
+        return await asyncio.gather(*(svc.get_track_by_id(f"{i}:1") for i in range(6)))
+
+    assert asyncio.run(many()) == [None] * 6
+    assert client.peak == 2
+
+    monkeypatch.setattr(svc, "API_TIMEOUT", 0.01)
+    client.delay = 1
+
+    async def slow():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await svc.get_track_by_id("1:1")
+        return result, loop.time() - started
+
+    result, elapsed = asyncio.run(slow())
+    assert result is None and elapsed < 0.5
+
+
+class _SlowTrack:
+    title = "T"
+    artists = []
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def download_bytes_async(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        return b"mp3"
+
+
+def test_downloads_do_not_take_metadata_slots(temp_db, monkeypatch):
+    import track_cache
+    import yandex_music_service as svc
+    monkeypatch.setattr(track_cache, "cache", track_cache.TrackCache())
+    client = _SlowClient(0)
+    _use_client(monkeypatch, svc, client)
+    monkeypatch.setattr(svc, "ClientAsync", object)
+    monkeypatch.setattr(svc, "API_CONCURRENCY", 1)
+    monkeypatch.setattr(svc, "_client_loop", None)
+
+    async def get_track_object(track_id):
+        return _SlowTrack(0.3)
+    monkeypatch.setattr(svc, "get_track_object", get_track_object)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        downloads = [asyncio.create_task(svc.download_track_bytes(f"{i}:1")) for i in range(2)]
+        await asyncio.sleep(0.05)
+        started = loop.time()
+        await svc.get_track_by_id("9:1")  # единственный слот запросов свободен
+        card_seconds = loop.time() - started
+        return card_seconds, await asyncio.gather(*downloads)
+
+    card_seconds, downloads = asyncio.run(scenario())
+    assert card_seconds < 0.2
+    assert downloads == [(b"mp3", "T", "Unknown")] * 2
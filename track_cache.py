@@ -0,0 +1,91 @@
+# track_cache.py
+"""
+Кэш метаданных треков (словари yandex_music_service: id, title, artist, cover_url, genre, track_url).
+
+Два уровня:
+- память: LRU на MAX_SIZE треков, запись живёт TTL секунд. Заполняется каждым ответом API —
+  поиском, чартом, плейлистом, get_track_by_id, — поэтому карточка трека из только что
+  показанного списка открывается без запроса к API;
+- диск (DISK_TIER): каталог tracks в базе, куда те же ответы уже пишутся с fetched_at.
+  Запись каталога моложе DISK_TTL считается свежей и поднимается в память.
+
+get_track_by_id идёт к API только при промахе обоих уровней.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+MAX_SIZE = int(os.environ.get("MUSIC_BOT_TRACK_CACHE_SIZE", "5000"))
+TTL = float(os.environ.get("MUSIC_BOT_TRACK_CACHE_TTL_HOURS", "6")) * 3600
+DISK_TIER = os.environ.get("MUSIC_BOT_TRACK_CACHE_DISK", "1").strip() not in ("0", "false", "no")
+DISK_TTL = float(os.environ.get("MUSIC_BOT_TRACK_CACHE_DISK_DAYS", "7")) * 86400
+
+
+class TrackCache:
+    def __init__(self, max_size=MAX_SIZE, ttl=TTL, clock=None):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # track_id -> (истекает, словарь трека)
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock or time.time
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, track_id):
+        """Копия словаря трека или None (нет в кэше или запись истекла)."""
+        with self._lock:
+            item = self._items.get(track_id)
+            if item is None or item[0] <= self._clock():
+                if item is not None:
+                    del self._items[track_id]
+                self.misses += 1
+                return None
+            self._items.move_to_end(track_id)
+            self.hits += 1
+            return dict(item[1])
+
+    def put(self, track):
+        self.put_many([track])
+
+    def put_many(self, tracks):
+        """Кладёт треки из ответа API; без id или названия — пропускаются."""
+        expires_at = self._clock() + self.ttl
+        with self._lock:
+            for track in tracks:
+                if not track or not track.get("id") or not track.get("title"):
+                    continue
+                track_id = track["id"]
+                self._items[track_id] = (expires_at, dict(track))
+                self._items.move_to_end(track_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, track_id=None):
+        with self._lock:
+            if track_id is None:
+                self._items.clear()
+            else:
+                self._items.pop(track_id, None)
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self):
+        return {"size": len(self._items), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+def is_fresh(fetched_at, max_age=None, now=None) -> bool:
+    """Запись каталога (fetched_at в формате CURRENT_TIMESTAMP, UTC) моложе max_age секунд."""
+    if not fetched_at:
+        return False
+    try:
+        ts = datetime.strptime(str(fetched_at)[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return False
+    now = time.time() if now is None else now
+    return now - ts.timestamp() < (DISK_TTL if max_age is None else max_age)
+
+
+cache = TrackCache()
@@ -0,0 +1,154 @@
+# track_index.py
+"""
+Поисковый индекс по локальному каталогу треков в памяти.
+
+Ключ трека — «исполнитель название», нормализованный: нижний регистр, ё → е, кириллица
+транслитерируется в латиницу (Кино и Kino совпадают), дефисы и тире (- – —) и прочая
+пунктуация становятся пробелами. По ключу строятся:
+- отсортированный словарь токенов — поиск по префиксу (автодополнение «плат» → «Платина»);
+- триграммы — нечёткий поиск с опечатками.
+Индекс заполняется из таблицы tracks и пополняется при каждом upsert каталога (database._upsert_tracks).
+
+Время запроса не растёт с каталогом: слово короче MIN_PREFIX ищется только целиком, префикс
+раскрывается не более чем в MAX_PREFIX_TOKENS токенов, а триграммы, встречающиеся у больше
+чем MAX_GRAM_POSTINGS треков (ничего не различают), при подсчёте пропускаются — сходство
+кандидатов затем считается точно по их ключам. Из неизбирательного запроса оцениваются
+не больше MAX_CANDIDATES треков.
+"""
+import bisect
+import itertools
+import re
+import threading
+from collections import Counter
+
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "sch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya",
+}
+# Неоднозначности латинской записи одних и тех же звуков: сводим к одному написанию
+_LATIN_FOLD = [("kh", "h"), ("x", "ks"), ("w", "v"), ("j", "i"), ("y", "i"), ("q", "k"), ("ck", "k")]
+_NON_WORD = re.compile(r"[\W_]+")
+
+MIN_PREFIX = 3  # слова запроса короче — только точное совпадение токена
+MAX_PREFIX_TOKENS = 256  # сколько токенов каталога раскрывает один префикс
+MAX_GRAM_POSTINGS = 2000  # более частые триграммы не участвуют в подборе кандидатов
+MAX_CANDIDATES = 2000  # сколько совпавших по префиксам треков оценивается
+
+
+def normalize(text: str) -> str:
+    """Нормализованная латинская запись строки для сравнения (см. описание модуля)."""
+    text = (text or "").lower()
+    text = "".join(_TRANSLIT.get(ch, ch) for ch in text)
+    for src, dst in _LATIN_FOLD:
+        text = text.replace(src, dst)
+    return _NON_WORD.sub(" ", text).strip()
+
+
+def trigrams(key: str) -> set:
+    """Триграммы ключа; слова дополнены пробелами, чтобы начало и конец слова весили больше."""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrackSearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # track_id -> данные трека (что передали в add)
+        self._keys = {}  # track_id -> нормализованный ключ
+        self._tokens = []  # отсортированные уникальные токены
+        self._postings = {}  # токен -> {track_id}
+        self._trigrams = {}  # триграмма -> {track_id}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, track_id, title, artist, data=None):
+        """Добавляет или обновляет трек. data — что вернуть из search (по умолчанию title/artist)."""
+        key = normalize(f"{artist or ''} {title or ''}")
+        if not track_id or not key:
+            return
+        with self._lock:
+            old = self._keys.get(track_id)
+            self._entries[track_id] = data if data is not None else {"id": track_id, "title": title, "artist": artist}
+            if old == key:
+                return
+            if old is not None:
+                self._unlink(track_id, old)
+            self._keys[track_id] = key
+            for token in set(key.split()):
+                ids = self._postings.get(token)
+                if ids is None:
+                    ids = self._postings[token] = set()
+                    bisect.insort(self._tokens, token)
+                ids.add(track_id)
+            for gram in trigrams(key):
+                self._trigrams.setdefault(gram, set()).add(track_id)
+
+    def _unlink(self, track_id, key):
+        for token in set(key.split()):
+            ids = self._postings.get(token)
+            if ids is not None:
+                ids.discard(track_id)
+                if not ids:
+                    del self._postings[token]
+                    del self._tokens[bisect.bisect_left(self._tokens, token)]
+        for gram in trigrams(key):
+            ids = self._trigrams.get(gram)
+            if ids is not None:
+                ids.discard(track_id)
+                if not ids:
+                    del self._trigrams[gram]
+
+    def _prefix_ids(self, prefix):
+        if len(prefix) < MIN_PREFIX:
+            return self._postings.get(prefix, set())  # только читается
+        ids = set()
+        i = bisect.bisect_left(self._tokens, prefix)
+        end = min(len(self._tokens), i + MAX_PREFIX_TOKENS)
+        while i < end and self._tokens[i].startswith(prefix):
+            ids |= self._postings[self._tokens[i]]
+            i += 1
+        return ids
+
+    def search(self, query, limit=5):
+        """
+        [(score, data)] — лучшие первыми, score от 0 до 1.
+        Сначала префиксы: каждое слово запроса — префикс какого-то слова ключа; score — доля ключа,
+        покрытая запросом. Иначе (или вдобавок) триграммы: сходство Жаккара по триграммам.
+        """
+        q = normalize(query)
+        if not q:
+            return []
+        q_tokens = q.split()
+        q_len = len(q.replace(" ", ""))
+        scores = {}
+        with self._lock:
+            candidates = None
+            for token in q_tokens:
+                ids = self._prefix_ids(token)
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    break
+            for track_id in itertools.islice(candidates or (), MAX_CANDIDATES):
+                key_len = len(self._keys[track_id].replace(" ", ""))
+                scores[track_id] = min(1.0, q_len / key_len)
+
+            q_grams = trigrams(q)
+            shared = Counter()
+            for gram in q_grams:
+                ids = self._trigrams.get(gram, ())
+                if len(ids) <= MAX_GRAM_POSTINGS:
+                    shared.update(ids)
+            for track_id, _ in shared.most_common(limit * 20):
+                key_grams = trigrams(self._keys[track_id])
+                common = len(q_grams & key_grams)
+                union = len(q_grams) + len(key_grams) - common
+                sim = common / union if union else 0.0
+                if sim > scores.get(track_id, 0.0):
+                    scores[track_id] = sim
+
+            best = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+            return [(round(score, 3), self._entries[track_id]) for track_id, score in best]
@@ -0,0 +1,116 @@
+# trending.py
+"""
+Треки «в тренде» за скользящие окна (24 часа, 7 дней) в памяти.
+
+Оценки складываются в почасовые корзины (час → {track_id: [оценок, сумма баллов]}) и сразу
+в итоги каждого окна. Когда час уходит за границу окна, его корзина вычитается из итогов этого
+окна, а корзины старше самого длинного окна удаляются. Так итоги окна всегда готовы, и экрану
+не нужен просмотр reviews по диапазону времени с GROUP BY.
+
+Порядок — по числу оценок в окне, при равенстве по среднему баллу. Готовый топ кэшируется
+на CACHE_SECONDS: экран отдаётся из кэша, пересчёт — не чаще раза в CACHE_SECONDS.
+На диске те же корзины лежат в таблице track_hourly (триггер на reviews), из неё индекс
+заполняется при старте; старые корзины удаляет maintenance.py.
+"""
+import heapq
+import threading
+import time
+
+WINDOWS = (24, 168)  # часов: сутки и неделя
+KEEP_HOURS = max(WINDOWS) + 1  # столько часов корзин хранится в track_hourly
+CACHE_SECONDS = 30
+
+
+def current_hour() -> int:
+    """Номер часа UTC от начала эпохи (как strftime('%s', ...) / 3600 в SQLite)."""
+    return int(time.time() // 3600)
+
+
+class TrendingIndex:
+    def __init__(self, windows=WINDOWS):
+        self._lock = threading.Lock()
+        self.windows = tuple(windows)
+        self._span = max(self.windows)
+        self._buckets = {}  # час -> {track_id: [cnt, sum]}
+        self._totals = {w: {} for w in self.windows}  # окно -> {track_id: [cnt, sum]}
+        self._hour = None  # последний учтённый час
+        self._version = 0
+        self._cache = {}  # (окно, limit) -> (версия, время, результат)
+
+    def load(self, rows, now_hour=None):
+        """rows — итерируемое (hour, track_id, cnt, sum_total)."""
+        with self._lock:
+            self._advance(current_hour() if now_hour is None else now_hour)
+            for hour, track_id, cnt, total in rows:
+                self._add(track_id, hour, cnt, total or 0)
+
+    def add(self, track_id, total, hour=None, count=1):
+        """Учитывает count оценок трека с суммой баллов total в час hour (по умолчанию текущий)."""
+        with self._lock:
+            hour = current_hour() if hour is None else hour
+            self._advance(hour)
+            self._add(track_id, hour, count, total)
+
+    def remove(self, track_id, total, hour):
+        """Убирает одну оценку трека с баллом total из часа hour (повторная оценка заменяет старую)."""
+        with self._lock:
+            self._advance(current_hour())
+            if track_id in self._buckets.get(hour, {}):
+                self._add(track_id, hour, -1, -total)
+
+    def _add(self, track_id, hour, cnt, total):
+        if hour <= self._hour - self._span or hour > self._hour:
+            return
+        targets = [self._buckets.setdefault(hour, {})]
+        targets += [self._totals[w] for w in self.windows if hour > self._hour - w]
+        for counts in targets:
+            entry = counts.setdefault(track_id, [0, 0])
+            entry[0] += cnt
+            entry[1] += total
+            if entry[0] <= 0:
+                del counts[track_id]
+        if not self._buckets[hour]:
+            del self._buckets[hour]
+        self._version += 1
+
+    def _advance(self, now_hour):
+        """Сдвигает окна до часа now_hour: корзины, вышедшие за окно, вычитаются из его итогов."""
+        if self._hour is None or now_hour - self._hour >= self._span:
+            if self._hour is not None:
+                self._buckets.clear()
+                self._totals = {w: {} for w in self.windows}
+                self._version += 1
+            self._hour = now_hour
+            return
+        while self._hour < now_hour:
+            self._hour += 1
+            for window in self.windows:
+                expired = self._buckets.get(self._hour - window)
+                if not expired:
+                    continue
+                totals = self._totals[window]
+                for track_id, (cnt, total) in expired.items():
+                    entry = totals[track_id]
+                    entry[0] -= cnt
+                    entry[1] -= total
+                    if entry[0] <= 0:
+                        del totals[track_id]
+                self._version += 1
+            self._buckets.pop(self._hour - self._span, None)
+
+    def top(self, window, limit=10, now_hour=None):
+        """[(track_id, оценок, средний балл)] — лучшие за последние window часов."""
+        with self._lock:
+            self._advance(current_hour() if now_hour is None else now_hour)
+            key = (window, limit)
+            cached = self._cache.get(key)
+            now = time.monotonic()
+            if cached and (cached[0] == self._version or now - cached[1] < CACHE_SECONDS):
+                return cached[2]
+            best = heapq.nlargest(
+                limit, self._totals[window].items(),
+                key=lambda kv: (kv[1][0], kv[1][1] / kv[1][0], kv[0]),
+            )
+            result = [(track_id, cnt, round(total / cnt, 1)) for track_id, (cnt, total) in best]
+            self._cache[key] = (self._version, now, result)
+            return result
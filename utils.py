@@ -1,8 +1,10 @@
 # utils.py
 import hashlib
 
-# Хранение состояния пользователей
-user_states = {}
+from sessions import SessionStore
+
+# Хранение состояния пользователей (сроки жизни, бюджет памяти и сохранение в базу — sessions.py)
+user_states = SessionStore()
 
 # Критерии оценки
 CRITERIA = ["rhymes", "rhythm", "style", "charisma", "vibe"]
@@ -24,8 +26,39 @@ EXP_FOR_RATING = 10
 EXP_FOR_REVIEW = 15
 EXP_FOR_FAVORITE = 5
 
-# Глобальное хранилище для сопоставления хэш → track_id
-hash_to_track_id = {}
+# Названия жанров Яндекс.Музыки (код жанра → подпись кнопки); неизвестные — код с заглавной буквы
+GENRE_NAMES = {
+    "rusrap": "Русский рэп",
+    "foreignrap": "Зарубежный рэп",
+    "rap": "Рэп",
+    "hiphop": "Хип-хоп",
+    "pop": "Поп",
+    "ruspop": "Русская поп",
+    "rock": "Рок",
+    "rusrock": "Русский рок",
+    "indie": "Инди",
+    "alternative": "Альтернатива",
+    "electronics": "Электроника",
+    "dance": "Танцевальная",
+    "house": "Хаус",
+    "techno": "Техно",
+    "rnb": "R&B",
+    "soul": "Соул",
+    "jazz": "Джаз",
+    "metal": "Метал",
+    "punk": "Панк",
+    "folk": "Фолк",
+    "classical": "Классика",
+    "soundtrack": "Саундтреки",
+    "estrada": "Эстрада",
+    "shanson": "Шансон",
+    "phonk": "Фонк",
+}
+
+
+def genre_title(genre: str) -> str:
+    """Подпись жанра для экрана: из GENRE_NAMES или код с заглавной буквы."""
+    return GENRE_NAMES.get(genre) or (genre[:1].upper() + genre[1:] if genre else "—")
 
 
 def level_progress_bar(level: int, exp: int, width: int = 10) -> str:
@@ -46,7 +79,39 @@ def level_progress_bar(level: int, exp: int, width: int = 10) -> str:
 def hash_id(track_id: str) -> str:
     """
     Создаёт короткий (10 символов) MD5-хэш из любого track_id.
-    Используется для безопасной передачи в callback_data,
-    чтобы не превысить лимит Telegram в 64 байта.
+    callback_codec использует его как токен для id, которые не упаковываются в callback_data.
+    """
+    return hashlib.md5(track_id.encode('utf-8')).hexdigest()[:10]
+
+
+def page_cursor(item: dict) -> str:
+    """
+    Компактный курсор страницы для callback_data: время строки без разделителей + токен track_id
+    (callback_codec), например «20260101123000_1z.7M». Длина не зависит от длины track_id.
+    Время строки всегда 'YYYY-MM-DD HH:MM:SS': так его пишет CURRENT_TIMESTAMP, а миграция v13
+    и импорт db_tools приводят к этому виду (database.normalize_timestamps).
+    """
+    from callback_codec import encode_track
+    digits = "".join(ch for ch in str(item.get("timestamp") or "") if ch.isdigit())
+    return f"{digits}_{encode_track(item['track_id'])}"
+
+
+def parse_page_callback(data: str, prefix: str):
+    """
+    Разбирает callback постраничного списка: {prefix}_n_{page}_{cursor} (следующая страница,
+    строки старше курсора) или {prefix}_p_{page}_{cursor} (предыдущая, строки новее).
+    Возвращает (page, before, after); before/after — (timestamp, track_id) или None.
+    Всё прочее (в т.ч. старый формат {prefix}_page_N и неизвестный токен трека) — первая страница.
     """
-    return hashlib.md5(track_id.encode('utf-8')).hexdigest()[:10]
\ No newline at end of file
+    from callback_codec import decode_track
+    rest = data[len(prefix) + 1:] if data.startswith(prefix + "_") else ""
+    parts = rest.split("_", 3)
+    if len(parts) != 4 or parts[0] not in ("n", "p") or not parts[1].isdigit():
+        return 0, None, None
+    direction, page, digits, token = parts[0], int(parts[1]), parts[2], parts[3]
+    track_id = decode_track(token)
+    if len(digits) != 14 or not digits.isdigit() or not track_id:
+        return 0, None, None
+    timestamp = f"{digits[0:4]}-{digits[4:6]}-{digits[6:8]} {digits[8:10]}:{digits[10:12]}:{digits[12:14]}"
+    key = (timestamp, track_id)
+    return (page, key, None) if direction == "n" else (page, None, key)
@@ -2,5 +2,5 @@
 from yandex_music_service import search_tracks
 
 
-def search_track(query, limit=1):
-    return search_tracks(query, limit=limit)
+async def search_track(query, limit=1):
+    return await search_tracks(query, limit=limit)
@@ -1,24 +1,69 @@
 # yandex_music_service.py
-# Единый слой работы с API Яндекс.Музыки (библиотека yandex-music)
+# Единый слой работы с API Яндекс.Музыки (библиотека yandex-music, асинхронный ClientAsync).
+# Все запросы к API — корутины: не больше API_CONCURRENCY одновременно, каждый ограничен
+# по времени (API_TIMEOUT), поэтому медленный ответ Яндекса задерживает только того
+# пользователя, который его ждёт. Скачивания идут через отдельный лимит (DOWNLOAD_CONCURRENCY,
+# DOWNLOAD_TIMEOUT) и не занимают слоты поиска, карточек и чарта.
+import asyncio
+import os
 import re
 import random
+import time
 import config
+import db_async
+import track_cache
+
+API_CONCURRENCY = int(os.environ.get("MUSIC_BOT_YANDEX_CONCURRENCY", "8"))
+API_TIMEOUT = float(os.environ.get("MUSIC_BOT_YANDEX_TIMEOUT", "15"))  # секунд на запрос
+DOWNLOAD_CONCURRENCY = int(os.environ.get("MUSIC_BOT_YANDEX_DOWNLOAD_CONCURRENCY", "3"))
+DOWNLOAD_TIMEOUT = float(os.environ.get("MUSIC_BOT_YANDEX_DOWNLOAD_TIMEOUT", "120"))  # секунд на скачивание
 
 _client = None
+_client_loop = None
+_client_lock = None
+_semaphore = None
+_download_semaphore = None
 _chart_cache = None
 _chart_cache_ts = 0
 CHART_CACHE_TTL = 3600  # 1 час
 
 
-def _get_client():
-    """Ленивая инициализация клиента."""
+def _loop_guard():
+    """Клиент, блокировка и семафоры привязаны к event loop; при новом loop (тесты) создаются заново."""
+    global _client, _client_loop, _client_lock, _semaphore, _download_semaphore
+    loop = asyncio.get_running_loop()
+    if _client_loop is not loop:
+        _client, _client_loop = None, loop
+        _client_lock = asyncio.Lock()
+        _semaphore = asyncio.Semaphore(API_CONCURRENCY)
+        _download_semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+
+async def _get_client():
+    """Ленивая инициализация клиента (один раз на event loop)."""
     global _client
-    if _client is None:
-        token = config.YANDEX_MUSIC_TOKEN or None
-        _client = Client(token).init() if token else Client().init()
+    _loop_guard()
+    async with _client_lock:
+        if _client is None:
+            token = config.YANDEX_MUSIC_TOKEN or None
+            _client = await _call(ClientAsync(token).init())
     return _client
 
 
+async def _call(awaitable, timeout=None):
+    """Выполняет запрос к API с ограничением параллельности и времени (asyncio.TimeoutError при превышении)."""
+    _loop_guard()
+    async with _semaphore:
+        return await asyncio.wait_for(awaitable, API_TIMEOUT if timeout is None else timeout)
+
+
+async def _download(awaitable):
+    """Скачивание файла: свой лимит параллельности и времени, общий лимит запросов не занимает."""
+    _loop_guard()
+    async with _download_semaphore:
+        return await asyncio.wait_for(awaitable, DOWNLOAD_TIMEOUT)
+
+
 def _track_id_from_short(track_short):
     """Из TrackShort получаем строковый id вида 'track_id:album_id'."""
     tr = getattr(track_short, "track", track_short)
@@ -100,72 +145,80 @@ def _to_track_dict(track_short, track_id=None):
     }
 
 
+async def _remember(tracks):
+    """Сохраняет полученные из API треки в кэш метаданных и локальный каталог БД (tracks)."""
+    track_cache.cache.put_many(tracks)
+    try:
+        await db_async.upsert_tracks(tracks)
+    except Exception as e:
+        print(f"yandex_music_service catalog upsert error: {e}")
+    return tracks
+
+
 try:
-    from yandex_music import Client
+    from yandex_music import ClientAsync
 except ImportError:
-    Client = None
+    ClientAsync = None
 
 
-def get_chart_tracks(chart_id="world", limit=20):
+async def get_chart_tracks(chart_id="world", limit=20):
     """
     Возвращает список треков из чарта.
     Без токена может не работать в части регионов.
     """
-    if Client is None:
+    if ClientAsync is None:
         return []
     try:
         global _chart_cache, _chart_cache_ts
-        import time
         now = time.time()
         if _chart_cache is not None and (now - _chart_cache_ts) < CHART_CACHE_TTL:
-            tracks = _chart_cache[:limit]
-            return [_to_track_dict(t) for t in tracks]
-        client = _get_client()
-        chart_response = client.chart(chart_id)
+            tracks = [_to_track_dict(t) for t in _chart_cache[:limit]]
+            track_cache.cache.put_many(tracks)
+            return tracks
+        client = await _get_client()
+        chart_response = await _call(client.chart(chart_id))
         pl = getattr(chart_response, "chart", None)
         if not pl or not getattr(pl, "tracks", None):
             return []
         raw = pl.tracks[:limit]
         _chart_cache = pl.tracks
         _chart_cache_ts = now
-        return [_to_track_dict(ts) for ts in raw]
+        return await _remember([_to_track_dict(ts) for ts in raw])
     except Exception as e:
-        print(f"yandex_music_service get_chart_tracks error: {e}")
+        print(f"yandex_music_service get_chart_tracks error: {e!r}")
         return []
 
 
-def get_daily_track():
+async def get_daily_track():
     """
     Трек дня: один и тот же для всех пользователей, обновляется раз в 24 часа.
     Сначала проверяет кэш в БД, при истечении или отсутствии — выбирает новый из чарта.
     """
-    from database import get_cached_daily_track, set_daily_track
-
-    cached = get_cached_daily_track()
+    cached = await db_async.get_cached_daily_track()
     if cached:
         track_id = cached[0]
-        track = get_track_by_id(track_id)
+        track = await get_track_by_id(track_id)
         if track:
             return track
         # Трек удалён или недоступен — выберем новый
-    tracks = get_chart_tracks(chart_id="world", limit=50)
+    tracks = await get_chart_tracks(chart_id="world", limit=50)
     if not tracks:
         return None
     track = random.choice(tracks)
-    set_daily_track(track["id"])
+    await db_async.set_daily_track(track["id"])
     return track
 
 
-def search_tracks(query, limit=5):
+async def search_tracks(query, limit=5):
     """
     Поиск по запросу. Ожидается формат «Автор — Название» или любой текст.
     Возвращает список словарей с ключами id, title, artist, cover_url, genre, track_url.
     """
-    if Client is None:
+    if ClientAsync is None:
         return []
     try:
-        client = _get_client()
-        search_result = client.search(query)
+        client = await _get_client()
+        search_result = await _call(client.search(query))
         if not search_result or not getattr(search_result, "tracks", None):
             return []
         tracks_list = search_result.tracks
@@ -177,49 +230,51 @@ def search_tracks(query, limit=5):
             d = _to_track_dict(track_short)
             if d.get("id"):
                 out.append(d)
-        return out
+        return await _remember(out)
     except Exception as e:
-        print(f"yandex_music_service search_tracks error: {e}")
+        print(f"yandex_music_service search_tracks error: {e!r}")
         return []
 
 
-def get_track_object(track_id):
+async def get_track_object(track_id):
     """
     Возвращает объект Track из библиотеки yandex_music для скачивания и т.д.
     """
-    if Client is None or not track_id:
+    if ClientAsync is None or not track_id:
         return None
     try:
         parts = str(track_id).split(":")
         if len(parts) < 2:
             return None
-        client = _get_client()
-        tracks = client.tracks([track_id])
+        client = await _get_client()
+        tracks = await _call(client.tracks([track_id]))
         if not tracks or len(tracks) == 0:
             return None
         return tracks[0]
     except Exception as e:
-        print(f"yandex_music_service get_track_object error: {e}")
+        print(f"yandex_music_service get_track_object error: {e!r}")
         return None
 
 
-def download_track_bytes(track_id, codec="mp3", bitrate_in_kbps=192):
+async def download_track_bytes(track_id, codec="mp3", bitrate_in_kbps=192):
     """
     Скачивает трек через API (как в документации библиотеки).
     Возвращает (bytes, title, performer) или (None, None, None) при ошибке.
     Для полного скачивания нужен токен Яндекс.Музыки.
     """
-    track = get_track_object(track_id)
+    track = await get_track_object(track_id)
     if not track:
         return None, None, None
     try:
-        data = track.download_bytes(codec=codec, bitrate_in_kbps=bitrate_in_kbps)
+        data = await _download(
+            track.download_bytes_async(codec=codec, bitrate_in_kbps=bitrate_in_kbps, timeout=DOWNLOAD_TIMEOUT)
+        )
         title = getattr(track, "title", "") or "Track"
         artists = getattr(track, "artists", []) or []
         performer = ", ".join(getattr(a, "name", str(a)) for a in artists) or "Unknown"
         return data, title, performer
     except Exception as e:
-        print(f"yandex_music_service download_track_bytes error: {e}")
+        print(f"yandex_music_service download_track_bytes error: {e!r}")
         return None, None, None
 
 
@@ -249,28 +304,26 @@ def _parse_playlist_url(url: str):
     return None
 
 
-def get_playlist_tracks(playlist_url: str, limit: int = 500):
+async def get_playlist_tracks(playlist_url: str, limit: int = 500):
     """
     Возвращает список треков из плейлиста по ссылке.
     Формат треков как у get_chart_tracks: id, title, artist, cover_url, genre, track_url.
     При ошибке возвращает пустой список.
     """
-    if Client is None:
+    if ClientAsync is None:
         return []
     parsed = _parse_playlist_url(playlist_url)
     if not parsed:
         return []
     owner_id, kind = parsed
     try:
-        client = _get_client()
-        playlist = client.users_playlists(kind=kind, user_id=owner_id)
+        client = await _get_client()
+        playlist = await _call(client.users_playlists(kind=kind, user_id=owner_id))
         if not playlist:
             return []
-        if not getattr(playlist, "fetch_tracks", None):
-            tracks_raw = getattr(playlist, "tracks", []) or []
-        else:
-            playlist.fetch_tracks()
-            tracks_raw = getattr(playlist, "tracks", []) or []
+        tracks_raw = getattr(playlist, "tracks", []) or []
+        if not tracks_raw and getattr(playlist, "fetch_tracks_async", None):
+            tracks_raw = await _call(playlist.fetch_tracks_async()) or []
         out = []
         for item in tracks_raw[:limit]:
             track_short = getattr(item, "track", item)
@@ -279,26 +332,41 @@ def get_playlist_tracks(playlist_url: str, limit: int = 500):
             d = _to_track_dict(track_short)
             if d.get("id"):
                 out.append(d)
-        return out
+        return await _remember(out)
     except Exception as e:
-        print(f"yandex_music_service get_playlist_tracks error: {e}")
+        print(f"yandex_music_service get_playlist_tracks error: {e!r}")
         return []
 
 
-def get_track_by_id(track_id):
+async def get_track_by_id(track_id):
     """
     По track_id (строка 'track_id:album_id') возвращает полный словарь для карточки
-    или None при ошибке.
+    или None при ошибке. Сначала — кэш метаданных и свежая запись каталога (track_cache),
+    к API — только при промахе.
     """
-    if Client is None or not track_id:
+    if not track_id:
+        return None
+    track = track_cache.cache.get(track_id)
+    if track:
+        return track
+    if track_cache.DISK_TIER:
+        try:
+            track = await db_async.get_catalog_track(track_id)
+        except Exception as e:
+            print(f"yandex_music_service catalog read error: {e}")
+            track = None
+        if track and track_cache.is_fresh(track.get("fetched_at")):
+            track_cache.cache.put(track)
+            return track
+    if ClientAsync is None:
         return None
     try:
-        client = _get_client()
         parts = str(track_id).split(":")
         if len(parts) < 2:
             return None
         tid, album_id = parts[0], parts[1]
-        tracks = client.tracks([track_id])
+        client = await _get_client()
+        tracks = await _call(client.tracks([track_id]))
         if not tracks or len(tracks) == 0:
             return None
         track = tracks[0]
@@ -308,7 +376,7 @@ def get_track_by_id(track_id):
         cover_url = _cover_url_from_track(track)
         genre = _genre_from_track(track)
         track_url = f"https://music.yandex.ru/album/{album_id}/track/{tid}"
-        return {
+        track_dict = {
             "id": track_id,
             "title": title,
             "artist": artist,
@@ -316,6 +384,8 @@ def get_track_by_id(track_id):
             "genre": genre,
             "track_url": track_url,
         }
+        await _remember([track_dict])
+        return track_dict
     except Exception as e:
-        print(f"yandex_music_service get_track_by_id error: {e}")
+        print(f"yandex_music_service get_track_by_id error: {e!r}")
         return None